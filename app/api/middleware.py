@@ -0,0 +1,43 @@
+import time
+from typing import Any, Awaitable, Callable, MutableMapping
+from app.services.metrics import ERRORS, HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (not BaseHTTPMiddleware) so streaming responses pass straight through
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            ERRORS.inc((type(e).__name__,))
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Route template (e.g. "/api/v1/weather"), never the raw path, to bound label cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - started, (method, route_path))
+            HTTP_REQUESTS.inc((method, route_path, str(status)))
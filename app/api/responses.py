@@ -0,0 +1,54 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Optional
+import anyio
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+from fastapi.utils import is_body_allowed_for_status_code
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> Response:
+    # Same body and headers as FastAPI's default handler, encoded with orjson
+    headers = getattr(exc, "headers", None)
+    if not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
+    return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=headers)
+
+def make_etag(*parts: object) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): a W/ prefix on either side is ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag.removeprefix("W/") for candidate in if_none_match.split(","))
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: Optional[int]) -> bool:
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and last_modified <= since.timestamp()
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+class ClosingStreamingResponse(StreamingResponse):
+    # Closes `closing` once the response is over, including when the stream task is
+    # cancelled before the body generator ever ran (its own finally would never fire)
+    def __init__(self, content: Any, closing: Any, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.closing = closing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.closing.aclose()
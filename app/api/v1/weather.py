@@ -1,32 +1,171 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
+import anyio
+import asyncio
+import contextlib
+import math
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ValidationError
+from starlette.requests import HTTPConnection
+from typing import Annotated, AsyncGenerator, AsyncIterator, List, Literal, Optional
+from app.api.responses import ClosingStreamingResponse, etag_matches, http_date, make_etag, not_modified_since
+from app.models.weather import BatchWeatherRequest, BatchWeatherResponse, WeatherResponse
+from app.services.errors import ServiceUnavailableError
+from app.services.metrics import ERRORS
+from app.services.subscriptions import SlowConsumerError, Subscriber, SubscriptionHub
 from app.services.weather_service import WeatherService
 
-router = APIRouter()
-
 class Message(BaseModel):
     role: str
     content: str
 
 class ChatWeatherRequest(BaseModel):
     messages: List[Message]
+    stream: bool = False
+    response_mode: Optional[Literal["llm", "template"]] = None
+    use_cache: bool = True
+
+class SubscriptionCommand(BaseModel):
+    action: Literal["subscribe", "unsubscribe"]
+    locations: List[str]
+
+async def receive_commands(websocket: WebSocket, hub: SubscriptionHub, subscriber: Subscriber) -> None:
+    # Client messages: {"action": "subscribe" | "unsubscribe", "locations": [...]}
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                command = SubscriptionCommand.model_validate_json(raw)
+                if command.action == "subscribe":
+                    reply = {"type": "subscribed", "locations": hub.subscribe(subscriber, command.locations)}
+                else:
+                    reply = {"type": "unsubscribed", "locations": hub.unsubscribe(subscriber, command.locations)}
+            except ValidationError:
+                reply = {"type": "error", "detail": "Expected {\"action\": \"subscribe\"|\"unsubscribe\", \"locations\": [...]}"}
+            except ValueError as e:
+                reply = {"type": "error", "detail": str(e)}
+            subscriber.notify(orjson.dumps(reply).decode())
+    except WebSocketDisconnect:
+        pass
+
+async def sse_events(tokens: AsyncGenerator[str, None]) -> AsyncIterator[str]:
+    # Starlette cancels this generator when the client disconnects; closing `tokens`
+    # then closes the upstream LLM stream so abandoned responses stop generating.
+    try:
+        async for token in tokens:
+            yield f"data: {orjson.dumps(token).decode()}\n\n"
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {orjson.dumps(str(e)).decode()}\n\n"
+    finally:
+        with anyio.CancelScope(shield=True):
+            await tokens.aclose()
+
+def bad_request(e: Exception) -> HTTPException:
+    ERRORS.inc((type(e).__name__,))
+    return HTTPException(status_code=400, detail=str(e))
+
+def service_unavailable(e: ServiceUnavailableError) -> HTTPException:
+    ERRORS.inc((type(e).__name__,))
+    headers = {"Retry-After": str(max(1, math.ceil(e.retry_after)))} if e.retry_after is not None else None
+    return HTTPException(status_code=503, detail=str(e), headers=headers)
+
+def validator_headers(weather: WeatherResponse, max_age: int) -> dict:
+    # The ETag changes only when the provider reports a new observation, so clients and
+    # proxies revalidating within the cache TTL get 304s
+    headers = {
+        "ETag": make_etag(weather.location, weather.temperature, weather.observed_at),
+        "Cache-Control": f"public, max-age={max_age}",
+    }
+    if weather.observed_at is not None:
+        headers["Last-Modified"] = http_date(weather.observed_at)
+    return headers
+
+def get_weather_service(connection: HTTPConnection) -> WeatherService:
+    return connection.app.state.weather_service
 
-def weather_router(weather_service: WeatherService):
-    @router.get("/weather")
-    async def read_weather(location: str):
+def weather_router(weather_service: Optional[WeatherService] = None):
+    # Declared response models let pydantic serialize the payload directly (no jsonable_encoder
+    # pass) and orjson writes the bytes
+    router = APIRouter(default_response_class=ORJSONResponse)
+    # Services come from app.state (built in the app lifespan) unless one is passed in
+    provide = get_weather_service if weather_service is None else lambda: weather_service
+    Service = Annotated[WeatherService, Depends(provide)]
+
+    @router.get("/weather", response_model=WeatherResponse)
+    async def read_weather(location: str, request: Request, response: Response, service: Service):
+        try:
+            weather = await service.get_current_weather(location)
+        except ServiceUnavailableError as e:
+            raise service_unavailable(e)
+        except ValueError as e:
+            raise bad_request(e)
+
+        headers = validator_headers(weather, service.cache_max_age(location))
+        if_none_match = request.headers.get("if-none-match")
+        if etag_matches(if_none_match, headers["ETag"]) or (
+            if_none_match is None and not_modified_since(request.headers.get("if-modified-since"), weather.observed_at)
+        ):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return weather
+
+    @router.websocket("/weather/ws")
+    async def weather_updates(websocket: WebSocket, service: Service):
+        hub = service.subscriptions
+        # Accept before closing: a close during the handshake becomes an HTTP 403 and the
+        # client would never see 1013 (try again later)
+        await websocket.accept()
+        if hub.full():
+            hub.rejected_connections += 1
+            await websocket.close(code=1013)
+            return
+        subscriber = hub.connect(websocket.send_text)
+        sender = asyncio.create_task(subscriber.run(hub.send_timeout))
+        receiver = asyncio.create_task(receive_commands(websocket, hub, subscriber))
+        try:
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done and isinstance(sender.exception(), SlowConsumerError):
+                hub.slow_disconnects += 1
+                with contextlib.suppress(Exception):
+                    await asyncio.wait_for(websocket.close(code=1008), hub.send_timeout)
+        finally:
+            hub.disconnect(subscriber)
+            for task in (sender, receiver):
+                task.cancel()
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+
+    @router.post("/weather/batch", response_model=BatchWeatherResponse)
+    async def read_weather_batch(request: BatchWeatherRequest, service: Service):
         try:
-            return await weather_service.get_current_weather(location)
+            results = await service.get_current_weather_batch(request.locations)
+            return BatchWeatherResponse(results=results)
+        except ServiceUnavailableError as e:
+            raise service_unavailable(e)
         except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            raise bad_request(e)
+
+    @router.get("/stats")
+    async def read_stats(service: Service):
+        return service.stats()
 
-    @router.post("/chat_weather")
-    async def chat_weather(request: ChatWeatherRequest):
+    @router.post("/chat_weather", response_model=str)
+    async def chat_weather(request: ChatWeatherRequest, service: Service):
         try:
             messages = [message.model_dump() for message in request.messages]
-            response = await weather_service.chat_weather(messages)
+            if request.stream:
+                tokens = await service.chat_weather_stream(messages, response_mode=request.response_mode, use_cache=request.use_cache)
+                return ClosingStreamingResponse(
+                    sse_events(tokens),
+                    closing=tokens,
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                )
+            response = await service.chat_weather(messages, response_mode=request.response_mode, use_cache=request.use_cache)
             return response
+        except ServiceUnavailableError as e:
+            raise service_unavailable(e)
         except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            raise bad_request(e)
 
     return router
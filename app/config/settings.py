@@ -1,15 +1,182 @@
-from pydantic import BaseModel
+import os
+from functools import lru_cache
+from pathlib import Path
+from pydantic import BaseModel, Field, field_validator
 import yaml
-from typing import Any, Dict
+from typing import Any, Dict, List, Literal, Mapping, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+class LLMProviderSettings(BaseModel):
+    # One entry of llm_providers; unset fields fall back to the top-level openai_* / llm_* values
+    name: str
+    type: str = "openai"
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    tool_call_model: Optional[str] = None
+    phrasing_model: Optional[str] = None
+    timeout: Optional[float] = None
+    max_retries: Optional[int] = None
 
 class Settings(BaseModel):
     openai_api_key: str
     weather_api_key: str
     weather_api_url: str
+    # OpenAI-compatible endpoint; None uses api.openai.com
+    openai_base_url: Optional[str] = None
+
+    # Shared HTTP connection pool for upstream weather calls
+    http_pool_limit: int = 100
+    http_pool_limit_per_host: int = 20
+    http_keepalive_timeout: float = 30.0
+    http_dns_cache_ttl: int = 300
+    http_connect_timeout: float = 3.0
+    http_total_timeout: float = 10.0
+
+    # Weather provider: per-attempt timeout, overall deadline, jittered retries, circuit breaker
+    weather_api_timeout: float = 3.0
+    weather_api_deadline: float = 8.0
+    weather_retry_attempts: int = 3
+    weather_retry_base_delay: float = 0.1
+    weather_retry_max_delay: float = 1.0
+    weather_breaker_failure_threshold: int = 5
+    weather_breaker_reset_timeout: float = 30.0
+    # Token bucket on provider calls, per worker (0 = unlimited); calls wait up to
+    # upstream_rate_limit_max_wait seconds for a token before failing with 503
+    weather_rate_limit_per_second: float = 0.0
+    weather_rate_limit_burst: int = 10
+
+    # OpenAI: request timeout, jittered retries (timeouts, connection errors, 5xx; not 429), circuit breaker
+    openai_timeout: float = 20.0
+    openai_max_retries: int = 2
+    openai_retry_base_delay: float = 0.5
+    openai_retry_max_delay: float = 4.0
+    openai_breaker_failure_threshold: int = 5
+    openai_breaker_reset_timeout: float = 30.0
+    # Model per stage: tool-call extraction can use a smaller, faster model than phrasing
+    llm_tool_call_model: str = "gpt-4o"
+    llm_phrasing_model: str = "gpt-4o"
+    # "openai" (single provider from the openai_* keys) or "router" (llm_providers below)
+    llm_provider: str = "openai"
+    llm_providers: List[LLMProviderSettings] = []
+    # Router: requests go to the provider with the best latency/error score; a hedge request to
+    # the runner-up starts once the primary is slower than its p95 (at least llm_hedge_min_delay)
+    llm_hedge_enabled: bool = True
+    llm_hedge_min_delay: float = 0.3
+    llm_routing_explore_rate: float = 0.05
+    openai_rate_limit_per_second: float = 0.0
+    openai_rate_limit_burst: int = 10
+    upstream_rate_limit_max_wait: float = 0.5
+
+    # Admission control for /chat_weather: chat_max_concurrency run at once, up to chat_max_queue
+    # wait; requests expected to wait longer than chat_queue_timeout are shed with 503
+    chat_max_concurrency: int = 100
+    chat_max_queue: int = 200
+    chat_queue_timeout: float = 2.0
+
+    # In-process current-weather cache (seconds); stale entries are served while refreshing
+    weather_cache_max_size: int = 1024
+    weather_cache_ttl: float = 120.0
+    weather_cache_stale_ttl: float = 300.0
+
+    # Batch endpoint: max locations per request and concurrent lookups per batch
+    weather_batch_max_locations: int = 500
+    weather_batch_concurrency: int = 20
+
+    # Background refresh of the most requested locations before their cache entries expire
+    prefetch_enabled: bool = True
+    prefetch_interval: float = 10.0
+    prefetch_top_k: int = 50
+    prefetch_lead_time: float = 30.0
+    prefetch_max_per_minute: float = 120.0
+    prefetch_min_score: float = 2.0
+    prefetch_half_life: float = 600.0
+    prefetch_tracked_max: int = 10000
 
-def load_settings() -> Settings:
-    with open("app/config/settings.yaml", "r") as f:
-        config: Dict[str, Any] = yaml.safe_load(f)
+    # WebSocket live updates: one refresh per subscribed location every refresh_interval seconds;
+    # a client whose socket blocks a send for send_timeout seconds is disconnected
+    ws_refresh_interval: float = 15.0
+    ws_max_connections: int = 10000
+    ws_max_locations: int = 50
+    ws_send_timeout: float = 5.0
+
+    # chat_weather phrasing: "llm" asks the model, "template" renders chat_response_template locally
+    chat_response_mode: Literal["llm", "template"] = "llm"
+    chat_response_template: str = "The current temperature in {location} is {temperature}°C."
+
+    # Cache of LLM tool-call extraction results; "redis" shares entries across workers
+    llm_cache_enabled: bool = True
+    llm_cache_backend: Literal["memory", "redis"] = "memory"
+    llm_cache_ttl: float = 3600.0
+    llm_cache_max_size: int = 4096
+    cache_redis_url: str = "redis://localhost:6379/0"
+    # Weather cache shared by all workers (Redis at cache_redis_url), consulted on a per-process miss
+    weather_shared_cache_enabled: bool = False
+    # Local SQLite tier behind the in-process weather/LLM caches, kept across restarts and shared
+    # by the workers on one host; compacted (expired rows dropped, trimmed to max_entries per
+    # cache) every disk_cache_compact_every writes. A relative path is taken from the project root
+    weather_disk_cache_enabled: bool = False
+    llm_cache_disk_enabled: bool = False
+    disk_cache_path: str = Field("cache/weather_api.sqlite3", validate_default=True)
+    disk_cache_max_entries: int = 100000
+    disk_cache_compact_every: int = 1000
+
+    # Gazetteer-based location extraction tried before the LLM tool call
+    local_extractor_enabled: bool = True
+    local_extractor_min_confidence: float = 0.8
+
+    # Production server (serve.py); server_workers=0 starts one worker per CPU
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 0
+    server_loop: Literal["auto", "asyncio", "uvloop"] = "uvloop"
+    server_http: Literal["auto", "h11", "httptools"] = "httptools"
+    server_backlog: int = 2048
+    # Seconds to let in-flight requests (including streamed chats) finish on shutdown
+    server_graceful_timeout: float = 30.0
+
+    @field_validator("disk_cache_path")
+    @classmethod
+    def _resolve_disk_cache_path(cls, value: str) -> str:
+        # Like DEFAULT_SETTINGS_PATH, independent of the directory the server starts in
+        return str(PROJECT_ROOT / value)
+
+DEFAULT_SETTINGS_PATH = Path(__file__).resolve().parent / "settings.yaml"
+ENV_PREFIX = "WEATHER_API_"
+
+def env_overrides(environ: Mapping[str, str]) -> Dict[str, Any]:
+    # WEATHER_API_<FIELD> overrides one setting, e.g. WEATHER_API_SERVER_WORKERS=4; lists and
+    # mappings (llm_providers) are given as YAML/JSON, scalars are left to pydantic to coerce
+    overrides: Dict[str, Any] = {}
+    for name in Settings.model_fields:
+        raw = environ.get(ENV_PREFIX + name.upper())
+        if raw is None:
+            continue
+        parsed = yaml.safe_load(raw) if raw.lstrip()[:1] in ("[", "{") else None
+        overrides[name] = parsed if isinstance(parsed, (list, dict)) else raw
+    return overrides
+
+def load_settings(path: Optional[str] = None, environ: Optional[Mapping[str, str]] = None) -> Settings:
+    # WEATHER_API_SETTINGS lets every worker process pick up the same alternative config file.
+    # The default file is found relative to this module, and may be absent when every
+    # required value comes from the environment.
+    environ = os.environ if environ is None else environ
+    explicit = path or environ.get("WEATHER_API_SETTINGS")
+    config_path = Path(explicit) if explicit else DEFAULT_SETTINGS_PATH
+    config: Dict[str, Any] = {}
+    if explicit or config_path.exists():
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f) or {}
+    config.update(env_overrides(environ))
     return Settings(**config)
 
-settings: Settings = load_settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    # Loaded on first use rather than at import; get_settings.cache_clear() reloads
+    return load_settings()
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from app.config.settings import settings` working, without loading at import time
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
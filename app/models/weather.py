@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class WeatherRequest(BaseModel):
     location: str
@@ -6,3 +7,16 @@ class WeatherRequest(BaseModel):
 class WeatherResponse(BaseModel):
     location: str
     temperature: float
+    # Provider observation time (unix seconds); drives ETag/Last-Modified, not part of the body
+    observed_at: Optional[int] = Field(default=None, exclude=True)
+
+class BatchWeatherRequest(BaseModel):
+    locations: List[str]
+
+class BatchWeatherResult(BaseModel):
+    location: str
+    weather: Optional[WeatherResponse] = None
+    error: Optional[str] = None
+
+class BatchWeatherResponse(BaseModel):
+    results: List[BatchWeatherResult]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.services.errors import OverloadedError
+from app.services.metrics import QUEUE_WAIT, SHED
+
+class AdmissionController:
+    # Bounded FIFO in front of expensive work. At most max_concurrency requests run; up to
+    # max_queue wait for a slot. A request is shed with 503 right away when the queue is full
+    # or its expected wait (queue position x average service time / concurrency) exceeds
+    # queue_timeout, and after queue_timeout if it is still waiting, so latency stays bounded.
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+        self.active = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self.avg_service_time: Optional[float] = None
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_expected_wait = 0
+        self.shed_timeout = 0
+
+    def expected_wait(self) -> float:
+        if self.active < self.max_concurrency and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) * (self.avg_service_time or 0.0) / self.max_concurrency
+
+    def _shed(self, reason: str, message: str) -> OverloadedError:
+        SHED.inc((self.name, reason))
+        retry_after = max(1.0, self.expected_wait())
+        return OverloadedError(message, retry_after=retry_after)
+
+    async def acquire(self) -> float:
+        # Returns the admission time, to be passed back to release()
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return self.clock()
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            raise self._shed("queue_full", "Server busy, queue full")
+        if self.expected_wait() > self.queue_timeout:
+            self.shed_expected_wait += 1
+            raise self._shed("expected_wait", "Server busy, expected wait too long")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        queued_at = self.clock()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            # Timed out or cancelled while queued; a slot handed over meanwhile is passed on
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            else:
+                self._discard(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed_timeout += 1
+                QUEUE_WAIT.observe(self.clock() - queued_at, (self.name,))
+                raise self._shed("timeout", "Server busy, timed out waiting in queue")
+            raise
+        QUEUE_WAIT.observe(self.clock() - queued_at, (self.name,))
+        self.admitted += 1
+        return self.clock()
+
+    def release(self, admitted_at: float) -> None:
+        service_time = self.clock() - admitted_at
+        if self.avg_service_time is None:
+            self.avg_service_time = service_time
+        else:
+            self.avg_service_time += self.EWMA_ALPHA * (service_time - self.avg_service_time)
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        # The slot goes straight to the oldest live waiter, so `active` is unchanged
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, waiter: "asyncio.Future[None]") -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued_now": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "avg_service_seconds": self.avg_service_time or 0.0,
+            "expected_wait_seconds": self.expected_wait(),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_expected_wait": self.shed_expected_wait,
+            "shed_timeout": self.shed_timeout,
+        }
@@ -0,0 +1,351 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+V = TypeVar("V")
+
+def normalize_location(location: str) -> str:
+    # "  Osaka , JP" and "osaka,jp" share one cache entry
+    parts = [" ".join(part.split()) for part in location.split(",")]
+    return ",".join(parts).lower()
+
+@dataclass
+class CacheEntry(Generic[V]):
+    value: V
+    stored_at: float
+    expires_at: float
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+class TTLCache(Generic[V]):
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, CacheEntry[V]]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry[V]]:
+        # Returns fresh entries and, within the stale window, expired ones so callers can revalidate.
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        now = self.clock()
+        if entry.is_fresh(now):
+            self.hits += 1
+        elif now < entry.expires_at + self.stale_ttl:
+            self.stale_hits += 1
+        else:
+            # Kept (until LRU-evicted) as a last-known value for peek() when the upstream fails
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def peek(self, key: Hashable) -> Optional[CacheEntry[V]]:
+        # Any stored entry regardless of age; no counters, no LRU bump
+        return self._entries.get(key)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh(self.clock()):
+            return None
+        return entry.value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        if self.max_size <= 0:
+            return
+        now = self.clock()
+        self._entries[key] = CacheEntry(value, now, now + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        return entry.value if entry is not None else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+class CacheBackend(ABC):
+    # Async key/value store for JSON-serializable values, shared by the higher-level caches.
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        # Value plus remaining seconds, when the backend knows them
+        value = await self.get(key)
+        return None if value is None else (value, None)
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_size: int, ttl: float):
+        self.cache: TTLCache[Any] = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.cache.set(key, value, ttl)
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        value = self.cache.get(key)
+        if value is None:
+            return None
+        return value, self.cache.peek(key).expires_at - self.cache.clock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self.cache.stats()}
+
+class RedisCacheBackend(CacheBackend):
+    # Shared across uvicorn workers/hosts; `redis` is imported only when this backend is used.
+    def __init__(self, url: str, namespace: str, client: Any = None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise ImportError("The redis cache backend requires the 'redis' package (pip install redis)") from e
+            client = redis.from_url(url)
+        self.client = client
+        self.namespace = namespace
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(f"{self.namespace}:{key}")
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.client.set(f"{self.namespace}:{key}", json.dumps(value), px=max(1, int(ttl * 1000)))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "namespace": self.namespace}
+
+class SqliteCacheBackend(CacheBackend):
+    # Local on-disk tier that survives restarts; worker processes on one host can share the
+    # file (WAL mode). Expiry is wall-clock time so it stays valid across restarts. All
+    # sqlite calls run on one dedicated thread, keeping the event loop free and the
+    # connection single-threaded. Every compact_every writes, expired rows are deleted and
+    # the namespace is trimmed to max_entries, soonest-expiring first.
+    def __init__(self, path: str, namespace: str, max_entries: int = 100000, compact_every: int = 1000,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-cache-{namespace}")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.compactions = 0
+        self.removed = 0
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_expiry ON cache_entries (namespace, expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        remaining = row[1] - self.clock()
+        if remaining <= 0:
+            # Left for the next compaction
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), remaining
+
+    def _set(self, key: str, value: Any, ttl: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), self.clock() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.compact_every == 0:
+            self._compact()
+
+    def _compact(self) -> int:
+        conn = self._connect()
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?", (self.namespace, self.clock())
+        ).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        if count > self.max_entries:
+            removed += conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY expires_at LIMIT ?)",
+                (self.namespace, self.namespace, count - self.max_entries),
+            ).rowcount
+        conn.execute("PRAGMA incremental_vacuum")
+        self.compactions += 1
+        self.removed += removed
+        return removed
+
+    def _size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await self._run(self._get, key)
+        return None if entry is None else entry[0]
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def compact(self) -> int:
+        return await self._run(self._compact)
+
+    async def size(self) -> int:
+        return await self._run(self._size)
+
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "namespace": self.namespace,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "compactions": self.compactions,
+            "removed": self.removed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class TieredCacheBackend(CacheBackend):
+    # Looks tiers up in order (fastest first); a hit in a lower tier is copied into the tiers
+    # above it for its remaining TTL, and writes go to every tier.
+    def __init__(self, tiers: Sequence[CacheBackend], default_ttl: float):
+        if not tiers:
+            raise ValueError("Tiered cache needs at least one tier")
+        self.tiers: List[CacheBackend] = list(tiers)
+        self.default_ttl = default_ttl
+        self.tier_hits = [0] * len(self.tiers)
+        self.misses = 0
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        for index, tier in enumerate(self.tiers):
+            entry = await tier.get_with_ttl(key)
+            if entry is None:
+                continue
+            self.tier_hits[index] += 1
+            value, remaining = entry
+            for upper in self.tiers[:index]:
+                await upper.set(key, value, self.default_ttl if remaining is None else remaining)
+            return value, remaining
+        self.misses += 1
+        return None
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await self.get_with_ttl(key)
+        return None if entry is None else entry[0]
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        for tier in self.tiers:
+            await tier.set(key, value, ttl)
+
+    async def close(self) -> None:
+        for tier in self.tiers:
+            await tier.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "tiered",
+            "tier_hits": self.tier_hits,
+            "misses": self.misses,
+            "tiers": [tier.stats() for tier in self.tiers],
+        }
+
+def create_cache_backend(backend: str, namespace: str, max_size: int, ttl: float, redis_url: str) -> CacheBackend:
+    if backend == "memory":
+        return MemoryCacheBackend(max_size=max_size, ttl=ttl)
+    if backend == "redis":
+        return RedisCacheBackend(redis_url, namespace)
+    raise ValueError(f"Unsupported cache backend: {backend}")
@@ -0,0 +1,22 @@
+from typing import Optional
+
+class ServiceUnavailableError(Exception):
+    # Maps to 503; retry_after (seconds) becomes the Retry-After header
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(ServiceUnavailableError):
+    pass
+
+class UpstreamRateLimitedError(ServiceUnavailableError):
+    # Our own per-upstream token bucket is empty, or the provider answered 429
+    pass
+
+class OverloadedError(ServiceUnavailableError):
+    # Shed by admission control before any work is done
+    pass
+
+class UpstreamTransientError(ValueError):
+    # Timeouts, connection failures and 5xx answers: retryable and counted by circuit breakers
+    pass
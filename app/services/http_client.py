@@ -0,0 +1,40 @@
+import aiohttp
+from typing import Optional
+from app.config.settings import Settings
+
+class HttpClient:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.settings.http_pool_limit,
+            limit_per_host=self.settings.http_pool_limit_per_host,
+            keepalive_timeout=self.settings.http_keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.settings.http_dns_cache_ttl,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=self.settings.http_total_timeout,
+            connect=self.settings.http_connect_timeout,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        # Started by the app lifespan; lazily created when used outside of it (scripts, tests).
+        if not self.started:
+            await self.start()
+        assert self._session is not None
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,28 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncGenerator, Dict, List
+
+from fastapi import HTTPException
+
+class LLMService(ABC):
+    # What WeatherService needs from an LLM backend: tool-call extraction and phrasing
+    name: str = "llm"
+
+    @abstractmethod
+    async def get_weather_info(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], use_cache: bool = True) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def generate_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> str:
+        ...
+
+    @abstractmethod
+    def stream_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        ...
+
+    def is_provider_failure(self, error: BaseException) -> bool:
+        # Whether another provider might succeed where this one failed. A 4xx about the
+        # request itself (e.g. no tool call in the reply) would fail the same way everywhere
+        return not (isinstance(error, HTTPException) and error.status_code < 500)
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+from app.config.settings import Settings
+from app.services.cache import CacheBackend, SqliteCacheBackend, TieredCacheBackend, create_cache_backend
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> str:
+    # Canonical JSON so dict ordering and whitespace never split entries
+    payload = json.dumps({"model": model, "messages": messages, "tools": tools}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bypassed = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LLMResponseCache":
+        backend = create_cache_backend(
+            settings.llm_cache_backend,
+            namespace="llm_tool_call",
+            max_size=settings.llm_cache_max_size,
+            ttl=settings.llm_cache_ttl,
+            redis_url=settings.cache_redis_url,
+        )
+        if settings.llm_cache_disk_enabled:
+            disk = SqliteCacheBackend(settings.disk_cache_path, "llm_tool_call", settings.disk_cache_max_entries, settings.disk_cache_compact_every)
+            backend = TieredCacheBackend([backend, disk], settings.llm_cache_ttl)
+        return cls(backend, settings.llm_cache_ttl)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # A failing backend degrades to a miss rather than failing the request
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("LLM cache read failed: %s", e)
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("LLM cache write failed: %s", e)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "backend": self.backend.stats(),
+        }
@@ -1,11 +1,39 @@
-from app.services.openai_service import OpenAIService
-from app.config.settings import settings
+from typing import Callable, Dict, Optional
+from app.services.llm_base import LLMService
+from app.services.llm_router import LLMRouter
+from app.config.settings import LLMProviderSettings, Settings, get_settings
+
+# Builds a service from the app settings and, for entries of llm_providers, that entry
+LLMBuilder = Callable[[Settings, Optional[LLMProviderSettings]], LLMService]
+
+def build_openai(settings: Settings, provider: Optional[LLMProviderSettings] = None) -> LLMService:
+    # Imported on first use: the openai package is most of the app's import time
+    from app.services.openai_service import OpenAIService
+    return OpenAIService(settings, provider=provider)
+
+def build_router(settings: Settings, provider: Optional[LLMProviderSettings] = None) -> LLMService:
+    # The router owns the response cache, so the providers behind it don't keep their own
+    provider_settings = settings.model_copy(update={"llm_cache_enabled": False})
+    providers = [LLMFactory.create(entry.type, provider_settings, entry) for entry in settings.llm_providers]
+    return LLMRouter.from_settings(settings, providers)
 
 class LLMFactory:
-    @staticmethod
-    def get_llm_service(llm_type: str):
-        if llm_type == "openai":
-            return OpenAIService(settings)
-        # Add more LLMs here
-        else:
+    registry: Dict[str, LLMBuilder] = {
+        "openai": build_openai,
+        "router": build_router,
+    }
+
+    @classmethod
+    def register(cls, llm_type: str, builder: LLMBuilder) -> None:
+        cls.registry[llm_type] = builder
+
+    @classmethod
+    def create(cls, llm_type: str, settings: Settings, provider: Optional[LLMProviderSettings] = None) -> LLMService:
+        builder = cls.registry.get(llm_type)
+        if builder is None:
             raise ValueError(f"Unsupported LLM type: {llm_type}")
+        return builder(settings, provider)
+
+    @staticmethod
+    def get_llm_service(llm_type: str) -> LLMService:
+        return LLMFactory.create(llm_type, get_settings())
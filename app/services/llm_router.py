@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, TypeVar
+
+from app.services.errors import CircuitOpenError
+from app.services.llm_base import LLMService
+from app.services.llm_cache import LLMResponseCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class ProviderStats:
+    # Observed behaviour of one provider: EWMA latency and error rate plus a window of
+    # recent latencies for the hedge threshold
+    EWMA_ALPHA = 0.2
+    WINDOW = 100
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.recent: Deque[float] = deque(maxlen=self.WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float, succeeded: bool) -> None:
+        self.requests += 1
+        self.error_rate += self.EWMA_ALPHA * ((0.0 if succeeded else 1.0) - self.error_rate)
+        if succeeded:
+            self.latency = latency if self.latency is None else self.latency + self.EWMA_ALPHA * (latency - self.latency)
+            self.recent.append(latency)
+        else:
+            self.errors += 1
+
+    def score(self) -> float:
+        # Lower is better; untried providers score 0 so they get tried, ones that have only
+        # ever failed go last
+        if self.latency is None:
+            return float("inf") if self.errors else 0.0
+        return self.latency * (1.0 + 10.0 * self.error_rate)
+
+    def p95(self) -> Optional[float]:
+        if len(self.recent) < 10:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "latency_seconds": self.latency or 0.0,
+            "p95_seconds": self.p95() or 0.0,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+class LLMRouter(LLMService):
+    # Sends each call to the provider with the best observed latency/error score, fails over to
+    # the next one when a provider is down or over quota (not on request-level 4xx answers),
+    # and hedges slow calls with a duplicate to the runner-up.
+    name = "router"
+
+    def __init__(self, providers: Sequence[LLMService], hedge_enabled: bool = True, hedge_min_delay: float = 0.3,
+                 explore_rate: float = 0.0, cache: Optional[LLMResponseCache] = None):
+        if not providers:
+            raise ValueError("LLM router needs at least one provider")
+        self.providers = list(providers)
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.explore_rate = explore_rate
+        # One cache in front of all providers; entries are keyed by the router, not a model
+        self.cache = cache
+        self.provider_stats = {provider.name: ProviderStats() for provider in self.providers}
+
+    @classmethod
+    def from_settings(cls, settings, providers: Sequence[LLMService]) -> "LLMRouter":
+        return cls(
+            providers,
+            hedge_enabled=settings.llm_hedge_enabled,
+            hedge_min_delay=settings.llm_hedge_min_delay,
+            explore_rate=settings.llm_routing_explore_rate,
+            cache=LLMResponseCache.from_settings(settings) if settings.llm_cache_enabled else None,
+        )
+
+    @property
+    def token_usage(self) -> Dict[str, Dict[str, int]]:
+        total: Dict[str, Dict[str, int]] = {}
+        for provider in self.providers:
+            for stage, usage in getattr(provider, "token_usage", {}).items():
+                stage_total = total.setdefault(stage, {})
+                for field, value in usage.items():
+                    stage_total[field] = stage_total.get(field, 0) + value
+        return total
+
+    def ranked(self) -> List[LLMService]:
+        available = [provider for provider in self.providers if getattr(provider, "breaker", None) is None or provider.breaker.state != "open"]
+        if not available:
+            retry_after = min(provider.breaker.retry_after() for provider in self.providers)
+            raise CircuitOpenError("All LLM providers unavailable (circuits open)", retry_after=retry_after)
+        ranked = sorted(available, key=lambda provider: self.provider_stats[provider.name].score())
+        if len(ranked) > 1 and random.random() < self.explore_rate:
+            # Occasionally lead with another provider so its numbers stay current
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def hedge_delay(self, provider: LLMService) -> float:
+        p95 = self.provider_stats[provider.name].p95()
+        return max(self.hedge_min_delay, p95 or 0.0)
+
+    async def _timed(self, provider: LLMService, call: Callable[[LLMService], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await call(provider)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if provider.is_provider_failure(e):
+                self.provider_stats[provider.name].record(time.perf_counter() - started, False)
+            raise
+        self.provider_stats[provider.name].record(time.perf_counter() - started, True)
+        return result
+
+    async def _route(self, call: Callable[[LLMService], Awaitable[T]]) -> T:
+        candidates = self.ranked()
+        running: Dict["asyncio.Task[T]", LLMService] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> None:
+            provider = candidates.pop(0)
+            running[asyncio.ensure_future(self._timed(provider, call))] = provider
+
+        launch()
+        try:
+            while running:
+                primary = next(iter(running.values()))
+                can_hedge = self.hedge_enabled and not hedged and candidates and len(running) == 1
+                done, _ = await asyncio.wait(running, timeout=self.hedge_delay(primary) if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.provider_stats[candidates[0].name].hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        if hedged and provider is not primary:
+                            self.provider_stats[provider.name].hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if not provider.is_provider_failure(last_error):
+                        # The request itself was rejected; another provider would reject it too
+                        raise last_error
+                    logger.warning("LLM provider %s failed: %s", provider.name, last_error)
+                if not running and candidates:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        assert last_error is not None
+        raise last_error
+
+    async def get_weather_info(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], use_cache: bool = True) -> Dict[str, Any]:
+        cache_key = None
+        if self.cache is not None:
+            if use_cache:
+                cache_key = make_cache_key(self.name, messages, tools)
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            else:
+                self.cache.bypassed += 1
+
+        result = await self._route(lambda provider: provider.get_weather_info(messages, tools, use_cache=use_cache))
+        if cache_key is not None:
+            await self.cache.set(cache_key, result)
+        return result
+
+    async def generate_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> str:
+        return await self._route(lambda provider: provider.generate_human_readable_response(location, weather_data))
+
+    async def stream_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        # Streams are not hedged; a provider failing before its first token is skipped
+        last_error: Optional[BaseException] = None
+        for provider in self.ranked():
+            tokens = provider.stream_human_readable_response(location, weather_data)
+            started = time.perf_counter()
+            try:
+                first = await tokens.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await tokens.aclose()
+                if not provider.is_provider_failure(e):
+                    raise
+                self.provider_stats[provider.name].record(time.perf_counter() - started, False)
+                last_error = e
+                continue
+            self.provider_stats[provider.name].record(time.perf_counter() - started, True)
+            try:
+                yield first
+                async for token in tokens:
+                    yield token
+            finally:
+                await tokens.aclose()
+            return
+        assert last_error is not None
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: stats.stats() for name, stats in self.provider_stats.items()}
+
+    async def close(self) -> None:
+        if self.cache is not None:
+            await self.cache.close()
+        for provider in self.providers:
+            await provider.close()
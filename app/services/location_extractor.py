@@ -0,0 +1,153 @@
+import csv
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+WEATHER_KEYWORDS = frozenset({
+    "weather", "temperature", "temp", "forecast", "hot", "cold", "warm", "rain", "raining",
+    "sunny", "cloudy", "snow", "snowing", "humid", "humidity", "degrees", "celsius", "climate",
+})
+
+# Words that may follow a city without naming a different place ("Osaka today",
+# "Osaka, please", "Tokyo in the morning", "Hanoi at the moment")
+FILLER_WORDS = frozenset({
+    "today", "tomorrow", "tonight", "now", "right", "currently", "later", "soon", "please", "pls",
+    "thanks", "this", "next", "the", "a", "an", "and", "or", "but", "so", "is", "it", "be", "was",
+    "will", "what", "how", "like", "looking", "going", "do", "does", "should", "i", "we", "you",
+    "me", "my", "at", "on", "for", "to", "of", "with", "during", "over", "there", "then", "moment",
+    "day", "days", "week", "weekend", "morning", "afternoon", "evening", "night",
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+
+def fold(text: str) -> str:
+    # Lower-case and strip accents so "São Paulo" and "sao paulo" compare equal
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+def tokenize_with_separators(text: str) -> Tuple[List[str], List[str]]:
+    # separators[i] is the text between token i-1 and token i
+    folded = fold(text)
+    tokens: List[str] = []
+    separators: List[str] = []
+    end = 0
+    for match in _TOKEN_RE.finditer(folded):
+        tokens.append(match.group())
+        separators.append(folded[end:match.start()])
+        end = match.end()
+    return tokens, separators
+
+@dataclass(frozen=True)
+class City:
+    name: str
+    country_code: str
+
+    @property
+    def location(self) -> str:
+        return f"{self.name},{self.country_code}"
+
+@dataclass(frozen=True)
+class Extraction:
+    location: str
+    confidence: float
+
+class Gazetteer:
+    def __init__(self, cities: Iterable[City], countries: Dict[str, str]):
+        # Names are indexed by their token tuple, so every n-gram lookup is a single dict probe
+        self.cities: Dict[Tuple[str, ...], List[City]] = {}
+        for city in cities:
+            self.cities.setdefault(tuple(tokenize(city.name)), []).append(city)
+        self.countries: Dict[Tuple[str, ...], str] = {tuple(tokenize(name)): code for name, code in countries.items()}
+        self.max_ngram = max(len(key) for key in [*self.cities, *self.countries])
+
+    @classmethod
+    def load(cls, data_dir: Path = DATA_DIR) -> "Gazetteer":
+        with open(data_dir / "cities.csv", newline="", encoding="utf-8") as f:
+            cities = [City(row["name"], row["country_code"]) for row in csv.DictReader(f)]
+        with open(data_dir / "countries.csv", newline="", encoding="utf-8") as f:
+            countries = {row["name"]: row["country_code"] for row in csv.DictReader(f)}
+        return cls(cities, countries)
+
+    def find(self, tokens: List[str]) -> Tuple[List[List[City]], Set[str], List[int]]:
+        # Greedy longest match, left to right. A two-letter code right after a city
+        # ("Osaka,jp", "Paris fr") counts as a country mention for that city. Also returns the
+        # positions right after a city that no city or country match starts at.
+        cities: List[List[City]] = []
+        countries: Set[str] = set()
+        after_city: List[int] = []
+        matched: Set[int] = set()
+        i = 0
+        while i < len(tokens):
+            for n in range(min(self.max_ngram, len(tokens) - i), 0, -1):
+                key = tuple(tokens[i:i + n])
+                if key in self.cities:
+                    matched.add(i)
+                    candidates = self.cities[key]
+                    cities.append(candidates)
+                    i += n
+                    if i < len(tokens) and any(tokens[i] == city.country_code for city in candidates):
+                        countries.add(tokens[i])
+                        i += 1
+                    else:
+                        after_city.append(i)
+                    break
+                if key in self.countries:
+                    matched.add(i)
+                    countries.add(self.countries[key])
+                    i += n
+                    break
+            else:
+                i += 1
+        unmatched_after = [index for index in after_city if index < len(tokens) and index not in matched]
+        return cities, countries, unmatched_after
+
+@lru_cache(maxsize=1)
+def default_gazetteer() -> Gazetteer:
+    return Gazetteer.load()
+
+class LocationExtractor:
+    def __init__(self, gazetteer: Optional[Gazetteer] = None):
+        self.gazetteer = gazetteer or default_gazetteer()
+
+    def extract(self, messages: List[dict]) -> Optional[Extraction]:
+        text = next((message.get("content") or "" for message in reversed(messages) if message.get("role") == "user"), "")
+        tokens, separators = tokenize_with_separators(text)
+        if not WEATHER_KEYWORDS.intersection(tokens):
+            return None
+
+        matches, countries, unmatched_after = self.gazetteer.find(tokens)
+        if not matches:
+            return None
+        if any(self._qualifies(tokens, separators, index) for index in unmatched_after):
+            # "Paris, Texas", "London, Ontario": a region we don't know may name another place
+            return Extraction(matches[0][0].location, 0.4)
+        if len({city.location for candidates in matches for city in candidates}) > len(matches[0]):
+            # Several places mentioned (comparisons, itineraries): leave it to the LLM
+            return Extraction(matches[0][0].location, 0.3)
+
+        candidates = matches[0]
+        if countries:
+            in_country = [city for city in candidates if city.country_code in countries]
+            if not in_country:
+                return Extraction(candidates[0].location, 0.4)
+            return Extraction(in_country[0].location, 1.0 if len(in_country) == 1 else 0.5)
+        return Extraction(candidates[0].location, 0.9 if len(candidates) == 1 else 0.5)
+
+    @staticmethod
+    def _qualifies(tokens: List[str], separators: List[str], index: int) -> bool:
+        # An unknown word right after the city ("Paris TX", "London, Ontario") or after
+        # "<city> in/near" reads as a qualifier that may name another place
+        if "," not in separators[index] and tokens[index] in ("in", "near"):
+            if index + 1 == len(tokens):
+                return False
+            index += 1
+        word = tokens[index]
+        return word not in FILLER_WORDS and word not in WEATHER_KEYWORDS
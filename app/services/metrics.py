@@ -0,0 +1,165 @@
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus text-format metrics. Updates are plain dict operations on the event
+# loop thread (no locks, no label objects) so the per-request cost stays in the sub-microsecond range.
+
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last = +Inf), sum]; made cumulative at render time
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+def flatten_stats(prefix: str, stats: Dict[str, Any]) -> List[str]:
+    # Turns nested stats() dicts into gauges: numbers become samples, strings (e.g. breaker
+    # state) become a sample with the value as a label.
+    lines: List[str] = []
+
+    def walk(name: str, value: Any) -> None:
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk(f"{name}_{_NAME_RE.sub('_', str(key))}", child)
+        elif isinstance(value, bool):
+            lines.append(f"{name} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{name} {_format_value(value)}")
+        elif isinstance(value, str):
+            lines.append(f'{name}{{value="{_escape(value)}"}} 1')
+
+    walk(prefix, stats)
+    return lines
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        # Called at scrape time; returns ready-made exposition lines
+        self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("weather_api_http_requests_total", "HTTP requests by route, method and status.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("weather_api_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("weather_api_http_requests_in_flight", "HTTP requests currently being served.")
+ERRORS = REGISTRY.counter("weather_api_errors_total", "Errors by exception type.", ("type",))
+UPSTREAM_LATENCY = REGISTRY.histogram("weather_api_upstream_duration_seconds", "Upstream call latency by stage (weather_fetch, llm_tool_call, llm_phrasing).", ("stage",))
+UPSTREAM_ERRORS = REGISTRY.counter("weather_api_upstream_errors_total", "Upstream call failures by stage and exception type.", ("stage", "type"))
+LLM_TOKENS = REGISTRY.counter("weather_api_llm_tokens_total", "LLM tokens reported by the API, by stage and kind.", ("stage", "kind"))
+QUEUE_WAIT = REGISTRY.histogram("weather_api_queue_wait_seconds", "Time spent waiting for admission, by queue.", ("queue",))
+SHED = REGISTRY.counter("weather_api_shed_total", "Requests rejected by admission control, by queue and reason.", ("queue", "reason"))
+RATE_LIMITED = REGISTRY.counter("weather_api_rate_limited_total", "Upstream calls refused by our rate limiter or answered 429, by upstream and source.", ("upstream", "source"))
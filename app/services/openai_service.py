@@ -1,45 +1,209 @@
 from openai import OpenAI, AsyncOpenAI
+import anyio
 import json
-from typing import List, Dict, Any
-from app.config.settings import Settings
+import openai
+import time
+from typing import AsyncGenerator, List, Dict, Any, Optional
+from app.config.settings import LLMProviderSettings, Settings
+from app.services.errors import CircuitOpenError, ServiceUnavailableError, UpstreamRateLimitedError
+from app.services.llm_base import LLMService
+from app.services.llm_cache import LLMResponseCache, make_cache_key
+from app.services.metrics import LLM_TOKENS, RATE_LIMITED, UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from app.services.resilience import CircuitBreaker, TokenBucket, retry_after_seconds, retry_async
 from fastapi import HTTPException
 
-class OpenAIService:
-    def __init__(self, settings: Settings):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+# 429s are excluded: the provider is up, we are over quota (answered with 503 + Retry-After)
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+class OpenAIService(LLMService):
+    # Any OpenAI-compatible chat-completions API; `provider` overrides endpoint, key and models
+    def __init__(self, settings: Settings, cache: Optional[LLMResponseCache] = None, provider: Optional[LLMProviderSettings] = None):
+        provider = provider or LLMProviderSettings(name="openai")
+        self.name = provider.name
+        self.tool_call_model = provider.tool_call_model or settings.llm_tool_call_model
+        self.phrasing_model = provider.phrasing_model or settings.llm_phrasing_model
+        self.client = AsyncOpenAI(
+            api_key=provider.api_key or settings.openai_api_key,
+            base_url=provider.base_url or settings.openai_base_url,
+            timeout=provider.timeout or settings.openai_timeout,
+            # Retries happen in _create_completion, where each one takes a rate-limit token and
+            # a 429 is not retried (the SDK would sleep out the provider's Retry-After first)
+            max_retries=0,
+        )
+        self.max_retries = settings.openai_max_retries if provider.max_retries is None else provider.max_retries
+        self.retry_base_delay = settings.openai_retry_base_delay
+        self.retry_max_delay = settings.openai_retry_max_delay
+        self.breaker = CircuitBreaker(
+            "llm" if provider.name == "openai" else f"llm_{provider.name}",
+            failure_threshold=settings.openai_breaker_failure_threshold,
+            reset_timeout=settings.openai_breaker_reset_timeout,
+        )
+        self.rate_limiter = (
+            TokenBucket(settings.openai_rate_limit_per_second, settings.openai_rate_limit_burst)
+            if settings.openai_rate_limit_per_second > 0 else None
+        )
+        self.rate_limit_max_wait = settings.upstream_rate_limit_max_wait
+        # Tool-call extraction results, keyed by a hash of model + messages + tool schema
+        if cache is None and settings.llm_cache_enabled:
+            cache = LLMResponseCache.from_settings(settings)
+        self.cache = cache
+        # Token usage reported by the API, per stage ("tool_call", "phrasing")
+        self.token_usage: Dict[str, Dict[str, int]] = {}
+
+    def _record_usage(self, stage: str, response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        stage_usage = self.token_usage.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+        stage_usage["calls"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(usage, field, None)
+            if isinstance(value, int):
+                stage_usage[field] += value
+                if field != "total_tokens":
+                    LLM_TOKENS.inc((stage, field[:-len("_tokens")]), value)
+
+    async def _create_completion(self, stage: str, **kwargs: Any) -> Any:
+        # Breaker first: a request the open circuit rejects must not spend a token
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("LLM provider unavailable (circuit open)", retry_after=self.breaker.retry_after())
+        if self.rate_limiter is not None and not await self.rate_limiter.acquire(self.rate_limit_max_wait):
+            RATE_LIMITED.inc(("llm", "local"))
+            raise UpstreamRateLimitedError("LLM provider rate limit reached", retry_after=self.rate_limiter.wait_time())
+        metric_stage = f"llm_{stage}"
+        last_error: Optional[Exception] = None
+
+        async def attempt() -> Any:
+            nonlocal last_error
+            if last_error is not None and self.rate_limiter is not None and not await self.rate_limiter.acquire(self.rate_limit_max_wait):
+                RATE_LIMITED.inc(("llm", "local"))
+                raise last_error
+            started = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                UPSTREAM_ERRORS.inc((metric_stage, type(e).__name__))
+                last_error = e
+                raise
+            finally:
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, (metric_stage,))
+            return response
+
+        try:
+            response = await retry_async(
+                attempt,
+                attempts=self.max_retries + 1,
+                base_delay=self.retry_base_delay,
+                max_delay=self.retry_max_delay,
+                retry_on=lambda e: isinstance(e, TRANSIENT_ERRORS),
+            )
+        except Exception as e:
+            # Only connection errors, timeouts and 5xx count against the provider; a 429 does not
+            if isinstance(e, TRANSIENT_ERRORS):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if isinstance(e, openai.RateLimitError):
+                RATE_LIMITED.inc(("llm", "provider"))
+                raise UpstreamRateLimitedError(
+                    "LLM provider rate limit reached",
+                    retry_after=retry_after_seconds(e.response.headers.get("retry-after")),
+                ) from e
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def get_weather_info(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], use_cache: bool = True) -> Dict[str, Any]:
+        cache_key = None
+        if self.cache is not None:
+            if use_cache:
+                cache_key = make_cache_key(self.tool_call_model, messages, tools)
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            else:
+                self.cache.bypassed += 1
 
-    async def get_weather_info(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> Dict[str, Any]:
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
+            response = await self._create_completion(
+                "tool_call",
+                model=self.tool_call_model,
                 messages=messages,
                 tools=tools,
                 tool_choice="auto"
             )
+            self._record_usage("tool_call", response)
 
             # Check if the finish_reason is 'tool_calls'
             if response.choices and response.choices[0].finish_reason == 'tool_calls':
                 arguments = response.choices[0].message.tool_calls[0].function.arguments
                 data_json = json.loads(arguments)
+                if cache_key is not None:
+                    await self.cache.set(cache_key, data_json)
                 return data_json
             else:
                 # If finish_reason is not 'tool_calls', return the assistant's message
                 assistant_message = response.choices[0].message.content
                 raise HTTPException(status_code=400, detail={"error": "No tool calls detected.", "message": assistant_message})
             
+        except ServiceUnavailableError:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=400, detail={"error": str(e)})
+            raise HTTPException(status_code=400, detail={"error": str(e)}) from e
+
+    def is_provider_failure(self, error: BaseException) -> bool:
+        # Errors are answered as 400s; the chained cause tells an outage from a bad request
+        return isinstance(error, (ServiceUnavailableError, *TRANSIENT_ERRORS)) or isinstance(error.__cause__, TRANSIENT_ERRORS)
+
+    async def close(self) -> None:
+        if self.cache is not None:
+            await self.cache.close()
+        await self.client.close()
+
+    def _human_readable_messages(self, location: str, weather_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": "You are a helpful assistant. Answer this weather information in celsius."},
+            {"role": "user", "content": f"Here is the weather in {location}: {weather_data}"},
+        ]
 
     async def generate_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> str:
         try:
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant. Answer this weather information in celsius."},
-                {"role": "user", "content": f"Here is the weather in {location}: {weather_data}"},
-            ]
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
+            response = await self._create_completion(
+                "phrasing",
+                model=self.phrasing_model,
+                messages=self._human_readable_messages(location, weather_data),
             )
+            self._record_usage("phrasing", response)
             return response.choices[0].message.content
+        except ServiceUnavailableError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail={"error": str(e)}) from e
+
+    async def stream_human_readable_response(self, location: str, weather_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        try:
+            stream = await self._create_completion(
+                "phrasing",
+                model=self.phrasing_model,
+                messages=self._human_readable_messages(location, weather_data),
+                stream=True,
+                # Usage arrives in one last chunk with no choices
+                stream_options={"include_usage": True},
+            )
+        except ServiceUnavailableError:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=400, detail={"error": str(e)})
+            raise HTTPException(status_code=400, detail={"error": str(e)}) from e
+
+        usage_chunk = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage_chunk = chunk
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # A stream abandoned before its usage chunk still counts as a call
+            self._record_usage("phrasing", usage_chunk)
+            # Closing the HTTP response stops generation upstream when the client goes away;
+            # shielded so it still runs while the consumer is being cancelled.
+            with anyio.CancelScope(shield=True):
+                await stream.close()
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.errors import ServiceUnavailableError
+from app.services.resilience import TokenBucket
+
+if TYPE_CHECKING:
+    from app.services.weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+class DecayedCounter:
+    # Request frequency with exponential decay. Rather than decaying every key on every tick,
+    # new hits are weighted by 2^(t / half_life), so stored weights stay comparable and one
+    # hit costs a dict update. Weights are rescaled before they overflow.
+    RESCALE_EXPONENT = 500.0
+
+    def __init__(self, half_life: float, max_size: int, clock: Callable[[], float] = time.monotonic):
+        self.half_life = half_life
+        self.max_size = max_size
+        self.clock = clock
+        self._origin = clock()
+        self._weights: Dict[str, List[Any]] = {}  # key -> [weight, label]
+        self.pruned = 0
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def _exponent(self, now: float) -> float:
+        return (now - self._origin) / self.half_life * math.log(2)
+
+    def hit(self, key: str, label: str) -> None:
+        exponent = self._exponent(self.clock())
+        if exponent > self.RESCALE_EXPONENT:
+            self._rescale(exponent)
+            exponent = 0.0
+        item = self._weights.get(key)
+        if item is None:
+            self._weights[key] = [math.exp(exponent), label]
+            if len(self._weights) > self.max_size:
+                self._prune()
+        else:
+            item[0] += math.exp(exponent)
+
+    def score(self, key: str) -> float:
+        item = self._weights.get(key)
+        return item[0] / math.exp(self._exponent(self.clock())) if item else 0.0
+
+    def top(self, k: int) -> List[Tuple[str, str, float]]:
+        # [(key, label, decayed hit count)], most popular first
+        scale = math.exp(self._exponent(self.clock()))
+        best = heapq.nlargest(k, self._weights.items(), key=lambda item: item[1][0])
+        return [(key, label, weight / scale) for key, (weight, label) in best]
+
+    def _rescale(self, exponent: float) -> None:
+        factor = math.exp(-exponent)
+        for item in self._weights.values():
+            item[0] *= factor
+        self._origin = self.clock()
+
+    def _prune(self) -> None:
+        # Forget the least popular quarter so memory stays bounded
+        drop = heapq.nsmallest(len(self._weights) - self.max_size * 3 // 4, self._weights.items(), key=lambda item: item[1][0])
+        for key, _ in drop:
+            del self._weights[key]
+        self.pruned += len(drop)
+
+class PrefetchScheduler:
+    def __init__(self, weather_service: "WeatherService", settings):
+        self.weather_service = weather_service
+        self.interval = settings.prefetch_interval
+        self.top_k = settings.prefetch_top_k
+        self.lead_time = settings.prefetch_lead_time
+        self.min_score = settings.prefetch_min_score
+        # Upstream budget: prefetch_max_per_minute calls, at most one interval's worth at once
+        rate = settings.prefetch_max_per_minute / 60.0
+        self.budget = TokenBucket(rate, capacity=max(1.0, rate * settings.prefetch_interval))
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.runs = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_fresh = 0
+        self.skipped_budget = 0
+        self.last_run_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Prefetch run failed")
+
+    def due(self) -> List[Tuple[str, str]]:
+        # Popular locations whose cache entry is missing or expires within lead_time
+        cache = self.weather_service.cache
+        now = cache.clock()
+        selected = []
+        for key, location, score in self.weather_service.popularity.top(self.top_k):
+            if score < self.min_score:
+                break
+            entry = cache.peek(key)
+            if entry is not None and entry.expires_at - now > self.lead_time:
+                self.skipped_fresh += 1
+                continue
+            selected.append((key, location))
+        return selected
+
+    async def run_once(self) -> int:
+        started = time.perf_counter()
+        batch = []
+        for key, location in self.due():
+            if not self.budget.try_acquire():
+                self.skipped_budget += 1
+                continue
+            batch.append((key, location))
+
+        results = await asyncio.gather(
+            *(self.weather_service.prefetch(key, location, self.lead_time) for key, location in batch),
+            return_exceptions=True,
+        )
+        refreshed = 0
+        for (_, location), result in zip(batch, results):
+            if isinstance(result, (ValueError, ServiceUnavailableError)):
+                self.failed += 1
+                logger.warning("Prefetch for %s failed: %s", location, result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                refreshed += 1
+        self.runs += 1
+        self.refreshed += refreshed
+        self.last_run_seconds = time.perf_counter() - started
+        return refreshed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "top_k": self.top_k,
+            "runs": self.runs,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped_fresh": self.skipped_fresh,
+            "skipped_budget": self.skipped_budget,
+            "last_run_seconds": self.last_run_seconds,
+            "budget": self.budget.stats(),
+            "tracked_locations": len(self.weather_service.popularity),
+        }
@@ -0,0 +1,164 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self.failures = 0
+        self.successes = 0
+        self.rejections = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and (not self._probe_in_flight or self.clock() - self._probe_started_at >= self.reset_timeout):
+            # Let a single probe through; its outcome closes or re-opens the circuit.
+            # A probe that never reported back (e.g. cancelled) is replaced after reset_timeout.
+            self._probe_in_flight = True
+            self._probe_started_at = self.clock()
+            return True
+        self.rejections += 1
+        return False
+
+    def retry_after(self) -> float:
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._consecutive_failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opened += 1
+            self._state = self.OPEN
+            self._opened_at = self.clock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "failures": self.failures,
+            "successes": self.successes,
+            "rejections": self.rejections,
+            "opened": self.opened,
+            "retry_after": self.retry_after(),
+        }
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        # rate tokens per second, bursts up to capacity
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self.granted = 0
+        self.denied = 0
+        self.waited = 0
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, max_wait: float, tokens: float = 1.0) -> bool:
+        # Reserves the tokens (the balance may go negative, queueing later callers behind this
+        # one) and sleeps until they are due; refuses if that would take longer than max_wait.
+        wait = self.wait_time(tokens)
+        if wait > max_wait:
+            self.denied += 1
+            return False
+        self._tokens -= tokens
+        self.granted += 1
+        if wait > 0:
+            self.waited += 1
+            await asyncio.sleep(wait)
+        return True
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            self.granted += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "available": self.available(),
+            "granted": self.granted,
+            "denied": self.denied,
+            "waited": self.waited,
+        }
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After header in delta-seconds form; HTTP dates are ignored
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    # "Full jitter": uniform in [0, min(max_delay, base_delay * 2^attempt)]
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    retry_on: Callable[[BaseException], bool],
+) -> T:
+    attempts = max(1, attempts)
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not retry_on(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+    raise AssertionError("unreachable")
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from collections import deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+
+from app.models.weather import WeatherResponse
+from app.services.cache import normalize_location
+from app.services.errors import ServiceUnavailableError
+
+if TYPE_CHECKING:
+    from app.services.weather_service import WeatherService
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[str], Awaitable[None]]
+
+class SlowConsumerError(Exception):
+    pass
+
+class Subscriber:
+    # One WebSocket client. Weather updates are coalesced per location, so a client that
+    # reads slowly skips intermediate values instead of queueing them; control messages
+    # (acks, errors) keep their order in a small bounded queue.
+    def __init__(self, send: Send, max_control: int = 100):
+        self.send = send
+        self.locations: Set[str] = set()
+        self._updates: Dict[str, str] = {}
+        self._control: Deque[str] = deque(maxlen=max_control)
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.coalesced = 0
+
+    def offer(self, key: str, message: str) -> None:
+        if key in self._updates:
+            self.coalesced += 1
+        self._updates[key] = message
+        self._ready.set()
+
+    def notify(self, message: str) -> None:
+        self._control.append(message)
+        self._ready.set()
+
+    def pending(self) -> int:
+        return len(self._updates) + len(self._control)
+
+    async def run(self, send_timeout: float) -> None:
+        # Raises SlowConsumerError when one send does not complete within send_timeout
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            messages: List[str] = list(self._control)
+            self._control.clear()
+            messages.extend(self._updates.values())
+            self._updates.clear()
+            for message in messages:
+                # asyncio.wait rather than wait_for: wait_for can swallow a cancel that lands
+                # as the send completes, which would leave this loop running forever
+                send = asyncio.ensure_future(self.send(message))
+                try:
+                    done, _ = await asyncio.wait({send}, timeout=send_timeout)
+                finally:
+                    if not send.done():
+                        send.cancel()
+                if not done:
+                    raise SlowConsumerError(f"send blocked for more than {send_timeout}s")
+                send.result()
+                self.sent += 1
+
+class Topic:
+    def __init__(self, location: str):
+        self.location = location
+        self.subscribers: Set[Subscriber] = set()
+        self.last_message: Optional[str] = None
+        self.last_version: Optional[Tuple[Any, ...]] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+class SubscriptionHub:
+    # Live weather over WebSockets. Each subscribed location has one refresh loop reading
+    # through WeatherService (cache + single-flight), so upstream traffic depends on the
+    # number of locations, not subscribers; a changed value is encoded once and fanned out.
+    def __init__(self, weather_service: "WeatherService", settings):
+        self.weather_service = weather_service
+        self.refresh_interval = settings.ws_refresh_interval
+        self.max_connections = settings.ws_max_connections
+        self.max_locations = settings.ws_max_locations
+        self.send_timeout = settings.ws_send_timeout
+        self.subscribers: Set[Subscriber] = set()
+        self.topics: Dict[str, Topic] = {}
+        self.refreshes = 0
+        self.published = 0
+        self.deliveries = 0
+        self.rejected_connections = 0
+        self.slow_disconnects = 0
+
+    def full(self) -> bool:
+        return len(self.subscribers) >= self.max_connections
+
+    def connect(self, send: Send) -> Subscriber:
+        subscriber = Subscriber(send)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def disconnect(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        self.unsubscribe(subscriber, list(subscriber.locations))
+
+    def subscribe(self, subscriber: Subscriber, locations: Iterable[str]) -> List[str]:
+        added = []
+        for location in locations:
+            key = normalize_location(location)
+            if not key or key in subscriber.locations:
+                continue
+            if len(subscriber.locations) >= self.max_locations:
+                raise ValueError(f"At most {self.max_locations} locations per connection")
+            topic = self.topics.get(key)
+            if topic is None:
+                topic = self.topics[key] = Topic(location)
+                topic.task = asyncio.create_task(self._refresh_loop(key, topic))
+            topic.subscribers.add(subscriber)
+            subscriber.locations.add(key)
+            if topic.last_message is not None:
+                subscriber.offer(key, topic.last_message)
+            added.append(key)
+        return added
+
+    def unsubscribe(self, subscriber: Subscriber, locations: Iterable[str]) -> List[str]:
+        removed = []
+        for location in locations:
+            key = normalize_location(location)
+            topic = self.topics.get(key)
+            subscriber.locations.discard(key)
+            if topic is None or subscriber not in topic.subscribers:
+                continue
+            topic.subscribers.discard(subscriber)
+            removed.append(key)
+            if not topic.subscribers:
+                self._drop_topic(key)
+        return removed
+
+    def _drop_topic(self, key: str) -> None:
+        topic = self.topics.pop(key, None)
+        if topic is not None and topic.task is not None and topic.task is not asyncio.current_task():
+            topic.task.cancel()
+
+    def _publish(self, key: str, topic: Topic, message: str) -> None:
+        topic.last_message = message
+        self.published += 1
+        for subscriber in topic.subscribers:
+            subscriber.offer(key, message)
+        self.deliveries += len(topic.subscribers)
+
+    async def _refresh_loop(self, key: str, topic: Topic) -> None:
+        while True:
+            try:
+                weather = await self.weather_service.get_current_weather(topic.location)
+            except ServiceUnavailableError as e:
+                # Keep the last value; subscribers hear about the outage and we try again
+                self._notify(topic, {"type": "error", "location": key, "detail": str(e)})
+            except ValueError as e:
+                # Unknown location: tell the subscribers and stop tracking it
+                self._notify(topic, {"type": "error", "location": key, "detail": str(e)})
+                for subscriber in topic.subscribers:
+                    subscriber.locations.discard(key)
+                self._drop_topic(key)
+                return
+            except Exception:
+                logger.exception("Weather subscription refresh for %s failed", topic.location)
+            else:
+                self.refreshes += 1
+                version = (weather.temperature, weather.observed_at)
+                if version != topic.last_version:
+                    topic.last_version = version
+                    self._publish(key, topic, self.encode(key, weather))
+            await asyncio.sleep(self.refresh_interval)
+
+    def _notify(self, topic: Topic, payload: Dict[str, Any]) -> None:
+        message = orjson.dumps(payload).decode()
+        for subscriber in topic.subscribers:
+            subscriber.notify(message)
+
+    @staticmethod
+    def encode(key: str, weather: WeatherResponse) -> str:
+        return orjson.dumps({
+            "type": "weather",
+            "location": key,
+            "weather": weather.model_dump(),
+            "observed_at": weather.observed_at,
+        }).decode()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.subscribers),
+            "locations": len(self.topics),
+            "subscriptions": sum(len(topic.subscribers) for topic in self.topics.values()),
+            "pending_messages": sum(subscriber.pending() for subscriber in self.subscribers),
+            "refreshes": self.refreshes,
+            "published": self.published,
+            "deliveries": self.deliveries,
+            "coalesced": sum(subscriber.coalesced for subscriber in self.subscribers),
+            "rejected_connections": self.rejected_connections,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+    async def close(self) -> None:
+        tasks = [topic.task for topic in self.topics.values() if topic.task is not None]
+        self.topics.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
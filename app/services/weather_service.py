@@ -1,64 +1,519 @@
+import asyncio
+import logging
+import time
 import aiohttp
-from app.config.settings import settings
-from app.models.weather import WeatherResponse
-from app.services.openai_service import OpenAIService
-from typing import List
+from app.models.weather import BatchWeatherResult, WeatherResponse
+from app.services.admission import AdmissionController
+from app.services.cache import CacheBackend, RedisCacheBackend, SqliteCacheBackend, TieredCacheBackend, TTLCache, normalize_location
+from app.services.errors import CircuitOpenError, ServiceUnavailableError, UpstreamRateLimitedError, UpstreamTransientError
+from app.services.http_client import HttpClient
+from app.services.location_extractor import LocationExtractor
+from app.services.metrics import RATE_LIMITED, UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from app.services.llm_base import LLMService
+from app.services.prefetch import DecayedCounter, PrefetchScheduler
+from app.services.subscriptions import SubscriptionHub
+from app.services.resilience import CircuitBreaker, TokenBucket, retry_async, retry_after_seconds
+from app.services.singleflight import SingleFlight
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHAT_WEATHER_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_current_weather",
+            "description": "Get the current weather in a given location",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {
+                        "type": "string",
+                        "description": "The city and country, e.g. Osaka,jp",
+                    },
+                },
+                "required": ["location"],
+            }
+        }
+    }
+]
+
+CHAT_RESPONSE_MODES = ("llm", "template")
+
+class ChatModeStats:
+    def __init__(self) -> None:
+        self.requests: Dict[str, int] = {mode: 0 for mode in CHAT_RESPONSE_MODES}
+        self.errors: Dict[str, int] = {mode: 0 for mode in CHAT_RESPONSE_MODES}
+        self.latency_seconds: Dict[str, float] = {mode: 0.0 for mode in CHAT_RESPONSE_MODES}
+
+    def record(self, mode: str, latency: float, succeeded: bool) -> None:
+        if succeeded:
+            self.requests[mode] += 1
+            self.latency_seconds[mode] += latency
+        else:
+            self.errors[mode] += 1
+
+    def stats(self, token_usage: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+        phrasing = token_usage.get("phrasing", {})
+        phrasing_calls = phrasing.get("calls", 0)
+        tokens_per_phrasing = phrasing.get("total_tokens", 0) / phrasing_calls if phrasing_calls else 0.0
+        result: Dict[str, Any] = {}
+        for mode in CHAT_RESPONSE_MODES:
+            requests = self.requests[mode]
+            result[mode] = {
+                "requests": requests,
+                "errors": self.errors[mode],
+                "latency_seconds_total": self.latency_seconds[mode],
+                "avg_latency_seconds": self.latency_seconds[mode] / requests if requests else 0.0,
+            }
+        result["llm"]["phrasing_tokens_per_request"] = tokens_per_phrasing
+        # Each templated answer skips one phrasing completion
+        result["template"]["estimated_tokens_saved"] = round(self.requests["template"] * tokens_per_phrasing)
+        return result
 
 class WeatherService:
-    def __init__(self, settings, llm_service: OpenAIService):
+    def __init__(self, settings, llm_service: LLMService, http_client: Optional[HttpClient] = None,
+                 shared_cache: Optional[CacheBackend] = None):
         self.settings = settings
         self.llm_service = llm_service
+        self.http_client = http_client or HttpClient(settings)
+        self.cache: TTLCache[WeatherResponse] = TTLCache(
+            max_size=settings.weather_cache_max_size,
+            ttl=settings.weather_cache_ttl,
+            stale_ttl=settings.weather_cache_stale_ttl,
+        )
+        # Second tier shared by all workers, so N processes don't each fetch every location:
+        # Redis across hosts and/or the local disk file, which also survives restarts
+        if shared_cache is None:
+            tiers: List[CacheBackend] = []
+            if settings.weather_shared_cache_enabled:
+                tiers.append(RedisCacheBackend(settings.cache_redis_url, "weather"))
+            if settings.weather_disk_cache_enabled:
+                tiers.append(SqliteCacheBackend(settings.disk_cache_path, "weather", settings.disk_cache_max_entries, settings.disk_cache_compact_every))
+            if len(tiers) == 1:
+                shared_cache = tiers[0]
+            elif tiers:
+                shared_cache = TieredCacheBackend(tiers, settings.weather_cache_ttl)
+        self.shared_cache = shared_cache
+        self.shared_cache_counts = {"hits": 0, "misses": 0, "errors": 0}
+        self._refresh_tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self._inflight = SingleFlight()
+        self.weather_breaker = CircuitBreaker(
+            "weather",
+            failure_threshold=settings.weather_breaker_failure_threshold,
+            reset_timeout=settings.weather_breaker_reset_timeout,
+        )
+        # One token per provider fetch (its retries included); None when unlimited
+        self.rate_limiter = (
+            TokenBucket(settings.weather_rate_limit_per_second, settings.weather_rate_limit_burst)
+            if settings.weather_rate_limit_per_second > 0 else None
+        )
+        self.stale_fallbacks = 0
+        self.chat_stats = ChatModeStats()
+        # Gazetteer is loaded once here so chat requests only pay for dict lookups
+        self.location_extractor = LocationExtractor() if settings.local_extractor_enabled else None
+        self.extraction_counts = {"local": 0, "llm": 0}
+        # Request popularity drives the background prefetch of hot locations
+        self.popularity = DecayedCounter(settings.prefetch_half_life, settings.prefetch_tracked_max)
+        self.prefetcher = PrefetchScheduler(self, settings) if settings.prefetch_enabled else None
+        self.subscriptions = SubscriptionHub(self, settings)
+        self.chat_admission = AdmissionController(
+            "chat",
+            max_concurrency=settings.chat_max_concurrency,
+            max_queue=settings.chat_max_queue,
+            queue_timeout=settings.chat_queue_timeout,
+        )
+        self.active_chats = 0
 
     async def get_current_weather(self, location: str) -> WeatherResponse:
-        url = f"{self.settings.weather_api_url}?q={location}&appid={self.settings.weather_api_key}"
+        weather = await self._cached_weather(location)
+        # Entries are shared by every spelling of a location; answer with the caller's
+        return weather if weather.location == location else weather.model_copy(update={"location": location})
+
+    async def _cached_weather(self, location: str) -> WeatherResponse:
+        key = normalize_location(location)
+        self.popularity.hit(key, location)
+        entry = self.cache.get_entry(key)
+        if entry is not None:
+            if not entry.is_fresh(self.cache.clock()):
+                # Stale-while-revalidate: answer now, refresh in the background
+                self._schedule_refresh(key, location)
+            return entry.value
+
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    data = await response.json()
+            return await self._fetch_and_cache(key, location)
+        except (ServiceUnavailableError, UpstreamTransientError):
+            # Provider failing or circuit open: serve the last known value, however old
+            fallback = self.cache.peek(key)
+            if fallback is None:
+                raise
+            self.stale_fallbacks += 1
+            return fallback.value
 
-            if response.status != 200:
-                raise ValueError(data.get("message", "Failed to get weather data"))
+    async def prefetch(self, key: str, location: str, min_ttl: float) -> WeatherResponse:
+        # Refresh ahead of expiry; another worker's shared entry only counts if it outlives min_ttl
+        return await self._fetch_and_cache(key, location, min_shared_ttl=min_ttl)
 
-            kelvin_temp = data['main']['temp']
-            celsius_temp = kelvin_temp - 273.15
-            return WeatherResponse(location=location, temperature=round(celsius_temp, 2))
-        
+    async def _fetch_and_cache(self, key: str, location: str, min_shared_ttl: float = 0.0) -> WeatherResponse:
+        # Cache misses and background refreshes for the same location share one upstream call
+        async def fetch() -> WeatherResponse:
+            shared = await self._shared_get(key)
+            if shared is not None and shared[1] > min_shared_ttl:
+                weather, ttl = shared
+                self.cache.set(key, weather, ttl)
+                return weather
+            weather = await self._fetch_current_weather(location)
+            self.cache.set(key, weather)
+            await self._shared_set(key, weather)
+            return weather
+
+        return await self._inflight.do(key, fetch)
+
+    async def _shared_get(self, key: str) -> Optional[Tuple[WeatherResponse, float]]:
+        if self.shared_cache is None:
+            return None
+        try:
+            item = await self.shared_cache.get(key)
+        except Exception as e:
+            self.shared_cache_counts["errors"] += 1
+            logger.warning("Shared weather cache read failed: %s", e)
+            return None
+        if item is None:
+            self.shared_cache_counts["misses"] += 1
+            return None
+        # Keep the entry's original expiry rather than restarting the TTL in this worker
+        ttl = self.settings.weather_cache_ttl - (time.time() - item["fetched_at"])
+        if ttl <= 0:
+            self.shared_cache_counts["misses"] += 1
+            return None
+        self.shared_cache_counts["hits"] += 1
+        return WeatherResponse(**item["weather"], observed_at=item.get("observed_at")), ttl
+
+    async def _shared_set(self, key: str, weather: WeatherResponse) -> None:
+        if self.shared_cache is None:
+            return
+        try:
+            item = {"weather": weather.model_dump(), "observed_at": weather.observed_at, "fetched_at": time.time()}
+            await self.shared_cache.set(key, item, self.settings.weather_cache_ttl)
+        except Exception as e:
+            self.shared_cache_counts["errors"] += 1
+            logger.warning("Shared weather cache write failed: %s", e)
+
+    def cache_max_age(self, location: str) -> int:
+        # Seconds the cached entry stays fresh; 0 when absent or already stale
+        entry = self.cache.peek(normalize_location(location))
+        if entry is None:
+            return 0
+        return max(0, int(entry.expires_at - self.cache.clock()))
+
+    async def get_current_weather_batch(self, locations: List[str]) -> List[BatchWeatherResult]:
+        if len(locations) > self.settings.weather_batch_max_locations:
+            raise ValueError(f"Too many locations: {len(locations)} (max {self.settings.weather_batch_max_locations})")
+
+        # One lookup per normalized location, in order of first appearance
+        unique_locations: Dict[str, str] = {}
+        for location in locations:
+            unique_locations.setdefault(normalize_location(location), location)
+
+        semaphore = asyncio.Semaphore(self.settings.weather_batch_concurrency)
+
+        async def fetch_one(location: str) -> BatchWeatherResult:
+            async with semaphore:
+                try:
+                    return BatchWeatherResult(location=location, weather=await self.get_current_weather(location))
+                except (ValueError, ServiceUnavailableError) as e:
+                    return BatchWeatherResult(location=location, error=str(e))
+
+        return list(await asyncio.gather(*(fetch_one(location) for location in unique_locations.values())))
+
+    def _schedule_refresh(self, key: str, location: str) -> None:
+        if key in self._refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh(key, location))
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(key, None))
+
+    async def _refresh(self, key: str, location: str) -> None:
+        try:
+            await self._fetch_and_cache(key, location)
+        except (ValueError, ServiceUnavailableError) as e:
+            logger.warning("Background refresh for %s failed: %s", location, e)
+
+    def stats(self) -> Dict[str, Any]:
+        llm_cache = getattr(self.llm_service, "cache", None)
+        llm_stats = getattr(self.llm_service, "stats", None)
+        return {
+            "weather_cache": self.cache.stats(),
+            "weather_inflight": len(self._inflight),
+            "weather_stale_fallbacks": self.stale_fallbacks,
+            "weather_shared_cache": {**self.shared_cache.stats(), **self.shared_cache_counts} if self.shared_cache is not None else None,
+            "prefetch": self.prefetcher.stats() if self.prefetcher is not None else None,
+            "subscriptions": self.subscriptions.stats(),
+            "active_chats": self.active_chats,
+            "circuit_breakers": self._breaker_stats(),
+            "rate_limiters": self._rate_limiter_stats(),
+            "chat_admission": self.chat_admission.stats(),
+            "chat_modes": self.chat_stats.stats(getattr(self.llm_service, "token_usage", {})),
+            "llm_token_usage": getattr(self.llm_service, "token_usage", {}),
+            "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+            "llm_providers": llm_stats() if llm_stats is not None else None,
+            "location_extraction": dict(self.extraction_counts),
+        }
+
+    def _breaker_stats(self) -> Dict[str, Any]:
+        breakers = {"weather": self.weather_breaker.stats()}
+        # A router has one breaker per provider
+        for service in getattr(self.llm_service, "providers", [self.llm_service]):
+            llm_breaker = getattr(service, "breaker", None)
+            if llm_breaker is not None:
+                breakers[llm_breaker.name] = llm_breaker.stats()
+        return breakers
+
+    async def _acquire_chat(self) -> float:
+        admitted_at = await self.chat_admission.acquire()
+        self.active_chats += 1
+        return admitted_at
+
+    def _release_chat(self, admitted_at: float) -> None:
+        self.chat_admission.release(admitted_at)
+        self.active_chats -= 1
+
+    def _rate_limiter_stats(self) -> Dict[str, Any]:
+        limiters = {"weather": self.rate_limiter.stats() if self.rate_limiter is not None else None}
+        for service in getattr(self.llm_service, "providers", [self.llm_service]):
+            llm_limiter = getattr(service, "rate_limiter", None)
+            if llm_limiter is not None:
+                limiters["llm" if service.name == "openai" else f"llm_{service.name}"] = llm_limiter.stats()
+        return limiters
+
+    async def close(self) -> None:
+        if self.prefetcher is not None:
+            await self.prefetcher.stop()
+        await self.subscriptions.close()
+        tasks = list(self._refresh_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.shared_cache is not None:
+            await self.shared_cache.close()
+
+    async def _request_weather(self, location: str) -> Dict[str, Any]:
+        params = {"q": location, "appid": self.settings.weather_api_key}
+        timeout = aiohttp.ClientTimeout(total=self.settings.weather_api_timeout)
+        started = time.perf_counter()
+        try:
+            session = await self.http_client.get_session()
+            async with session.get(self.settings.weather_api_url, params=params, timeout=timeout) as response:
+                data = await response.json()
         except aiohttp.ClientError as e:
-            raise ValueError(f"HTTP Client error: {str(e)}")
+            UPSTREAM_ERRORS.inc(("weather_fetch", type(e).__name__))
+            raise UpstreamTransientError(f"HTTP Client error: {str(e)}")
+        except asyncio.TimeoutError:
+            UPSTREAM_ERRORS.inc(("weather_fetch", "TimeoutError"))
+            raise UpstreamTransientError("HTTP Client error: weather provider timed out")
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, ("weather_fetch",))
+
+        if response.status == 429:
+            UPSTREAM_ERRORS.inc(("weather_fetch", "HTTP429"))
+            RATE_LIMITED.inc(("weather", "provider"))
+            raise UpstreamRateLimitedError(
+                "Weather provider rate limit reached",
+                retry_after=retry_after_seconds(response.headers.get("Retry-After")),
+            )
+        if response.status >= 500:
+            UPSTREAM_ERRORS.inc(("weather_fetch", f"HTTP{response.status}"))
+            raise UpstreamTransientError(f"Weather data error: {data.get('message', 'Failed to get weather data')}")
+        if response.status != 200:
+            raise ValueError(data.get("message", "Failed to get weather data"))
+        return data
+
+    async def _fetch_current_weather(self, location: str) -> WeatherResponse:
+        # Breaker first: a request the open circuit rejects must not spend a token
+        breaker = self.weather_breaker
+        if not breaker.allow_request():
+            raise CircuitOpenError("Weather provider unavailable (circuit open)", retry_after=breaker.retry_after())
+        if self.rate_limiter is not None and not await self.rate_limiter.acquire(self.settings.upstream_rate_limit_max_wait):
+            RATE_LIMITED.inc(("weather", "local"))
+            raise UpstreamRateLimitedError("Weather provider rate limit reached", retry_after=self.rate_limiter.wait_time())
+        last_error: Optional[UpstreamTransientError] = None
+
+        async def attempt() -> Dict[str, Any]:
+            nonlocal last_error
+            # Retries are provider calls too: each takes its own token, and a retry that gets
+            # none counts as one more failed attempt
+            if last_error is not None and self.rate_limiter is not None and not await self.rate_limiter.acquire(self.settings.upstream_rate_limit_max_wait):
+                RATE_LIMITED.inc(("weather", "local"))
+                raise last_error
+            try:
+                return await self._request_weather(location)
+            except UpstreamTransientError as e:
+                last_error = e
+                raise
+
+        try:
+            # Per-attempt timeout in _request_weather, overall deadline across retries here
+            data = await asyncio.wait_for(
+                retry_async(
+                    attempt,
+                    attempts=self.settings.weather_retry_attempts,
+                    base_delay=self.settings.weather_retry_base_delay,
+                    max_delay=self.settings.weather_retry_max_delay,
+                    retry_on=lambda e: isinstance(e, UpstreamTransientError),
+                ),
+                timeout=self.settings.weather_api_deadline,
+            )
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            raise UpstreamTransientError("HTTP Client error: weather provider deadline exceeded")
+        except UpstreamTransientError:
+            breaker.record_failure()
+            raise
+        except UpstreamRateLimitedError:
+            # Over quota, not down: don't open the circuit, surface 503 + Retry-After
+            breaker.record_success()
+            raise
         except ValueError as e:
+            # The provider answered (e.g. unknown city), so it is healthy
+            breaker.record_success()
             raise ValueError(f"Weather data error: {str(e)}")
         except Exception as e:
+            breaker.record_failure()
             raise ValueError(f"Unexpected error: {str(e)}")
-
-    async def chat_weather(self, messages: List[dict]) -> str:
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_current_weather",
-                    "description": "Get the current weather in a given location",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "location": {
-                                "type": "string",
-                                "description": "The city and country, e.g. Osaka,jp",
-                            },
-                        },
-                        "required": ["location"],
-                    }
-                }
-            }
-        ]
+        breaker.record_success()
 
         try:
-            response_data = await self.llm_service.get_weather_info(messages, tools)
+            kelvin_temp = data['main']['temp']
+            celsius_temp = kelvin_temp - 273.15
+            # "dt" is when the provider observed the weather; fall back to our fetch time
+            observed_at = int(data.get("dt") or time.time())
+            return WeatherResponse(location=location, temperature=round(celsius_temp, 2), observed_at=observed_at)
+        except Exception as e:
+            raise ValueError(f"Unexpected error: {str(e)}")
+
+    def _extract_location_locally(self, messages: List[dict]) -> Optional[str]:
+        if self.location_extractor is None:
+            return None
+        extraction = self.location_extractor.extract(messages)
+        if extraction is None or extraction.confidence < self.settings.local_extractor_min_confidence:
+            return None
+        return extraction.location
+
+    async def _resolve_chat_weather(self, messages: List[dict], use_cache: bool = True) -> Tuple[str, WeatherResponse]:
+        location = self._extract_location_locally(messages)
+        if location is not None:
+            self.extraction_counts["local"] += 1
+        else:
+            self.extraction_counts["llm"] += 1
+            response_data = await self.llm_service.get_weather_info(messages, CHAT_WEATHER_TOOLS, use_cache=use_cache)
             location = response_data['location']
-            weather_data = await self.get_current_weather(location)
-            human_readable_response = await self.llm_service.generate_human_readable_response(location, weather_data.model_dump())
+        weather_data = await self.get_current_weather(location)
+        return location, weather_data
+
+    def _response_mode(self, response_mode: Optional[str]) -> str:
+        mode = response_mode or self.settings.chat_response_mode
+        if mode not in CHAT_RESPONSE_MODES:
+            raise ValueError(f"Unsupported response mode: {mode}")
+        return mode
+
+    def render_template_response(self, location: str, weather_data: WeatherResponse) -> str:
+        return self.settings.chat_response_template.format(location=location, temperature=weather_data.temperature)
+
+    async def chat_weather(self, messages: List[dict], response_mode: Optional[str] = None, use_cache: bool = True) -> str:
+        mode = self._response_mode(response_mode)
+        admitted_at = await self._acquire_chat()
+        try:
+            return await self._chat_weather(messages, mode, use_cache)
+        finally:
+            self._release_chat(admitted_at)
+
+    async def _chat_weather(self, messages: List[dict], mode: str, use_cache: bool) -> str:
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            location, weather_data = await self._resolve_chat_weather(messages, use_cache)
+            if mode == "template":
+                # Fast path: phrase a single temperature locally instead of a second LLM round trip
+                human_readable_response = self.render_template_response(location, weather_data)
+            else:
+                human_readable_response = await self.llm_service.generate_human_readable_response(location, weather_data.model_dump())
+            succeeded = True
             return human_readable_response
         
+        except ServiceUnavailableError:
+            raise
         except ValueError as e:
             raise ValueError(f"LLM or weather service error: {str(e)}")
         except Exception as e:
-            raise ValueError(f"Unexpected error: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Unexpected error: {str(e)}")
+        finally:
+            self.chat_stats.record(mode, time.perf_counter() - started, succeeded)
+
+    async def chat_weather_stream(self, messages: List[dict], response_mode: Optional[str] = None, use_cache: bool = True) -> AsyncGenerator[str, None]:
+        mode = self._response_mode(response_mode)
+        admitted_at = await self._acquire_chat()
+        started = time.perf_counter()
+        try:
+            tokens = await self._chat_weather_tokens(messages, mode, use_cache)
+        except BaseException:
+            self.chat_stats.record(mode, time.perf_counter() - started, False)
+            self._release_chat(admitted_at)
+            raise
+
+        def finish(succeeded: bool) -> None:
+            # Latency runs to the last token, or to the point the client went away
+            self.chat_stats.record(mode, time.perf_counter() - started, succeeded)
+            self._release_chat(admitted_at)
+
+        # The chat counts as running until its stream is exhausted or closed
+        return ChatStream(tokens, finish)
+
+    async def _chat_weather_tokens(self, messages: List[dict], mode: str, use_cache: bool) -> AsyncGenerator[str, None]:
+        # Tool-call extraction and the weather lookup run up front so their errors surface
+        # before the response starts; only the final phrasing is streamed.
+        try:
+            location, weather_data = await self._resolve_chat_weather(messages, use_cache)
+        except ServiceUnavailableError:
+            raise
+        except ValueError as e:
+            raise ValueError(f"LLM or weather service error: {str(e)}")
+        except Exception as e:
+            raise ValueError(f"Unexpected error: {str(e)}")
+        if mode == "template":
+            return _single_token(self.render_template_response(location, weather_data))
+        return self.llm_service.stream_human_readable_response(location, weather_data.model_dump())
+
+async def _single_token(text: str) -> AsyncGenerator[str, None]:
+    yield text
+
+class ChatStream:
+    # Tokens of one streamed chat. Unlike a generator's finally, aclose() releases the
+    # admission slot even when iteration never started (client gone before the first chunk).
+    # finish(succeeded) runs exactly once; only an error from the token source is a failure.
+    def __init__(self, tokens: AsyncGenerator[str, None], finish: Callable[[bool], None]):
+        self._tokens = tokens
+        self._finish: Optional[Callable[[bool], None]] = finish
+        self._failed = False
+
+    def __aiter__(self) -> "ChatStream":
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            return await self._tokens.__anext__()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        except BaseException as e:
+            self._failed = isinstance(e, Exception)
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        finish, self._finish = self._finish, None
+        if finish is None:
+            return
+        try:
+            await self._tokens.aclose()
+        finally:
+            finish(not self._failed)
@@ -0,0 +1,198 @@
+"""Warm-start hit rate and lookup latency of the on-disk (SQLite) cache tier.
+
+    python -m benchmarks.bench_disk_cache [--locations 5000] [--requests 20000] [--llm-keys 2000]
+
+Weather: a WeatherService whose provider call is replaced by a counter serves a Zipf
+workload, is closed ("restart"), and a new instance serves the same workload from an
+empty memory tier. Upstream calls after the restart are compared with a cold start that
+has no disk tier. LLM: tool-call results are written through LLMResponseCache, the cache
+is reopened and read back. Lookup latency is timed per tier (memory hit, disk hit, disk
+miss) together with the worst event-loop lag seen while disk lookups run, which should
+stay near the ticker interval since sqlite runs off the loop.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config.settings import Settings
+from app.models.weather import WeatherResponse
+from app.services.cache import MemoryCacheBackend, SqliteCacheBackend, TieredCacheBackend
+from app.services.llm_base import LLMService
+from app.services.llm_cache import LLMResponseCache, make_cache_key
+from app.services.weather_service import CHAT_WEATHER_TOOLS, WeatherService
+
+class NoLLM(LLMService):
+    async def get_weather_info(self, messages, tools, use_cache=True):
+        raise NotImplementedError
+
+    async def generate_human_readable_response(self, location, weather_data):
+        raise NotImplementedError
+
+    async def stream_human_readable_response(self, location, weather_data):
+        raise NotImplementedError
+        yield ""
+
+class CountingWeatherService(WeatherService):
+    # The provider is replaced by a counter; everything in front of it is the real service
+    upstream_calls = 0
+
+    async def _fetch_current_weather(self, location: str) -> WeatherResponse:
+        CountingWeatherService.upstream_calls += 1
+        return WeatherResponse(location=location, temperature=20.0, observed_at=int(time.time()))
+
+def make_settings(path: Path, disk: bool) -> Settings:
+    return Settings(
+        openai_api_key="stub",
+        weather_api_key="stub",
+        weather_api_url="http://127.0.0.1:9/data/2.5/weather",
+        prefetch_enabled=False,
+        local_extractor_enabled=False,
+        weather_disk_cache_enabled=disk,
+        llm_cache_disk_enabled=disk,
+        disk_cache_path=str(path),
+        weather_cache_ttl=600,
+    )
+
+def zipf_workload(keys: int, requests: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(keys)]
+    return [f"city{index},xx" for index in rng.choices(range(keys), weights=weights, k=requests)]
+
+async def serve(settings: Settings, workload: List[str]) -> int:
+    service = CountingWeatherService(settings, NoLLM())
+    before = CountingWeatherService.upstream_calls
+    for location in workload:
+        await service.get_current_weather(location)
+    await service.close()
+    return CountingWeatherService.upstream_calls - before
+
+def percentiles_us(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_us": ordered[len(ordered) // 2] * 1e6,
+        "p99_us": ordered[int(0.99 * (len(ordered) - 1))] * 1e6,
+        "mean_us": statistics.fmean(ordered) * 1e6,
+    }
+
+async def time_lookups(backend: Any, keys: List[str]) -> Dict[str, float]:
+    samples = []
+    for key in keys:
+        started = time.perf_counter()
+        await backend.get(key)
+        samples.append(time.perf_counter() - started)
+    return percentiles_us(samples)
+
+async def max_loop_lag(work, interval: float = 0.001) -> float:
+    # Worst delay of a 1 ms ticker while `work` runs
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            worst = max(worst, time.perf_counter() - started - interval)
+
+    task = asyncio.create_task(ticker())
+    await work
+    done.set()
+    await task
+    return worst
+
+async def bench_weather(directory: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    workload = zipf_workload(args.locations, args.requests, args.seed)
+    disk_settings = make_settings(directory / "weather.sqlite3", disk=True)
+    cold_settings = make_settings(directory / "unused.sqlite3", disk=False)
+
+    first_run = await serve(disk_settings, workload)
+    after_restart = await serve(disk_settings, workload)
+    cold_restart = await serve(cold_settings, workload)
+    return {
+        "requests": len(workload),
+        "distinct_locations": len(set(workload)),
+        "upstream_calls": {"first_start": first_run, "restart_with_disk": after_restart, "restart_without_disk": cold_restart},
+        "warm_start_hit_rate": 1 - after_restart / len(workload),
+        "cold_start_hit_rate": 1 - cold_restart / len(workload),
+    }
+
+async def bench_llm(directory: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    settings = make_settings(directory / "llm.sqlite3", disk=True)
+    keys = [make_cache_key("gpt-4o", [{"role": "user", "content": f"Weather in city{i}?"}], CHAT_WEATHER_TOOLS) for i in range(args.llm_keys)]
+    cache = LLMResponseCache.from_settings(settings)
+    for i, key in enumerate(keys):
+        await cache.set(key, {"location": f"city{i},xx"})
+    await cache.close()
+
+    restarted = LLMResponseCache.from_settings(settings)
+    for key in keys:
+        await restarted.get(key)
+    stats = restarted.stats()
+    await restarted.close()
+    return {"keys": len(keys), "warm_start_hit_rate": stats["hit_rate"], "tier_hits": stats["backend"]["tier_hits"]}
+
+async def bench_latency(directory: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    disk = SqliteCacheBackend(str(directory / "latency.sqlite3"), "latency", max_entries=args.locations * 2)
+    memory = MemoryCacheBackend(max_size=args.locations, ttl=600)
+    keys = [f"city{i},xx" for i in range(args.locations)]
+    value = {"weather": {"location": "City", "temperature": 20.0}, "observed_at": 1700000000, "fetched_at": time.time()}
+    for key in keys:
+        await disk.set(key, value, 600)
+        await memory.set(key, value, 600)
+
+    sample = random.Random(args.seed).sample(keys, min(len(keys), 2000))
+    disk_hit: Dict[str, float] = {}
+
+    async def disk_hits():
+        disk_hit.update(await time_lookups(disk, sample))
+
+    lag = await max_loop_lag(disk_hits())
+    result = {
+        "memory_hit": await time_lookups(memory, sample),
+        "disk_hit": disk_hit,
+        "disk_miss": await time_lookups(disk, [f"missing{i}" for i in range(len(sample))]),
+        "tiered_memory_hit": await time_lookups(TieredCacheBackend([memory, disk], 600), sample),
+        "max_loop_lag_ms": lag * 1000,
+        "file_size_kb": Path(disk.path).stat().st_size / 1024,
+    }
+    await disk.close()
+    return result
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        return {
+            "weather": await bench_weather(directory, args),
+            "llm": await bench_llm(directory, args),
+            "lookup_latency": await bench_latency(directory, args),
+        }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--llm-keys", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    weather, llm, latency = report["weather"], report["llm"], report["lookup_latency"]
+    calls = weather["upstream_calls"]
+    print(f"weather: {weather['requests']} requests over {weather['distinct_locations']} locations; upstream calls "
+          f"first start {calls['first_start']}, restart with disk {calls['restart_with_disk']}, "
+          f"restart without disk {calls['restart_without_disk']} "
+          f"(warm-start hit rate {weather['warm_start_hit_rate']:.1%} vs {weather['cold_start_hit_rate']:.1%})")
+    print(f"llm:     {llm['keys']} tool-call results, warm-start hit rate {llm['warm_start_hit_rate']:.1%}")
+    for name in ("memory_hit", "tiered_memory_hit", "disk_hit", "disk_miss"):
+        stats = latency[name]
+        print(f"{name:>18}: p50 {stats['p50_us']:7.1f} us  p99 {stats['p99_us']:7.1f} us")
+    print(f"max event-loop lag during disk lookups: {latency['max_loop_lag_ms']:.2f} ms, "
+          f"file {latency['file_size_kb']:.0f} KB")
+
+if __name__ == "__main__":
+    main()
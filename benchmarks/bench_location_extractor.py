@@ -0,0 +1,96 @@
+"""Compare the local gazetteer extractor with the LLM tool-call path.
+
+    python -m benchmarks.bench_location_extractor [--corpus PATH] [--llm]
+
+The local path is always measured. --llm also sends every prompt to the configured
+OpenAI model (uses app/config/settings.yaml and costs tokens).
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.location_extractor import LocationExtractor
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "data" / "chat_prompts.jsonl"
+
+def load_corpus(path: Path) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize_latency(latencies_us: List[float]) -> Dict[str, float]:
+    return {
+        "mean_us": statistics.fmean(latencies_us),
+        "p50_us": percentile(latencies_us, 50),
+        "p99_us": percentile(latencies_us, 99),
+    }
+
+def bench_local(corpus: List[Dict[str, Any]], min_confidence: float, repeat: int) -> Dict[str, Any]:
+    extractor = LocationExtractor()
+    latencies: List[float] = []
+    answered = correct = wrong = 0
+    for sample in corpus:
+        extraction = None
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            extraction = extractor.extract(sample["messages"])
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+        location: Optional[str] = extraction.location if extraction and extraction.confidence >= min_confidence else None
+        if location is not None:
+            answered += 1
+            if location == sample.get("expected_location"):
+                correct += 1
+            else:
+                wrong += 1
+    return {
+        "samples": len(corpus),
+        "hit_rate": answered / len(corpus),
+        "precision": correct / answered if answered else 0.0,
+        "wrong": wrong,
+        **summarize_latency(latencies),
+    }
+
+async def bench_llm(corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from app.config.settings import get_settings
+    from app.services.openai_service import OpenAIService
+    from app.services.weather_service import CHAT_WEATHER_TOOLS
+
+    service = OpenAIService(get_settings())
+    latencies: List[float] = []
+    answered = 0
+    try:
+        for sample in corpus:
+            started = time.perf_counter_ns()
+            try:
+                await service.get_weather_info(sample["messages"], CHAT_WEATHER_TOOLS, use_cache=False)
+                answered += 1
+            except Exception:
+                pass
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+    finally:
+        await service.close()
+    return {"samples": len(corpus), "hit_rate": answered / len(corpus), **summarize_latency(latencies)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=200, help="timed runs per prompt on the local path")
+    parser.add_argument("--llm", action="store_true", help="also measure the LLM tool-call path")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    results: Dict[str, Any] = {"local": bench_local(corpus, args.min_confidence, args.repeat)}
+    if args.llm:
+        results["llm"] = asyncio.run(bench_llm(corpus))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Measure response serialization cost per request, before and after the orjson path.
+
+    python -m benchmarks.bench_serialization [--requests N] [--batch-size N]
+
+"before" is FastAPI's default handling as the routes were declared originally:
+/weather and /chat_weather without a response model (jsonable_encoder + json.dumps),
+/weather/batch with one (pydantic dump + json.dumps). "after" is weather_router as it is
+now: declared response models and ORJSONResponse. Both the encoding step alone and a full
+request driven over ASGI (no sockets, service stubbed out) are reported in microseconds.
+"""
+import argparse
+import asyncio
+import json
+import time
+import timeit
+from typing import Any, Callable, Dict, List
+
+from fastapi import APIRouter, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from app.api.v1.weather import ChatWeatherRequest, weather_router
+from app.models.weather import BatchWeatherRequest, BatchWeatherResponse, BatchWeatherResult, WeatherResponse
+
+CHAT_ANSWER = "The current temperature in Osaka,jp is 27.0°C. It's a warm day, so light clothing is a good idea."
+
+class StubWeatherService:
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+
+    async def get_current_weather(self, location: str) -> WeatherResponse:
+        return WeatherResponse(location=location, temperature=27.0)
+
+    async def get_current_weather_batch(self, locations: List[str]) -> List[BatchWeatherResult]:
+        return [BatchWeatherResult(location=location, weather=WeatherResponse(location=location, temperature=i / 3))
+                for i, location in enumerate(locations)]
+
+    async def chat_weather(self, messages: List[dict], response_mode: Any = None, use_cache: bool = True) -> str:
+        return CHAT_ANSWER
+
+def legacy_router(service: StubWeatherService) -> APIRouter:
+    # The original declarations: default JSONResponse, no response model on /weather or /chat_weather
+    router = APIRouter()
+
+    @router.get("/weather")
+    async def read_weather(location: str):
+        return await service.get_current_weather(location)
+
+    @router.post("/weather/batch", response_model=BatchWeatherResponse)
+    async def read_weather_batch(request: BatchWeatherRequest):
+        return BatchWeatherResponse(results=await service.get_current_weather_batch(request.locations))
+
+    @router.post("/chat_weather")
+    async def chat_weather(request: ChatWeatherRequest):
+        return await service.chat_weather([message.model_dump() for message in request.messages])
+
+    return router
+
+def build_app(fast: bool, batch_size: int) -> FastAPI:
+    service = StubWeatherService(batch_size)
+    if fast:
+        app = FastAPI(default_response_class=ORJSONResponse)
+        app.include_router(weather_router(service), prefix="/api/v1")  # type: ignore[arg-type]
+    else:
+        app = FastAPI()
+        app.include_router(legacy_router(service), prefix="/api/v1")
+    return app
+
+def payloads(batch_size: int) -> Dict[str, Any]:
+    weather = WeatherResponse(location="Osaka,jp", temperature=27.0)
+    batch = BatchWeatherResponse(results=[
+        BatchWeatherResult(location=f"City{i}", weather=WeatherResponse(location=f"City{i}", temperature=i / 3))
+        for i in range(batch_size)
+    ])
+    return {"weather": weather, "batch": batch, "chat": CHAT_ANSWER}
+
+def encoders(name: str, payload: Any) -> Dict[str, Callable[[], Any]]:
+    adapter: TypeAdapter = TypeAdapter({"weather": WeatherResponse, "batch": BatchWeatherResponse, "chat": str}[name])
+
+    def declared(response_class: Any) -> Callable[[], Any]:
+        # What FastAPI does for a declared response model: validate, dump in JSON mode, render
+        return lambda: response_class(adapter.dump_python(adapter.validate_python(payload), mode="json"))
+
+    before = declared(JSONResponse) if name == "batch" else (lambda: JSONResponse(jsonable_encoder(payload)))
+    return {"before": before, "after": declared(ORJSONResponse)}
+
+def bench_encoding(batch_size: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name, payload in payloads(batch_size).items():
+        number = max(200, 20000 // (batch_size if name == "batch" else 1))
+        results[name] = {
+            variant: min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+            for variant, fn in encoders(name, payload).items()
+        }
+    return results
+
+def request_scope(method: str, path: str, query: bytes = b"") -> Dict[str, Any]:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query, "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+async def drive(app: Any, scope: Dict[str, Any], body: bytes, requests: int) -> float:
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"unexpected status {message['status']}")
+
+    for _ in range(100):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+def bench_requests(requests: int, batch_size: int, rounds: int) -> Dict[str, Dict[str, float]]:
+    cases = {
+        "weather": (request_scope("GET", "/api/v1/weather", b"location=Osaka,jp"), b"", requests),
+        "batch": (request_scope("POST", "/api/v1/weather/batch"),
+                  json.dumps({"locations": [f"City{i}" for i in range(batch_size)]}).encode(), max(100, requests // batch_size)),
+        "chat": (request_scope("POST", "/api/v1/chat_weather"),
+                 json.dumps({"messages": [{"role": "user", "content": "What's the weather in Osaka?"}]}).encode(), requests),
+    }
+    results: Dict[str, Dict[str, float]] = {}
+    for name, (scope, body, count) in cases.items():
+        runs: Dict[str, List[float]] = {"before": [], "after": []}
+        # Alternate the variants and keep the best round of each
+        for _ in range(rounds):
+            for variant in runs:
+                runs[variant].append(asyncio.run(drive(build_app(variant == "after", batch_size), scope, body, count)))
+        results[name] = {variant: min(values) for variant, values in runs.items()}
+    return results
+
+def with_speedup(results: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    return {name: {**values, "speedup": values["before"] / values["after"]} for name, values in results.items()}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {
+        "encoding_us": with_speedup(bench_encoding(args.batch_size)),
+        "request_us": with_speedup(bench_requests(args.requests, args.batch_size, args.rounds)),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
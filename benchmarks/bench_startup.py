@@ -0,0 +1,112 @@
+"""Import time of main.py and cold start of the server, with optional budgets.
+
+    python -m benchmarks.bench_startup [--runs 5] [--import-budget-ms 1000] [--startup-budget-ms 3000]
+
+"import" runs `import main` in fresh interpreters (nothing is loaded or connected at import
+time, so this is module loading only) and lists the slowest modules from -X importtime.
+"cold start" launches benchmarks.server on a free port and times process start until
+/healthcheck answers, i.e. imports, settings, lifespan (LLM client, HTTP pool, services)
+and the first request. No upstream is contacted. With a budget set, the script exits 1
+when the median goes over it, so it can gate container images in CI.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.run_benchmark import ROOT, free_port
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+def time_import() -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(top: int) -> List[Dict[str, Any]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True)[:top]
+
+def time_cold_start(workers: int, timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--port", str(port), "--workers", str(workers),
+         "--upstream-url", "http://127.0.0.1:9", "--set", "prefetch_enabled=false"],
+        cwd=ROOT,
+    )
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with {process.returncode} during startup")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/healthcheck", timeout=1.0).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    return {
+        "median_ms": statistics.median(seconds) * 1000,
+        "min_ms": min(seconds) * 1000,
+        "max_ms": max(seconds) * 1000,
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--import-budget-ms", type=float, default=None)
+    parser.add_argument("--startup-budget-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = {
+        "import": summarize([time_import() for _ in range(args.runs)]),
+        "cold_start": summarize([time_cold_start(args.workers, args.timeout) for _ in range(args.runs)]),
+        "slowest_imports": slowest_imports(args.top),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name in ("import", "cold_start"):
+            stats = report[name]
+            print(f"{name:>10}: median {stats['median_ms']:7.1f} ms  (min {stats['min_ms']:.1f}, max {stats['max_ms']:.1f}, {args.runs} runs)")
+        print("slowest imports (cumulative ms):")
+        for module in report["slowest_imports"]:
+            print(f"  {module['cumulative_ms']:8.1f}  {module['module']}")
+
+    over = []
+    if args.import_budget_ms is not None and report["import"]["median_ms"] > args.import_budget_ms:
+        over.append(f"import {report['import']['median_ms']:.0f} ms > {args.import_budget_ms:.0f} ms")
+    if args.startup_budget_ms is not None and report["cold_start"]["median_ms"] > args.startup_budget_ms:
+        over.append(f"cold start {report['cold_start']['median_ms']:.0f} ms > {args.startup_budget_ms:.0f} ms")
+    if over:
+        print("over budget: " + "; ".join(over))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Load test for /api/v1/weather/ws: memory per connection and fan-out with many subscribers.
+
+    python -m benchmarks.bench_websocket --idle 2000 --active 2000 --locations 50 --duration 20
+
+Starts benchmarks.stubs and the app (one worker) like run_benchmark, then opens --idle
+connections that never subscribe and --active connections that each subscribe to
+--per-client locations drawn from --locations cities. Server RSS is sampled before any
+connection, after the idle ones and after the active ones have received their first
+update, and reported per connection. During --duration seconds the active clients keep
+reading; received messages, upstream weather calls (one refresh loop per location, not
+per subscriber) and the hub's stats are written to a JSON file. The stub's readings only
+change every 10 minutes, so updates after the first one are rare in short runs; the
+refresh loops still read through the cache every --refresh-interval.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+from benchmarks.run_benchmark import ROOT, free_port, git_commit, rss_bytes, start_process, wait_until_up
+
+CITIES = [
+    "Osaka,jp", "Tokyo,jp", "Kyoto,jp", "Hanoi,vn", "Saigon,vn", "London,gb", "Paris,fr", "Berlin,de",
+    "Madrid,es", "Rome,it", "Lisbon,pt", "Dublin,ie", "Oslo,no", "Stockholm,se", "Helsinki,fi", "Warsaw,pl",
+    "Prague,cz", "Vienna,at", "Zurich,ch", "Athens,gr", "Cairo,eg", "Nairobi,ke", "Lagos,ng", "Accra,gh",
+    "Dubai,ae", "Delhi,in", "Mumbai,in", "Bangkok,th", "Manila,ph", "Jakarta,id", "Seoul,kr", "Beijing,cn",
+    "Shanghai,cn", "Sydney,au", "Auckland,nz", "Toronto,ca", "Chicago,us", "Boston,us", "Denver,us", "Seattle,us",
+    "Austin,us", "Miami,us", "Lima,pe", "Bogota,co", "Santiago,cl", "Quito,ec", "Havana,cu", "Reykjavik,is",
+    "Tallinn,ee", "Riga,lv",
+]
+
+def raise_fd_limit(needed: int) -> None:
+    # Each connection is a socket on both ends; children inherit the raised limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(hard, max(soft, needed))
+    if target > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    if target < needed:
+        print(f"warning: open file limit {target} is below the {needed} sockets needed")
+
+def rss_mb(pid: int) -> Optional[float]:
+    rss = rss_bytes(pid)
+    return rss / 1024 / 1024 if rss is not None else None
+
+async def settle_rss(pid: int, seconds: float = 1.0) -> Optional[float]:
+    await asyncio.sleep(seconds)
+    return rss_mb(pid)
+
+async def open_connections(url: str, count: int, concurrency: int = 200) -> List[Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await websockets.connect(url, max_size=2 ** 16, ping_interval=None)
+
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+async def run(ws_url: str, args: argparse.Namespace, server_pid: int) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    cities = CITIES[:args.locations]
+    memory: Dict[str, Optional[float]] = {"baseline": await settle_rss(server_pid, 0.5)}
+
+    started = time.perf_counter()
+    idle = await open_connections(ws_url, args.idle)
+    connect_idle_s = time.perf_counter() - started
+    memory["idle"] = await settle_rss(server_pid)
+
+    started = time.perf_counter()
+    active = await open_connections(ws_url, args.active)
+    first_update: List[float] = []
+    received = 0
+
+    async def subscribe_and_read(websocket) -> None:
+        nonlocal received
+        locations = rng.sample(cities, min(args.per_client, len(cities)))
+        sent_at = time.perf_counter()
+        await websocket.send(json.dumps({"action": "subscribe", "locations": locations}))
+        got_first = False
+        async for raw in websocket:
+            message = json.loads(raw)
+            if message.get("type") == "weather":
+                received += 1
+                if not got_first:
+                    got_first = True
+                    first_update.append(time.perf_counter() - sent_at)
+
+    readers = [asyncio.create_task(subscribe_and_read(websocket)) for websocket in active]
+    deadline = time.perf_counter() + args.timeout
+    while len(first_update) < len(active) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    connect_active_s = time.perf_counter() - started
+    memory["active"] = await settle_rss(server_pid)
+
+    received_before = received
+    await asyncio.sleep(args.duration)
+    received_during = received - received_before
+    memory["end"] = rss_mb(server_pid)
+
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    await asyncio.gather(*(websocket.close() for websocket in idle + active), return_exceptions=True)
+
+    def per_connection_kb(before: Optional[float], after: Optional[float], count: int) -> Optional[float]:
+        if before is None or after is None or not count:
+            return None
+        return (after - before) * 1024 / count
+
+    ordered = sorted(first_update)
+    return {
+        "connections": {"idle": len(idle), "active": len(active)},
+        "connect_seconds": {"idle": connect_idle_s, "active_until_first_update": connect_active_s},
+        "first_update_ms": {
+            "p50": ordered[len(ordered) // 2] * 1000 if ordered else None,
+            "p99": ordered[int(0.99 * (len(ordered) - 1))] * 1000 if ordered else None,
+            "missing": len(active) - len(first_update),
+        },
+        "server_rss_mb": memory,
+        "kb_per_connection": {
+            "idle": per_connection_kb(memory["baseline"], memory["idle"], len(idle)),
+            "active": per_connection_kb(memory["idle"], memory["active"], len(active)),
+        },
+        "messages_received": {"total": received, "during_duration": received_during},
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=int, default=2000, help="connections that never subscribe")
+    parser.add_argument("--active", type=int, default=2000, help="connections that subscribe and read updates")
+    parser.add_argument("--locations", type=int, default=len(CITIES), help=f"distinct cities (max {len(CITIES)})")
+    parser.add_argument("--per-client", type=int, default=3, help="locations per active connection")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of reading after everyone subscribed")
+    parser.add_argument("--refresh-interval", type=float, default=1.0, help="ws_refresh_interval for the server")
+    parser.add_argument("--cache-ttl", type=float, default=5.0, help="weather_cache_ttl for the server")
+    parser.add_argument("--weather-latency", default="lognormal:0.08,0.3")
+    parser.add_argument("--timeout", type=float, default=60.0, help="max seconds to wait for first updates")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None, help="default: benchmarks/results/ws-<commit>-<timestamp>.json")
+    args = parser.parse_args(argv)
+
+    raise_fd_limit(2 * (args.idle + args.active) + 256)
+    stub_port, app_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{stub_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    stubs = start_process(["benchmarks.stubs", "--port", str(stub_port), "--weather-latency", args.weather_latency])
+    server = None
+    try:
+        wait_until_up(f"{upstream_url}/stats", stubs)
+        server = start_process([
+            "benchmarks.server", "--port", str(app_port), "--upstream-url", upstream_url,
+            "--set", f"ws_refresh_interval={args.refresh_interval}",
+            "--set", f"ws_max_connections={args.idle + args.active}",
+            "--set", f"weather_cache_ttl={args.cache_ttl}",
+            "--set", "prefetch_enabled=false",
+        ])
+        wait_until_up(f"{base_url}/healthcheck", server)
+
+        result = asyncio.run(run(f"ws://127.0.0.1:{app_port}/api/v1/weather/ws", args, server.pid))
+        result["subscriptions"] = httpx.get(f"{base_url}/api/v1/stats", timeout=5).json().get("subscriptions")
+        result["upstream_calls"] = httpx.get(f"{upstream_url}/stats", timeout=5).json()
+    finally:
+        for process in (server, stubs):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **result,
+    }
+    output = args.output or ROOT / "benchmarks" / "results" / f"ws-{report['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    per_connection = report["kb_per_connection"]
+    print(f"{args.idle} idle + {args.active} active connections, {args.locations} locations: "
+          f"{per_connection['idle'] or 0:.1f} KB/idle conn, {per_connection['active'] or 0:.1f} KB/active conn, "
+          f"first update p50 {report['first_update_ms']['p50'] or 0:.1f} ms, "
+          f"{report['messages_received']['during_duration']} updates in {args.duration:.0f}s, "
+          f"{report['upstream_calls'].get('weather', 0)} upstream weather calls")
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare two run_benchmark result files.
+
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# (label, path into the report, lower is better)
+METRICS: List[Tuple[str, Tuple[str, ...], bool]] = [
+    ("throughput rps", ("throughput_rps",), False),
+    ("success rps", ("success_rps",), False),
+    ("p50 ms", ("latency", "p50_ms"), True),
+    ("p95 ms", ("latency", "p95_ms"), True),
+    ("p99 ms", ("latency", "p99_ms"), True),
+    ("max ms", ("latency", "max_ms"), True),
+    ("peak RSS MB", ("server_rss_mb", "peak"), True),
+    ("upstream weather calls", ("upstream_calls", "weather"), True),
+    ("upstream LLM calls", ("upstream_calls", "chat_completions"), True),
+]
+
+def lookup(report: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = report
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    rows = [f"{'metric':<24}{'old':>12}{'new':>12}{'change':>10}"]
+    metrics = list(METRICS)
+    for name in sorted(set(old.get("latency_by_endpoint", {})) | set(new.get("latency_by_endpoint", {}))):
+        metrics.append((f"{name} p95 ms", ("latency_by_endpoint", name, "p95_ms"), True))
+    for label, path, lower_is_better in metrics:
+        before, after = lookup(old, path), lookup(new, path)
+        if before is None or after is None:
+            continue
+        change = ""
+        if before:
+            delta = (after - before) / before * 100
+            better = delta < 0 if lower_is_better else delta > 0
+            change = f"{delta:+.1f}%" + (" +" if better and abs(delta) >= 1 else "")
+        rows.append(f"{label[:24]:<24}{before:>12.1f}{after:>12.1f}{change:>10}")
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    args = parser.parse_args(argv)
+
+    old, new = json.loads(args.old.read_text()), json.loads(args.new.read_text())
+    print(f"old: {old.get('commit')} {old.get('timestamp')}  new: {new.get('commit')} {new.get('timestamp')}")
+    if old.get("config") != new.get("config"):
+        print("warning: runs used different configs")
+    for row in compare(old, new):
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Reproducible offline load benchmark.
+
+    python -m benchmarks.run_benchmark --workload benchmarks/data/workload_mixed.jsonl --rate 50 --duration 20
+
+Starts benchmarks.stubs (weather + OpenAI stand-ins) and the app from main.py in
+subprocesses, replays a JSONL workload open-loop at a fixed request rate, and writes
+throughput, latency percentiles, server memory and the app's /api/v1/stats to a JSON
+file. Compare two result files with `python -m benchmarks.compare OLD NEW`.
+
+Workload lines are one of:
+    {"method": "GET", "path": "/api/v1/weather?location=Osaka,jp"}
+    {"method": "POST", "path": "/api/v1/chat_weather", "json": {...}}
+    {"location": "Osaka,jp"}                    -> GET /api/v1/weather
+    {"messages": [...], ...}                    -> POST /api/v1/chat_weather
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_WORKLOAD = Path(__file__).resolve().parent / "data" / "workload_mixed.jsonl"
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path.split('?')[0]}"
+
+def to_request(item: Dict[str, Any]) -> Request:
+    if "path" in item:
+        return Request(item.get("method", "GET").upper(), item["path"], item.get("json"))
+    if "location" in item:
+        return Request("GET", f"/api/v1/weather?location={quote(item['location'])}")
+    if "messages" in item:
+        body = {key: value for key, value in item.items() if key in ("messages", "response_mode", "use_cache", "stream")}
+        return Request("POST", "/api/v1/chat_weather", body)
+    raise ValueError(f"Unrecognized workload line: {item}")
+
+def load_workload(path: Path) -> List[Request]:
+    with open(path, encoding="utf-8") as f:
+        return [to_request(json.loads(line)) for line in f if line.strip()]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        import psutil
+        # Includes uvicorn worker processes when the server runs several
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+    except ImportError:
+        pass
+    except psutil.Error:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process exited with {process.returncode} before {url} came up")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+
+async def replay(base_url: str, workload: List[Request], rate: float, total: int, server_pid: int, timeout: float) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    statuses: Counter = Counter()
+    memory_samples: List[int] = []
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def fire(request: Request, scheduled: float) -> None:
+            try:
+                response = await client.request(request.method, request.path, json=request.body)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            # Measured from the scheduled send time, so queueing in the client is not hidden
+            latencies.setdefault(request.name, []).append(time.perf_counter() - scheduled)
+
+        async def sample_memory() -> None:
+            while True:
+                rss = rss_bytes(server_pid)
+                if rss is not None:
+                    memory_samples.append(rss)
+                await asyncio.sleep(0.5)
+
+        sampler = asyncio.create_task(sample_memory())
+        tasks = []
+        started = time.perf_counter()
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(workload[i % len(workload)], scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed,
+        "success_rps": ok / elapsed,
+        "statuses": dict(statuses),
+        "latency": summarize(all_latencies),
+        "latency_by_endpoint": {name: summarize(values) for name, values in sorted(latencies.items())},
+        "server_rss_mb": {
+            "start": memory_samples[0] / 2**20 if memory_samples else None,
+            "peak": max(memory_samples) / 2**20 if memory_samples else None,
+            "end": memory_samples[-1] / 2**20 if memory_samples else None,
+        },
+    }
+
+def start_process(args: List[str], extra_env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    env = {**os.environ, **(extra_env or {})}
+    return subprocess.Popen([sys.executable, "-m", *args], cwd=ROOT, env=env)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", type=Path, default=DEFAULT_WORKLOAD)
+    parser.add_argument("--rate", type=float, default=50.0, help="requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load; ignored with --requests")
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--weather-latency", default="lognormal:0.08,0.3")
+    parser.add_argument("--openai-latency", default="lognormal:0.4,0.3")
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", type=Path, default=None, help="default: benchmarks/results/<commit>-<timestamp>.json")
+    parser.add_argument("--server-module", default="benchmarks.server", help="module started with --port/--upstream-url")
+    parser.add_argument("--server-arg", action="append", default=[], help="extra argument passed to the server module")
+    args = parser.parse_args(argv)
+
+    workload = load_workload(args.workload)
+    total = args.requests or int(args.rate * args.duration)
+    stub_port, app_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{stub_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    stubs = start_process([
+        "benchmarks.stubs", "--port", str(stub_port),
+        "--weather-latency", args.weather_latency, "--openai-latency", args.openai_latency,
+        "--weather-error-rate", str(args.weather_error_rate), "--openai-error-rate", str(args.openai_error_rate),
+    ])
+    server = None
+    try:
+        wait_until_up(f"{upstream_url}/stats", stubs)
+        server = start_process([args.server_module, "--port", str(app_port), "--upstream-url", upstream_url, *args.server_arg])
+        wait_until_up(f"{base_url}/healthcheck", server)
+
+        result = asyncio.run(replay(base_url, workload, args.rate, total, server.pid, args.timeout))
+        result["app_stats"] = httpx.get(f"{base_url}/api/v1/stats", timeout=5).json()
+        result["upstream_calls"] = httpx.get(f"{upstream_url}/stats", timeout=5).json()
+    finally:
+        for process in (server, stubs):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "workload": str(args.workload),
+            "rate": args.rate,
+            "requests": total,
+            "weather_latency": args.weather_latency,
+            "openai_latency": args.openai_latency,
+            "weather_error_rate": args.weather_error_rate,
+            "openai_error_rate": args.openai_error_rate,
+            "server_module": args.server_module,
+            "server_args": args.server_arg,
+        },
+        **result,
+    }
+    output = args.output or ROOT / "benchmarks" / "results" / f"{report['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    latency = report["latency"]
+    print(f"{total} requests in {report['elapsed_s']:.1f}s: {report['throughput_rps']:.1f} rps, "
+          f"p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms, "
+          f"peak RSS {report['server_rss_mb']['peak'] or 0:.1f} MB, statuses {report['statuses']}")
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Run the FastAPI app from main.py against local stub upstreams.
+
+    python -m benchmarks.server --port 8100 --upstream-url http://127.0.0.1:9100 --workers 2
+"""
+import argparse
+import os
+from typing import List, Optional
+
+from app.config.settings import ENV_PREFIX
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--upstream-url", default="http://127.0.0.1:9100", help="base URL of benchmarks.stubs")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="extra settings override (passed as WEATHER_API_<KEY>)")
+    args = parser.parse_args(argv)
+
+    # Workers are separate processes; environment overrides reach all of them
+    overrides = {
+        "weather_api_url": f"{args.upstream_url}/data/2.5/weather",
+        "openai_base_url": f"{args.upstream_url}/v1",
+        "weather_api_key": "stub",
+        "openai_api_key": "stub",
+        # Runs start cold unless a disk tier is asked for with --set
+        "weather_disk_cache_enabled": "false",
+        "llm_cache_disk_enabled": "false",
+    }
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = value
+    for key, value in overrides.items():
+        os.environ[ENV_PREFIX + key.upper()] = value
+
+    import serve
+    serve.main(["--host", args.host, "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Local stand-ins for the weather provider and the OpenAI chat-completions API.
+
+    python -m benchmarks.stubs --port 9100 --weather-latency lognormal:0.08,0.4 --openai-latency fixed:0.3
+
+Serves GET /data/2.5/weather (OpenWeatherMap shape) and POST /v1/chat/completions
+(tool calls, plain and streamed completions) with configurable latency distributions
+and error rates, so benchmarks and offline tests never touch the real services.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+LatencySampler = Callable[[], float]
+
+def parse_latency(spec: str) -> LatencySampler:
+    # "fixed:0.05", "uniform:0.02,0.1", "exp:0.05" (mean), "lognormal:0.08,0.4" (median, sigma)
+    kind, _, raw = spec.partition(":")
+    params = [float(value) for value in raw.split(",") if value]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1 / params[0])
+    if kind == "lognormal":
+        mu = math.log(params[0])
+        return lambda: random.lognormvariate(mu, params[1])
+    raise ValueError(f"Unsupported latency distribution: {spec}")
+
+_LOCATION_RE = re.compile(r"\b(?:in|for|at)\s+([A-Za-z][\w .'-]*?)(?:[?.!]|$)", re.IGNORECASE)
+
+def guess_location(messages: List[Dict[str, Any]]) -> str:
+    text = next((str(message.get("content") or "") for message in reversed(messages) if message.get("role") == "user"), "")
+    match = _LOCATION_RE.search(text)
+    return match.group(1).strip() if match else "Osaka,jp"
+
+class StubUpstreams:
+    def __init__(self, weather_latency: LatencySampler, openai_latency: LatencySampler, weather_error_rate: float = 0.0,
+                 openai_error_rate: float = 0.0, stream_chunk_delay: float = 0.01, model_name: str = "stub"):
+        self.weather_latency = weather_latency
+        self.openai_latency = openai_latency
+        self.weather_error_rate = weather_error_rate
+        self.openai_error_rate = openai_error_rate
+        self.stream_chunk_delay = stream_chunk_delay
+        self.model_name = model_name
+        self.counts = {"weather": 0, "chat_completions": 0, "errors": 0}
+        self.models: Dict[str, int] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self.weather)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.counts, "models": self.models})
+
+    async def weather(self, request: web.Request) -> web.Response:
+        self.counts["weather"] += 1
+        await asyncio.sleep(self.weather_latency())
+        if random.random() < self.weather_error_rate:
+            self.counts["errors"] += 1
+            return web.json_response({"cod": 503, "message": "stub overloaded"}, status=503)
+        location = request.query.get("q", "")
+        if not location or location.lower().startswith("invalid"):
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        # Deterministic temperature per city, observation time rounded like the real provider
+        temp = 270.0 + zlib.crc32(location.lower().encode()) % 3500 / 100
+        return web.json_response({"name": location, "main": {"temp": temp}, "dt": int(time.time()) // 600 * 600})
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.counts["chat_completions"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.openai_latency())
+        if random.random() < self.openai_error_rate:
+            self.counts["errors"] += 1
+            return web.json_response({"error": {"message": "stub overloaded", "type": "server_error"}}, status=503)
+
+        model = body.get("model", self.model_name)
+        self.models[model] = self.models.get(model, 0) + 1
+        usage = {"prompt_tokens": 60, "completion_tokens": 20, "total_tokens": 80}
+        if body.get("tools"):
+            arguments = json.dumps({"location": guess_location(body.get("messages", []))})
+            message: Dict[str, Any] = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{"id": "call_stub", "type": "function", "function": {"name": "get_current_weather", "arguments": arguments}}],
+            }
+            return web.json_response(self._completion(model, message, "tool_calls", usage))
+
+        answer = f"The current weather is mild. ({self.model_name})"
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return await self._stream(request, model, answer, usage if include_usage else None)
+        return web.json_response(self._completion(model, {"role": "assistant", "content": answer}, "stop", usage))
+
+    def _completion(self, model: str, message: Dict[str, Any], finish_reason: str, usage: Dict[str, int]) -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    async def _stream(self, request: web.Request, model: str, answer: str, usage: Optional[Dict[str, int]] = None) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in answer.split(" "):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.stream_chunk_delay)
+        if usage is not None:
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--weather-latency", default="lognormal:0.08,0.3")
+    parser.add_argument("--openai-latency", default="lognormal:0.4,0.3")
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--model-name", default="stub")
+    args = parser.parse_args(argv)
+
+    stubs = StubUpstreams(
+        parse_latency(args.weather_latency),
+        parse_latency(args.openai_latency),
+        weather_error_rate=args.weather_error_rate,
+        openai_error_rate=args.openai_error_rate,
+        model_name=args.model_name,
+    )
+    web.run_app(stubs.app(), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
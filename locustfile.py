@@ -15,3 +15,26 @@ class WeatherApiUser(HttpUser):
             ]
         }
         self.client.post("/api/v1/chat_weather", json=data)
+
+    @task
+    def post_chat_weather_template(self):
+        data = {
+            "messages": [
+                {"role": "user", "content": "What's the weather in Osaka?"}
+            ],
+            "response_mode": "template",
+        }
+        self.client.post("/api/v1/chat_weather", json=data, name="/api/v1/chat_weather [template]")
+
+    @task
+    def post_chat_weather_stream(self):
+        data = {
+            "messages": [
+                {"role": "user", "content": "What's the weather in Osaka?"}
+            ],
+            "stream": True,
+        }
+        # With stream=True the recorded response time is time-to-first-byte
+        with self.client.post("/api/v1/chat_weather", json=data, stream=True, name="/api/v1/chat_weather [stream]") as response:
+            for _ in response.iter_lines():
+                pass
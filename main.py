@@ -1,21 +1,65 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from app.api.middleware import MetricsMiddleware
+from app.api.responses import http_exception_handler
 from app.api.v1.weather import weather_router
+from app.config.settings import Settings, get_settings
+from app.services.http_client import HttpClient
 from app.services.llm_factory import LLMFactory
-from app.config.settings import settings
+from app.services.metrics import REGISTRY, flatten_stats
 from app.services.weather_service import WeatherService
 
-app = FastAPI()
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    # Nothing is read or connected at import time: settings, the LLM client and the services
+    # are built when the server starts the lifespan and live on app.state
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        app_settings = settings or get_settings()
+        llm_service = LLMFactory.create(app_settings.llm_provider, app_settings)
+        # Shared connection pool for upstream weather calls, opened/closed with the app
+        http_client = HttpClient(app_settings)
+        weather_service = WeatherService(app_settings, llm_service, http_client)
+        app.state.settings = app_settings
+        app.state.weather_service = weather_service
 
-# Create LLM Service
-llm_service = LLMFactory.get_llm_service("openai")
-weather_service = WeatherService(settings, llm_service)
+        # Cache, breaker and chat-mode counters are read from the services at scrape time
+        def collect():
+            return flatten_stats("weather_api_stats", weather_service.stats())
 
-app.include_router(weather_router(weather_service), prefix="/api/v1")
+        REGISTRY.register_collector(collect)
+        await http_client.start()
+        if weather_service.prefetcher is not None:
+            weather_service.prefetcher.start()
+        try:
+            yield
+        finally:
+            # uvicorn has already stopped accepting connections and waited up to
+            # timeout_graceful_shutdown (server_graceful_timeout) for in-flight requests
+            REGISTRY.unregister_collector(collect)
+            await weather_service.close()
+            await http_client.close()
+            await llm_service.close()
 
-# Thêm endpoint healthcheck
-@app.get("/healthcheck")
-def read_healthcheck():
-    return {"status": "ok"}
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+    app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(weather_router(), prefix="/api/v1")
+
+    # Thêm endpoint healthcheck
+    @app.get("/healthcheck")
+    def read_healthcheck():
+        return {"status": "ok"}
+
+    @app.get("/metrics")
+    def read_metrics():
+        return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,46 @@
+"""Production entry point: several uvicorn workers on uvloop + httptools.
+
+    python serve.py --workers 4
+
+Defaults come from the server_* keys in app/config/settings.yaml (or WEATHER_API_SERVER_*
+environment overrides). Each worker is a
+separate process with its own caches; enable weather_shared_cache_enabled and
+llm_cache_backend: "redis" so they share upstream results.
+"""
+import argparse
+import os
+from typing import List, Optional
+
+import uvicorn
+
+from app.config.settings import get_settings
+
+def worker_count(configured: int) -> int:
+    return configured if configured > 0 else os.cpu_count() or 1
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers, help="0 = one per CPU")
+    parser.add_argument("--loop", default=settings.server_loop, choices=["auto", "asyncio", "uvloop"])
+    parser.add_argument("--http", default=settings.server_http, choices=["auto", "h11", "httptools"])
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    # Workers are spawned processes, so the app is passed as an import string
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=worker_count(args.workers),
+        loop=args.loop,
+        http=args.http,
+        backlog=settings.server_backlog,
+        timeout_graceful_shutdown=int(settings.server_graceful_timeout),
+        log_level=args.log_level,
+    )
+
+if __name__ == "__main__":
+    main()
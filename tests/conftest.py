@@ -0,0 +1,13 @@
+import pytest
+
+class FakeClock:
+    # Stands in for time.monotonic/time.time; tests move time by adding to `now`
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController
+from app.services.errors import OverloadedError
+
+@pytest.mark.asyncio
+async def test_admits_up_to_concurrency_then_queues_fifo():
+    controller = AdmissionController("chat", max_concurrency=1, max_queue=5, queue_timeout=1.0)
+    first = await controller.acquire()
+    order = []
+
+    async def waiter(name):
+        admitted_at = await controller.acquire()
+        order.append(name)
+        controller.release(admitted_at)
+
+    tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b", "c")]
+    await asyncio.sleep(0)
+    assert controller.stats()["queued_now"] == 3
+
+    controller.release(first)
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "c"]
+    assert controller.active == 0
+    assert controller.stats()["admitted"] == 4
+
+@pytest.mark.asyncio
+async def test_sheds_when_queue_full():
+    controller = AdmissionController("chat", max_concurrency=1, max_queue=1, queue_timeout=1.0)
+    admitted_at = await controller.acquire()
+    queued = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(OverloadedError) as excinfo:
+        await controller.acquire()
+    assert excinfo.value.retry_after >= 1
+    assert controller.shed_queue_full == 1
+
+    controller.release(admitted_at)
+    controller.release(await queued)
+    assert controller.active == 0
+
+@pytest.mark.asyncio
+async def test_sheds_early_when_expected_wait_exceeds_deadline():
+    controller = AdmissionController("chat", max_concurrency=1, max_queue=10, queue_timeout=1.0)
+    controller.avg_service_time = 0.6
+    admitted_at = await controller.acquire()
+    queued = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    # Second in line: 2 x 0.6s expected > 1s deadline, rejected without waiting
+    with pytest.raises(OverloadedError) as excinfo:
+        await controller.acquire()
+    assert excinfo.value.retry_after == pytest.approx(1.2)
+    assert controller.shed_expected_wait == 1
+
+    controller.release(admitted_at)
+    controller.release(await queued)
+
+@pytest.mark.asyncio
+async def test_sheds_after_queue_timeout():
+    controller = AdmissionController("chat", max_concurrency=1, max_queue=10, queue_timeout=0.01)
+    admitted_at = await controller.acquire()
+
+    with pytest.raises(OverloadedError):
+        await controller.acquire()
+    assert controller.shed_timeout == 1
+    assert controller.stats()["queued_now"] == 0
+
+    controller.release(admitted_at)
+    assert controller.active == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    controller = AdmissionController("chat", max_concurrency=1, max_queue=10, queue_timeout=1.0)
+    admitted_at = await controller.acquire()
+    cancelled = asyncio.create_task(controller.acquire())
+    survivor = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    controller.release(admitted_at)
+    controller.release(await survivor)
+
+    assert controller.active == 0
+    assert controller.stats()["queued_now"] == 0
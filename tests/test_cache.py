@@ -0,0 +1,120 @@
+import pytest
+from app.services.cache import MemoryCacheBackend, SqliteCacheBackend, TieredCacheBackend, TTLCache, normalize_location
+
+def test_normalize_location():
+    assert normalize_location("Osaka,jp") == "osaka,jp"
+    assert normalize_location("  Osaka , JP ") == "osaka,jp"
+    assert normalize_location("New   York,US") == "new york,us"
+
+def test_get_and_expire(clock):
+    cache = TTLCache(max_size=10, ttl=60, clock=clock)
+    cache.set("osaka,jp", 27.0)
+    assert cache.get("osaka,jp") == 27.0
+
+    clock.now += 61
+    assert cache.get("osaka,jp") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.peek("osaka,jp").value == 27.0
+
+def test_stale_window(clock):
+    cache = TTLCache(max_size=10, ttl=60, stale_ttl=30, clock=clock)
+    cache.set("osaka,jp", 27.0)
+
+    clock.now += 70
+    entry = cache.get_entry("osaka,jp")
+    assert entry is not None
+    assert not entry.is_fresh(clock())
+    assert cache.get("osaka,jp") is None
+
+    clock.now += 30
+    assert cache.get_entry("osaka,jp") is None
+
+def test_lru_eviction(clock):
+    cache = TTLCache(max_size=2, ttl=60, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_when_max_size_zero(clock):
+    cache = TTLCache(max_size=0, ttl=60, clock=clock)
+    cache.set("a", 1)
+    assert len(cache) == 0
+
+def test_stats_counters(clock):
+    cache = TTLCache(max_size=10, ttl=60, clock=clock)
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_survives_reopen(tmp_path, clock):
+    path = str(tmp_path / "cache" / "test.sqlite3")
+    backend = SqliteCacheBackend(path, "weather", clock=clock)
+    await backend.set("osaka,jp", {"temperature": 27.0}, ttl=60)
+    await backend.close()
+
+    reopened = SqliteCacheBackend(path, "weather", clock=clock)
+    other = SqliteCacheBackend(path, "llm", clock=clock)
+    assert await reopened.get("osaka,jp") == {"temperature": 27.0}
+    assert await other.get("osaka,jp") is None
+
+    clock.now += 30
+    assert await reopened.get_with_ttl("osaka,jp") == ({"temperature": 27.0}, 30)
+    clock.now += 31
+    assert await reopened.get("osaka,jp") is None
+    assert reopened.stats()["expired"] == 1
+    await reopened.close()
+    await other.close()
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_compaction(tmp_path, clock):
+    backend = SqliteCacheBackend(str(tmp_path / "test.sqlite3"), "weather", max_entries=3, compact_every=1000, clock=clock)
+    await backend.set("expired", 0, ttl=1)
+    for i in range(5):
+        await backend.set(f"city{i}", i, ttl=100 + i)
+    clock.now += 2
+
+    # One expired row, then the two entries closest to expiry go
+    assert await backend.compact() == 3
+    assert await backend.size() == 3
+    assert await backend.get("city0") is None
+    assert await backend.get("city4") == 4
+
+    backend.compact_every = 2
+    await backend.set("city5", 5, ttl=200)
+    await backend.set("city6", 6, ttl=200)
+    assert await backend.size() == 3
+    assert backend.stats()["compactions"] == 2
+    await backend.close()
+
+@pytest.mark.asyncio
+async def test_tiered_backend_backfills_memory(tmp_path, clock):
+    disk = SqliteCacheBackend(str(tmp_path / "test.sqlite3"), "llm", clock=clock)
+    await disk.set("key", {"location": "Osaka"}, ttl=50)
+    memory = MemoryCacheBackend(max_size=10, ttl=3600)
+    tiered = TieredCacheBackend([memory, disk], default_ttl=3600)
+
+    assert await tiered.get("key") == {"location": "Osaka"}
+    assert await tiered.get("key") == {"location": "Osaka"}
+    assert tiered.stats()["tier_hits"] == [1, 1]
+    # Copied up with the disk entry's remaining TTL, not the memory tier default
+    assert memory.cache.peek("key").expires_at - memory.cache.clock() == pytest.approx(50, abs=1)
+
+    await tiered.set("new", 1, ttl=10)
+    assert await disk.get("new") == 1
+    assert await tiered.get("missing") is None
+    assert tiered.stats()["misses"] == 1
+    await tiered.close()
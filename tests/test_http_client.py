@@ -0,0 +1,63 @@
+import aiohttp
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.config.settings import Settings
+from app.services.http_client import HttpClient
+from app.services.openai_service import OpenAIService
+from app.services.weather_service import WeatherService
+
+@pytest.fixture
+def settings():
+    return Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url="http://api.openweathermap.org/data/2.5/weather",
+        http_pool_limit=50,
+        http_pool_limit_per_host=5,
+        http_dns_cache_ttl=120,
+        http_connect_timeout=1.5,
+        http_total_timeout=4.0,
+    )
+
+@pytest.mark.asyncio
+async def test_start_configures_pool(settings):
+    client = HttpClient(settings)
+    await client.start()
+    try:
+        session = await client.get_session()
+        assert session.connector.limit == 50
+        assert session.connector.limit_per_host == 5
+        assert session.connector.use_dns_cache
+        assert session.timeout.total == 4.0
+        assert session.timeout.connect == 1.5
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_close_is_idempotent(settings):
+    client = HttpClient(settings)
+    await client.start()
+    session = await client.get_session()
+    await client.close()
+    await client.close()
+    assert session.closed
+    assert not client.started
+
+@pytest.mark.asyncio
+async def test_weather_service_reuses_pooled_session(settings):
+    client = HttpClient(settings)
+    weather_service = WeatherService(settings, OpenAIService(settings), client)
+    await client.start()
+    try:
+        with patch.object(aiohttp.ClientSession, "get", autospec=True) as mock_get:
+            mock_get.return_value.__aenter__.return_value.json = AsyncMock(return_value={"main": {"temp": 300.15}})
+            mock_get.return_value.__aenter__.return_value.status = 200
+
+            await weather_service.get_current_weather("Osaka,jp")
+            await weather_service.get_current_weather("Tokyo,jp")
+
+            pooled_session = await client.get_session()
+            assert mock_get.call_count == 2
+            assert all(call.args[0] is pooled_session for call in mock_get.call_args_list)
+    finally:
+        await client.close()
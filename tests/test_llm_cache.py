@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import AsyncMock
+from app.services.cache import MemoryCacheBackend, RedisCacheBackend, create_cache_backend
+from app.services.llm_cache import LLMResponseCache, make_cache_key
+
+TOOLS = [{"type": "function", "function": {"name": "get_current_weather", "parameters": {}}}]
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, px=None):
+        self.data[key] = value.encode()
+        self.ttls[key] = px
+
+    async def aclose(self):
+        pass
+
+def test_make_cache_key_is_canonical():
+    messages_a = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    messages_b = [{"content": "What's the weather in Osaka?", "role": "user"}]
+
+    assert make_cache_key("gpt-4o", messages_a, TOOLS) == make_cache_key("gpt-4o", messages_b, TOOLS)
+    assert make_cache_key("gpt-4o", messages_a, TOOLS) != make_cache_key("gpt-4o", messages_a, [])
+    assert make_cache_key("gpt-4o", messages_a, TOOLS) != make_cache_key("gpt-4o-mini", messages_a, TOOLS)
+
+@pytest.mark.asyncio
+async def test_llm_response_cache_hit_rate():
+    cache = LLMResponseCache(MemoryCacheBackend(max_size=10, ttl=60), ttl=60)
+
+    assert await cache.get("key") is None
+    await cache.set("key", {"location": "Osaka,jp"})
+    assert await cache.get("key") == {"location": "Osaka,jp"}
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["backend"]["backend"] == "memory"
+
+@pytest.mark.asyncio
+async def test_llm_response_cache_backend_errors_degrade_to_miss():
+    backend = MemoryCacheBackend(max_size=10, ttl=60)
+    backend.get = AsyncMock(side_effect=ConnectionError("down"))
+    backend.set = AsyncMock(side_effect=ConnectionError("down"))
+    cache = LLMResponseCache(backend, ttl=60)
+
+    assert await cache.get("key") is None
+    await cache.set("key", {"location": "Osaka,jp"})
+    assert cache.stats()["errors"] == 2
+
+@pytest.mark.asyncio
+async def test_redis_backend_round_trip():
+    client = FakeRedis()
+    backend = RedisCacheBackend("redis://unused", namespace="llm_tool_call", client=client)
+
+    await backend.set("key", {"location": "Osaka,jp"}, ttl=30)
+
+    assert await backend.get("key") == {"location": "Osaka,jp"}
+    assert await backend.get("missing") is None
+    assert client.ttls["llm_tool_call:key"] == 30000
+
+def test_create_cache_backend_invalid():
+    with pytest.raises(ValueError):
+        create_cache_backend("memcached", namespace="x", max_size=1, ttl=1, redis_url="")
+
+@pytest.mark.asyncio
+async def test_disk_tier_warm_start(tmp_path):
+    from app.config.settings import Settings
+    settings = Settings(openai_api_key="stub", weather_api_key="stub", weather_api_url="https://fakeurl.com",
+                        llm_cache_disk_enabled=True, disk_cache_path=str(tmp_path / "cache.sqlite3"))
+    key = make_cache_key("gpt-4o", [{"role": "user", "content": "Weather in Osaka?"}], TOOLS)
+
+    cache = LLMResponseCache.from_settings(settings)
+    await cache.set(key, {"location": "Osaka,jp"})
+    await cache.close()
+
+    restarted = LLMResponseCache.from_settings(settings)
+    assert await restarted.get(key) == {"location": "Osaka,jp"}
+    assert await restarted.get(key) == {"location": "Osaka,jp"}
+    assert restarted.stats()["backend"]["tier_hits"] == [1, 1]
+    await restarted.close()
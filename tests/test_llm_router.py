@@ -0,0 +1,191 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+import openai
+import pytest
+from fastapi import HTTPException
+from aiohttp.test_utils import TestServer
+from app.config.settings import LLMProviderSettings, Settings
+from app.services.llm_factory import LLMFactory
+from app.services.llm_router import LLMRouter
+from app.services.openai_service import OpenAIService
+from benchmarks.stubs import StubUpstreams, parse_latency
+
+MESSAGES = [{"role": "user", "content": "What is the weather in Osaka?"}]
+TOOLS = [{"type": "function", "function": {"name": "get_current_weather", "parameters": {}}}]
+
+class StubProvider:
+    # A local OpenAI-compatible server with its own latency and error rate
+    def __init__(self, name, latency="fixed:0", error_rate=0.0):
+        self.name = name
+        self.stubs = StubUpstreams(parse_latency("fixed:0"), parse_latency(latency), openai_error_rate=error_rate,
+                                   stream_chunk_delay=0, model_name=name)
+        self.server = TestServer(self.stubs.app())
+
+    def entry(self, **overrides):
+        return LLMProviderSettings(name=self.name, base_url=str(self.server.make_url("/v1")), api_key="stub", max_retries=0, **overrides)
+
+@pytest.fixture
+async def stub_providers():
+    providers = {}
+
+    async def start(name, **kwargs):
+        provider = StubProvider(name, **kwargs)
+        await provider.server.start_server()
+        providers[name] = provider
+        return provider
+
+    yield start
+    for provider in providers.values():
+        await provider.server.close()
+
+def make_settings(*entries, **overrides):
+    return Settings(
+        openai_api_key="stub",
+        weather_api_key="stub",
+        weather_api_url="https://fakeurl.com",
+        llm_provider="router",
+        llm_providers=list(entries),
+        llm_routing_explore_rate=0,
+        **overrides,
+    )
+
+def build_router(settings) -> LLMRouter:
+    router = LLMFactory.create("router", settings)
+    assert isinstance(router, LLMRouter)
+    return router
+
+def test_factory_registry():
+    settings = make_settings(LLMProviderSettings(name="a"), LLMProviderSettings(name="b"))
+    router = build_router(settings)
+    assert [provider.name for provider in router.providers] == ["a", "b"]
+    assert all(isinstance(provider, OpenAIService) and provider.cache is None for provider in router.providers)
+    assert router.cache is not None
+
+    LLMFactory.register("custom", lambda settings, provider: OpenAIService(settings, provider=provider))
+    try:
+        assert isinstance(LLMFactory.create("custom", settings, LLMProviderSettings(name="c")), OpenAIService)
+    finally:
+        del LLMFactory.registry["custom"]
+
+@pytest.mark.asyncio
+async def test_per_stage_models(stub_providers):
+    provider = await stub_providers("local")
+    settings = make_settings(provider.entry(), llm_tool_call_model="small-model", llm_phrasing_model="large-model", llm_cache_enabled=False)
+    router = build_router(settings)
+
+    assert await router.get_weather_info(MESSAGES, TOOLS) == {"location": "Osaka"}
+    assert await router.generate_human_readable_response("Osaka", {"temperature": 20})
+    assert provider.stubs.models == {"small-model": 1, "large-model": 1}
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_routes_to_faster_provider(stub_providers):
+    slow = await stub_providers("slow", latency="fixed:0.1")
+    fast = await stub_providers("fast", latency="fixed:0")
+    router = build_router(make_settings(slow.entry(), fast.entry(), llm_hedge_enabled=False, llm_cache_enabled=False))
+
+    # Both unmeasured at first; after one call each the fast one leads
+    for _ in range(6):
+        await router.generate_human_readable_response("Osaka", {"temperature": 20})
+
+    assert [provider.name for provider in router.ranked()] == ["fast", "slow"]
+    assert slow.stubs.counts["chat_completions"] == 1
+    assert fast.stubs.counts["chat_completions"] == 5
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_fails_over_on_errors(stub_providers):
+    broken = await stub_providers("broken", error_rate=1.0)
+    healthy = await stub_providers("healthy")
+    router = build_router(make_settings(broken.entry(), healthy.entry(), llm_hedge_enabled=False, llm_cache_enabled=False))
+
+    assert await router.get_weather_info(MESSAGES, TOOLS) == {"location": "Osaka"}
+    assert "healthy" in await router.generate_human_readable_response("Osaka", {"temperature": 20})
+
+    stats = router.stats()
+    assert stats["broken"]["errors"] == 1
+    assert stats["healthy"]["requests"] == 2
+    assert router.ranked()[0].name == "healthy"
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_hedges_slow_primary(stub_providers):
+    slow = await stub_providers("slow", latency="fixed:1.0")
+    fast = await stub_providers("fast", latency="fixed:0")
+    router = build_router(make_settings(slow.entry(), fast.entry(), llm_hedge_min_delay=0.05, llm_cache_enabled=False))
+
+    started = time.perf_counter()
+    answer = await router.generate_human_readable_response("Osaka", {"temperature": 20})
+    elapsed = time.perf_counter() - started
+
+    assert "fast" in answer
+    assert elapsed < 0.5
+    stats = router.stats()
+    assert stats["fast"]["hedges"] == 1
+    assert stats["fast"]["hedge_wins"] == 1
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_stream_skips_failing_provider(stub_providers):
+    broken = await stub_providers("broken", error_rate=1.0)
+    healthy = await stub_providers("healthy")
+    router = build_router(make_settings(broken.entry(), healthy.entry(), llm_cache_enabled=False))
+
+    tokens = [token async for token in router.stream_human_readable_response("Osaka", {"temperature": 20})]
+
+    assert "healthy" in "".join(tokens)
+    assert router.stats()["broken"]["errors"] == 1
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_router_caches_tool_calls(stub_providers):
+    provider = await stub_providers("local")
+    router = build_router(make_settings(provider.entry()))
+
+    await router.get_weather_info(MESSAGES, TOOLS)
+    await router.get_weather_info(MESSAGES, TOOLS)
+
+    assert provider.stubs.counts["chat_completions"] == 1
+    assert router.cache.stats()["hits"] == 1
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_all_circuits_open(stub_providers):
+    from app.services.errors import CircuitOpenError
+    provider = await stub_providers("local")
+    router = build_router(make_settings(provider.entry(), llm_cache_enabled=False))
+    for _ in range(router.providers[0].breaker.failure_threshold):
+        router.providers[0].breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        await router.generate_human_readable_response("Osaka", {"temperature": 20})
+    assert provider.stubs.counts["chat_completions"] == 0
+    await router.close()
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_fail_over(stub_providers):
+    first = await stub_providers("first")
+    second = await stub_providers("second")
+    router = build_router(make_settings(first.entry(), second.entry(), llm_hedge_enabled=False, llm_cache_enabled=False))
+    no_tool_call = MagicMock()
+    no_tool_call.choices[0].finish_reason = "stop"
+    no_tool_call.choices[0].message.content = "I can only talk about the weather."
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    bad_request = openai.BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)
+
+    with patch.object(router.providers[0].client.chat.completions, "create", AsyncMock(return_value=no_tool_call)):
+        with pytest.raises(HTTPException) as excinfo:
+            await router.get_weather_info([{"role": "user", "content": "Tell me a joke"}], TOOLS)
+    assert excinfo.value.status_code == 400
+    assert "No tool calls detected" in str(excinfo.value.detail)
+
+    with patch.object(router.providers[0].client.chat.completions, "create", AsyncMock(side_effect=bad_request)):
+        with pytest.raises(HTTPException):
+            [token async for token in router.stream_human_readable_response("Osaka", {"temperature": 20})]
+
+    assert second.stubs.counts["chat_completions"] == 0
+    assert router.stats()["first"]["errors"] == 0
+    assert router.providers[0].breaker.state == "closed"
+    await router.close()
@@ -0,0 +1,87 @@
+import pytest
+from app.services.location_extractor import City, Gazetteer, LocationExtractor, tokenize
+
+@pytest.fixture(scope="module")
+def extractor():
+    return LocationExtractor()
+
+def user(content):
+    return [{"role": "user", "content": content}]
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Weather in São Paulo?") == ["weather", "in", "sao", "paulo"]
+
+@pytest.mark.parametrize("content, location", [
+    ("What's the weather in Osaka?", "Osaka,jp"),
+    ("weather in ho chi minh city", "Ho Chi Minh City,vn"),
+    ("Temperature in New York right now", "New York,us"),
+    ("Is it raining in São Paulo?", "Sao Paulo,br"),
+])
+def test_extract_single_city(extractor, content, location):
+    extraction = extractor.extract(user(content))
+    assert extraction.location == location
+    assert extraction.confidence >= 0.8
+
+@pytest.mark.parametrize("content", [
+    "weather in Osaka,jp",
+    "What's the weather in Osaka, Japan?",
+])
+def test_extract_city_with_country(extractor, content):
+    extraction = extractor.extract(user(content))
+    assert extraction.location == "Osaka,jp"
+    assert extraction.confidence == 1.0
+
+@pytest.mark.parametrize("content", [
+    "Tell me about AI models.",
+    "What's the weather like?",
+    "What's the weather in Springfield?",
+    "I'm flying to Tokyo tomorrow",
+])
+def test_no_extraction(extractor, content):
+    assert extractor.extract(user(content)) is None
+
+def test_multiple_cities_low_confidence(extractor):
+    extraction = extractor.extract(user("Is the weather warmer in Tokyo or Osaka?"))
+    assert extraction.confidence < 0.8
+
+def test_country_mismatch_low_confidence(extractor):
+    extraction = extractor.extract(user("weather in Paris, Japan"))
+    assert extraction.confidence < 0.8
+
+@pytest.mark.parametrize("content", [
+    "what is the weather in Paris, Texas",
+    "Will it rain in London, Ontario?",
+    "weather in Hanoi near Hoan Kiem lake",
+    "weather in Paris TX",
+    "weather in Vancouver WA",
+    "is it raining in Portland Maine",
+])
+def test_unknown_qualifier_low_confidence(extractor, content):
+    assert extractor.extract(user(content)).confidence < 0.8
+
+@pytest.mark.parametrize("content", [
+    "weather in Osaka, today?",
+    "Weather in Osaka in the morning",
+    "weather in Osaka today",
+    "Is it hot in Osaka at the moment?",
+    "weather in Osaka jp",
+])
+def test_filler_after_city_keeps_confidence(extractor, content):
+    extraction = extractor.extract(user(content))
+    assert extraction.location == "Osaka,jp"
+    assert extraction.confidence >= 0.8
+
+def test_ambiguous_city_resolved_by_country():
+    gazetteer = Gazetteer([City("Paris", "fr"), City("Paris", "us")], {"France": "fr", "United States": "us"})
+    extractor = LocationExtractor(gazetteer)
+
+    assert extractor.extract(user("weather in Paris")).confidence < 0.8
+    assert extractor.extract(user("weather in Paris, United States")).location == "Paris,us"
+
+def test_uses_last_user_message(extractor):
+    messages = [
+        {"role": "user", "content": "What's the weather in Osaka?"},
+        {"role": "assistant", "content": "It is 27°C in Osaka."},
+        {"role": "user", "content": "And the weather in Hanoi?"},
+    ]
+    assert extractor.extract(messages).location == "Hanoi,vn"
@@ -0,0 +1,86 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.middleware import MetricsMiddleware
+from app.services.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, ERRORS, Registry, flatten_stats
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    in_flight = registry.gauge("in_flight", "In flight.")
+    requests.inc(("/weather",))
+    requests.inc(("/weather",), 2)
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/weather"} 3' in text
+    assert "in_flight 1" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, ("weather_fetch",))
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="weather_fetch",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="weather_fetch",le="1"} 3' in text
+    assert 'latency_seconds_bucket{stage="weather_fetch",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{stage="weather_fetch"} 4' in text
+    assert 'latency_seconds_sum{stage="weather_fetch"} 6.05' in text
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors.", ("type",))
+    errors.inc(('say "hi"',))
+    assert 'errors_total{type="say \\"hi\\""} 1' in registry.render()
+
+def test_flatten_stats():
+    lines = flatten_stats("stats", {"cache": {"hits": 3, "hit_rate": 0.75}, "breaker": {"state": "open"}, "enabled": True, "note": None})
+    assert lines == [
+        "stats_cache_hits 3",
+        "stats_cache_hit_rate 0.75",
+        'stats_breaker_state{value="open"} 1',
+        "stats_enabled 1",
+    ]
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    return TestClient(app, raise_server_exceptions=False)
+
+def test_middleware_records_route_template(client):
+    before = HTTP_REQUESTS.value(("GET", "/items/{item_id}", "200"))
+    count_before = HTTP_LATENCY.count(("GET", "/items/{item_id}"))
+
+    client.get("/items/1")
+    client.get("/items/2")
+
+    assert HTTP_REQUESTS.value(("GET", "/items/{item_id}", "200")) == before + 2
+    assert HTTP_LATENCY.count(("GET", "/items/{item_id}")) == count_before + 2
+    assert HTTP_IN_FLIGHT.value() == 0
+
+def test_middleware_unmatched_and_errors(client):
+    unmatched_before = HTTP_REQUESTS.value(("GET", "unmatched", "404"))
+    errors_before = ERRORS.value(("RuntimeError",))
+
+    client.get("/nope")
+    response = client.get("/boom")
+
+    assert response.status_code == 500
+    assert HTTP_REQUESTS.value(("GET", "unmatched", "404")) == unmatched_before + 1
+    assert ERRORS.value(("RuntimeError",)) == errors_before + 1
+    assert HTTP_IN_FLIGHT.value() == 0
@@ -1,9 +1,12 @@
 import pytest
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from fastapi import HTTPException
 from app.services.openai_service import OpenAIService
 from app.config.settings import Settings
+from app.services.errors import CircuitOpenError, UpstreamRateLimitedError
+import httpx
 import json
+import openai
 
 @pytest.mark.asyncio
 async def test_get_weather_info_success():
@@ -119,3 +122,242 @@ async def test_generate_human_readable_response():
                 {"role": "user", "content": f"Here is the weather in {location}: {weather_data}"},
             ]
         )
+
+class FakeStream:
+    def __init__(self, deltas, usage=None):
+        self.deltas = deltas
+        self.usage = usage
+        self.close = AsyncMock()
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = delta
+            chunk.usage = None
+            yield chunk
+        if self.usage is not None:
+            chunk = MagicMock()
+            chunk.choices = []
+            chunk.usage = self.usage
+            yield chunk
+
+@pytest.mark.asyncio
+async def test_stream_human_readable_response():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+    stream = FakeStream(["It is ", None, "25°C", " in Tokyo."])
+    mock_create = AsyncMock(return_value=stream)
+
+    with patch.object(service.client.chat.completions, 'create', mock_create):
+        location = 'Tokyo'
+        weather_data = {'location': 'Tokyo', 'temperature': 25}
+
+        tokens = [token async for token in service.stream_human_readable_response(location, weather_data)]
+
+        assert tokens == ["It is ", "25°C", " in Tokyo."]
+        stream.close.assert_awaited_once()
+        service.client.chat.completions.create.assert_called_once_with(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant. Answer this weather information in celsius."},
+                {"role": "user", "content": f"Here is the weather in {location}: {weather_data}"},
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+@pytest.mark.asyncio
+async def test_stream_records_token_usage():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+    usage = MagicMock(prompt_tokens=40, completion_tokens=12, total_tokens=52)
+    streams = [FakeStream(["It is ", "25°C"], usage=usage), FakeStream(["It is ", "25°C"], usage=usage)]
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(side_effect=streams)):
+        assert [token async for token in service.stream_human_readable_response('Tokyo', {'temperature': 25})] == ["It is ", "25°C"]
+        # Closed before the usage chunk: counted as a call without tokens
+        abandoned = service.stream_human_readable_response('Tokyo', {'temperature': 25})
+        assert await abandoned.__anext__() == "It is "
+        await abandoned.aclose()
+
+    assert service.token_usage["phrasing"] == {"calls": 2, "prompt_tokens": 40, "completion_tokens": 12, "total_tokens": 52}
+
+@pytest.mark.asyncio
+async def test_stream_human_readable_response_closed_early():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+    stream = FakeStream(["It is ", "25°C", " in Tokyo."])
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(return_value=stream)):
+        tokens = service.stream_human_readable_response('Tokyo', {'temperature': 25})
+        assert await tokens.__anext__() == "It is "
+        await tokens.aclose()
+
+        stream.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_token_usage_recorded_per_stage():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "It is 25°C in Tokyo."
+    mock_response.usage.prompt_tokens = 40
+    mock_response.usage.completion_tokens = 12
+    mock_response.usage.total_tokens = 52
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(return_value=mock_response)):
+        await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+        await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    assert service.token_usage["phrasing"] == {"calls": 2, "prompt_tokens": 80, "completion_tokens": 24, "total_tokens": 104}
+
+def tool_call_response(arguments):
+    mock_response = MagicMock()
+    mock_response.choices[0].finish_reason = 'tool_calls'
+    mock_response.choices[0].message.tool_calls[0].function.arguments = arguments
+    return mock_response
+
+@pytest.mark.asyncio
+async def test_get_weather_info_cached():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+    mock_create = AsyncMock(return_value=tool_call_response('{"location": "Osaka,jp"}'))
+
+    with patch.object(service.client.chat.completions, 'create', mock_create):
+        messages = [{'role': 'user', 'content': "What's the weather in Osaka?"}]
+        tools = [{'type': 'function', 'function': {'name': 'get_current_weather', 'parameters': {}}}]
+
+        first = await service.get_weather_info(messages, tools)
+        second = await service.get_weather_info([dict(message) for message in messages], tools)
+
+        assert first == second == {"location": "Osaka,jp"}
+        assert mock_create.call_count == 1
+        assert service.cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_get_weather_info_cache_bypass():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com')
+    service = OpenAIService(settings)
+    mock_create = AsyncMock(return_value=tool_call_response('{"location": "Osaka,jp"}'))
+
+    with patch.object(service.client.chat.completions, 'create', mock_create):
+        messages = [{'role': 'user', 'content': "What's the weather in Osaka?"}]
+        tools = [{'type': 'function', 'function': {'name': 'get_current_weather', 'parameters': {}}}]
+
+        await service.get_weather_info(messages, tools)
+        await service.get_weather_info(messages, tools, use_cache=False)
+
+        assert mock_create.call_count == 2
+        assert service.cache.stats()["bypassed"] == 1
+
+@pytest.mark.asyncio
+async def test_get_weather_info_cache_disabled():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com', llm_cache_enabled=False)
+    service = OpenAIService(settings)
+    assert service.cache is None
+
+@pytest.mark.asyncio
+async def test_llm_breaker_opens_on_transient_errors():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com', openai_breaker_failure_threshold=2, openai_max_retries=0)
+    service = OpenAIService(settings)
+    timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    mock_create = AsyncMock(side_effect=timeout)
+
+    with patch.object(service.client.chat.completions, 'create', mock_create):
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+        with pytest.raises(CircuitOpenError):
+            await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    assert mock_create.call_count == 2
+    assert service.breaker.state == "open"
+
+@pytest.mark.asyncio
+async def test_openai_base_url_against_stub():
+    from aiohttp.test_utils import TestServer
+    from benchmarks.stubs import StubUpstreams, parse_latency
+
+    stubs = StubUpstreams(parse_latency("fixed:0"), parse_latency("fixed:0"), stream_chunk_delay=0)
+    server = TestServer(stubs.app())
+    await server.start_server()
+    try:
+        settings = Settings(openai_api_key='stub', weather_api_key='stub', weather_api_url='https://fakeurl.com',
+                            openai_base_url=str(server.make_url("/v1")), llm_cache_enabled=False)
+        service = OpenAIService(settings)
+        messages = [{'role': 'user', 'content': 'What is the weather in Osaka?'}]
+        tools = [{'type': 'function', 'function': {'name': 'get_current_weather', 'parameters': {}}}]
+
+        assert await service.get_weather_info(messages, tools) == {'location': 'Osaka'}
+        text = "".join([token async for token in service.stream_human_readable_response('Osaka', {'temperature': 20})])
+        assert "mild" in text
+        assert stubs.counts["chat_completions"] == 2
+        await service.close()
+    finally:
+        await server.close()
+
+@pytest.mark.asyncio
+async def test_llm_rate_limit_maps_to_503():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com', openai_breaker_failure_threshold=1)
+    service = OpenAIService(settings)
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error = openai.RateLimitError("quota", response=httpx.Response(429, request=request, headers={"retry-after": "4"}), body=None)
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(side_effect=error)):
+        with pytest.raises(UpstreamRateLimitedError) as excinfo:
+            await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    assert excinfo.value.retry_after == 4.0
+    assert service.breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_llm_429_is_not_retried():
+    # The SDK would retry a 429 after sleeping out Retry-After; retries are ours and skip 429s
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com',
+                        openai_max_retries=2, openai_retry_base_delay=0)
+    service = OpenAIService(settings)
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error = openai.RateLimitError("quota", response=httpx.Response(429, request=request, headers={"retry-after": "60"}), body=None)
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(side_effect=error)) as mock_create:
+        with pytest.raises(UpstreamRateLimitedError):
+            await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    assert service.client.max_retries == 0
+    assert mock_create.call_count == 1
+
+@pytest.mark.asyncio
+async def test_llm_retries_take_a_token_each():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com',
+                        openai_max_retries=2, openai_retry_base_delay=0, openai_retry_max_delay=0,
+                        openai_rate_limit_per_second=0.01, openai_rate_limit_burst=2, upstream_rate_limit_max_wait=0)
+    service = OpenAIService(settings)
+    timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(side_effect=timeout)) as mock_create:
+        with pytest.raises(HTTPException):
+            await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    # Two tokens, two provider calls; the third attempt found the bucket empty
+    assert mock_create.call_count == 2
+    assert service.rate_limiter.stats()["granted"] == 2
+    assert service.rate_limiter.stats()["denied"] == 1
+
+@pytest.mark.asyncio
+async def test_llm_local_rate_limit():
+    settings = Settings(openai_api_key='fake_openai_key', weather_api_key='fake_weather_key', weather_api_url='https://fakeurl.com',
+                        openai_rate_limit_per_second=1, openai_rate_limit_burst=1, upstream_rate_limit_max_wait=0)
+    service = OpenAIService(settings)
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = "Sunny"
+
+    with patch.object(service.client.chat.completions, 'create', AsyncMock(return_value=mock_response)) as mock_create:
+        assert await service.generate_human_readable_response('Tokyo', {'temperature': 25}) == "Sunny"
+        with pytest.raises(UpstreamRateLimitedError):
+            await service.generate_human_readable_response('Tokyo', {'temperature': 25})
+
+    assert mock_create.call_count == 1
+    assert service.rate_limiter.stats()["denied"] == 1
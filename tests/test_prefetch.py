@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.config.settings import Settings
+from app.models.weather import WeatherResponse
+from app.services.errors import CircuitOpenError
+from app.services.openai_service import OpenAIService
+from app.services.prefetch import DecayedCounter
+from app.services.weather_service import WeatherService
+
+@pytest.fixture
+def settings():
+    return Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url="http://api.openweathermap.org/data/2.5/weather",
+        local_extractor_enabled=False,
+        weather_cache_ttl=120,
+        prefetch_interval=0.01,
+        prefetch_top_k=2,
+        prefetch_lead_time=30,
+        prefetch_min_score=2,
+        prefetch_max_per_minute=6000,
+    )
+
+@pytest.fixture
+async def weather_service(settings):
+    service = WeatherService(settings, OpenAIService(settings))
+    yield service
+    await service.close()
+    await service.http_client.close()
+
+def test_decayed_counter_halves_per_half_life(clock):
+    counter = DecayedCounter(half_life=60, max_size=100, clock=clock)
+    for _ in range(4):
+        counter.hit("osaka,jp", "Osaka,jp")
+
+    assert counter.score("osaka,jp") == pytest.approx(4)
+    clock.now += 60
+    assert counter.score("osaka,jp") == pytest.approx(2)
+    counter.hit("tokyo,jp", "Tokyo,jp")
+    assert [key for key, _, _ in counter.top(2)] == ["osaka,jp", "tokyo,jp"]
+
+def test_decayed_counter_recent_hits_outrank_old_ones(clock):
+    counter = DecayedCounter(half_life=10, max_size=100, clock=clock)
+    for _ in range(10):
+        counter.hit("old", "Old")
+    clock.now += 100
+    for _ in range(2):
+        counter.hit("new", "New")
+
+    assert counter.top(1)[0][:2] == ("new", "New")
+
+def test_decayed_counter_rescales_and_stays_bounded(clock):
+    counter = DecayedCounter(half_life=1, max_size=8, clock=clock)
+    counter.hit("hot", "Hot")
+    counter.hit("hot", "Hot")
+    # Far beyond the rescale point; scores must stay finite
+    clock.now += 2000
+    counter.hit("hot", "Hot")
+    assert counter.score("hot") == pytest.approx(1)
+
+    for i in range(20):
+        counter.hit(f"city{i}", f"City{i}")
+    assert len(counter) <= 8
+    assert counter.pruned > 0
+
+@pytest.mark.asyncio
+async def test_prefetch_refreshes_hot_locations_before_expiry(weather_service):
+    for _ in range(3):
+        weather_service.popularity.hit("osaka,jp", "Osaka,jp")
+    weather_service.popularity.hit("tokyo,jp", "Tokyo,jp")
+    # Fresh for a long while: nothing to do yet
+    weather_service.cache.set("osaka,jp", WeatherResponse(location="Osaka,jp", temperature=20.0), ttl=100)
+
+    fresh = WeatherResponse(location="Osaka,jp", temperature=27.0)
+    with patch.object(weather_service, "_fetch_current_weather", AsyncMock(return_value=fresh)) as mock_fetch:
+        assert await weather_service.prefetcher.run_once() == 0
+
+        # About to expire: refreshed; Tokyo was requested once, below min_score
+        weather_service.cache.set("osaka,jp", WeatherResponse(location="Osaka,jp", temperature=20.0), ttl=10)
+        assert await weather_service.prefetcher.run_once() == 1
+
+    mock_fetch.assert_called_once_with("Osaka,jp")
+    assert weather_service.cache.get("osaka,jp") == fresh
+    stats = weather_service.stats()["prefetch"]
+    assert stats["refreshed"] == 1
+    assert stats["skipped_fresh"] == 1
+
+@pytest.mark.asyncio
+async def test_prefetch_respects_budget(settings):
+    settings.prefetch_max_per_minute = 60
+    settings.prefetch_interval = 1
+    service = WeatherService(settings, OpenAIService(settings))
+    for key in ("osaka,jp", "tokyo,jp"):
+        for _ in range(3):
+            service.popularity.hit(key, key)
+
+    with patch.object(service, "_fetch_current_weather", AsyncMock(side_effect=lambda location: WeatherResponse(location=location, temperature=1.0))):
+        assert await service.prefetcher.run_once() == 1
+
+    stats = service.prefetcher.stats()
+    assert stats["skipped_budget"] == 1
+    assert stats["budget"]["granted"] == 1
+    await service.http_client.close()
+
+@pytest.mark.asyncio
+async def test_prefetch_counts_failures(weather_service):
+    for _ in range(3):
+        weather_service.popularity.hit("osaka,jp", "Osaka,jp")
+
+    with patch.object(weather_service, "_fetch_current_weather", AsyncMock(side_effect=CircuitOpenError("open", retry_after=5))):
+        assert await weather_service.prefetcher.run_once() == 0
+
+    assert weather_service.prefetcher.failed == 1
+
+@pytest.mark.asyncio
+async def test_prefetch_loop_runs_in_background(weather_service):
+    for _ in range(3):
+        weather_service.popularity.hit("osaka,jp", "Osaka,jp")
+
+    fresh = WeatherResponse(location="Osaka,jp", temperature=27.0)
+    with patch.object(weather_service, "_fetch_current_weather", AsyncMock(return_value=fresh)):
+        weather_service.prefetcher.start()
+        assert weather_service.prefetcher.running
+        for _ in range(50):
+            if weather_service.prefetcher.refreshed:
+                break
+            await asyncio.sleep(0.01)
+        await weather_service.prefetcher.stop()
+
+    assert not weather_service.prefetcher.running
+    assert weather_service.cache.get("osaka,jp") == fresh
@@ -0,0 +1,318 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.config.settings import Settings
+from app.models.weather import WeatherResponse
+from app.services.errors import CircuitOpenError, UpstreamRateLimitedError, UpstreamTransientError
+from app.services.openai_service import OpenAIService
+from app.services.resilience import CircuitBreaker, TokenBucket, backoff_delay, retry_after_seconds, retry_async
+from app.services.weather_service import WeatherService
+
+class StubWeatherAPI:
+    # Local weather provider: each request pops the next scripted (delay, status, body[, headers]) reply
+    def __init__(self):
+        self.script = []
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, request):
+        self.requests += 1
+        delay, status, body, *headers = self.script.pop(0) if self.script else (0, 200, {"main": {"temp": 300.15}})
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response(body, status=status, headers=headers[0] if headers else None)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/weather", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return str(self.server.make_url("/weather"))
+
+@pytest.fixture
+async def stub_api():
+    stub = StubWeatherAPI()
+    await stub.start()
+    yield stub
+    await stub.server.close()
+
+@pytest.fixture
+async def weather_service(stub_api):
+    settings = Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url=str(stub_api.server.make_url("/weather")),
+        weather_api_timeout=0.2,
+        weather_api_deadline=2.0,
+        weather_retry_attempts=3,
+        weather_retry_base_delay=0.01,
+        weather_retry_max_delay=0.02,
+        weather_breaker_failure_threshold=2,
+        weather_breaker_reset_timeout=60,
+        local_extractor_enabled=False,
+    )
+    service = WeatherService(settings, OpenAIService(settings))
+    yield service
+    await service.http_client.close()
+
+def test_breaker_opens_after_threshold_and_half_opens(clock):
+    breaker = CircuitBreaker("weather", failure_threshold=2, reset_timeout=30, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 30
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats()["rejections"] == 2
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("weather", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["opened"] == 2
+
+def test_breaker_replaces_lost_probe(clock):
+    breaker = CircuitBreaker("weather", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+
+    clock.now += 10
+    assert breaker.allow_request()
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now += 1
+    assert bucket.available() == 2
+    clock.now += 10
+    assert bucket.available() == 3
+    assert bucket.stats()["granted"] == 3
+    assert bucket.stats()["denied"] == 1
+
+@pytest.mark.asyncio
+async def test_token_bucket_acquire_waits_within_max_wait():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    assert await bucket.acquire(max_wait=0.05)
+    # Empty: the next token is 10ms away
+    assert not await bucket.acquire(max_wait=0.001)
+    assert await bucket.acquire(max_wait=0.05)
+    assert bucket.stats()["waited"] == 1
+    assert bucket.stats()["denied"] == 1
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("7") == 7.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base_delay=0.1, max_delay=1.0)
+        assert 0 <= delay <= min(1.0, 0.1 * 2 ** attempt)
+
+@pytest.mark.asyncio
+async def test_retry_async_only_retries_retryable_errors():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise UpstreamTransientError("boom")
+        return "ok"
+
+    assert await retry_async(flaky, attempts=3, base_delay=0, max_delay=0, retry_on=lambda e: isinstance(e, UpstreamTransientError)) == "ok"
+    assert calls == 3
+
+    calls = 0
+
+    async def permanent():
+        nonlocal calls
+        calls += 1
+        raise ValueError("city not found")
+
+    with pytest.raises(ValueError):
+        await retry_async(permanent, attempts=3, base_delay=0, max_delay=0, retry_on=lambda e: isinstance(e, UpstreamTransientError))
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_weather_retries_server_errors(weather_service, stub_api):
+    stub_api.script = [(0, 503, {"message": "busy"}), (0, 500, {"message": "oops"})]
+
+    response = await weather_service.get_current_weather("Osaka,jp")
+
+    assert response.temperature == 27.0
+    assert stub_api.requests == 3
+    assert weather_service.weather_breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_weather_retries_slow_responses(weather_service, stub_api):
+    stub_api.script = [(0.5, 200, {"main": {"temp": 280.15}})]
+
+    response = await weather_service.get_current_weather("Osaka,jp")
+
+    assert response.temperature == 27.0
+    assert stub_api.requests == 2
+
+@pytest.mark.asyncio
+async def test_weather_client_errors_are_not_retried(weather_service, stub_api):
+    stub_api.script = [(0, 404, {"message": "city not found"})]
+
+    with pytest.raises(ValueError) as excinfo:
+        await weather_service.get_current_weather("Atlantis")
+
+    assert "Weather data error: city not found" in str(excinfo.value)
+    assert stub_api.requests == 1
+    assert weather_service.weather_breaker.stats()["failures"] == 0
+
+@pytest.mark.asyncio
+async def test_weather_breaker_fails_fast_and_serves_stale(weather_service, stub_api):
+    weather_service.cache.set("osaka,jp", WeatherResponse(location="Osaka,jp", temperature=21.0), ttl=-1000)
+    stub_api.script = [(0, 500, {"message": "down"})] * 6
+
+    with pytest.raises(UpstreamTransientError):
+        await weather_service.get_current_weather("Tokyo,jp")
+    stale = await weather_service.get_current_weather("Osaka,jp")
+    assert stale.temperature == 21.0
+    assert weather_service.weather_breaker.state == "open"
+
+    requests_before = stub_api.requests
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await weather_service.get_current_weather("Hanoi,vn")
+    assert excinfo.value.retry_after > 0
+    assert stub_api.requests == requests_before
+
+    assert (await weather_service.get_current_weather("Osaka,jp")).temperature == 21.0
+    stats = weather_service.stats()
+    assert stats["weather_stale_fallbacks"] == 2
+    assert stats["circuit_breakers"]["weather"]["state"] == "open"
+
+@pytest.mark.asyncio
+async def test_weather_deadline_bounds_total_time(stub_api):
+    settings = Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url=str(stub_api.server.make_url("/weather")),
+        weather_api_timeout=1.0,
+        weather_api_deadline=0.1,
+        local_extractor_enabled=False,
+    )
+    service = WeatherService(settings, OpenAIService(settings))
+    stub_api.script = [(0.5, 200, {"main": {"temp": 300.15}})]
+    try:
+        with pytest.raises(UpstreamTransientError) as excinfo:
+            await service.get_current_weather("Osaka,jp")
+        assert "deadline exceeded" in str(excinfo.value)
+    finally:
+        await service.http_client.close()
+
+@pytest.mark.asyncio
+async def test_weather_provider_429_is_503_without_retry(weather_service, stub_api):
+    stub_api.script = [(0, 429, {"message": "quota exceeded"}, {"Retry-After": "7"})]
+
+    with pytest.raises(UpstreamRateLimitedError) as excinfo:
+        await weather_service.get_current_weather("Osaka,jp")
+
+    assert excinfo.value.retry_after == 7.0
+    assert stub_api.requests == 1
+    assert weather_service.weather_breaker.stats()["failures"] == 0
+
+@pytest.mark.asyncio
+async def test_weather_local_rate_limit(stub_api):
+    settings = Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url=str(stub_api.server.make_url("/weather")),
+        weather_rate_limit_per_second=1,
+        weather_rate_limit_burst=1,
+        upstream_rate_limit_max_wait=0.01,
+        local_extractor_enabled=False,
+    )
+    service = WeatherService(settings, OpenAIService(settings))
+    try:
+        await service.get_current_weather("Osaka,jp")
+        with pytest.raises(UpstreamRateLimitedError) as excinfo:
+            await service.get_current_weather("Tokyo,jp")
+        assert excinfo.value.retry_after > 0.9
+        assert stub_api.requests == 1
+        # Cached locations don't spend tokens
+        assert (await service.get_current_weather("Osaka,jp")).temperature == 27.0
+        assert service.stats()["rate_limiters"]["weather"]["denied"] == 1
+    finally:
+        await service.http_client.close()
+
+@pytest.mark.asyncio
+async def test_weather_retries_take_a_token_each(stub_api):
+    settings = Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url=str(stub_api.server.make_url("/weather")),
+        weather_retry_attempts=3,
+        weather_retry_base_delay=0,
+        weather_retry_max_delay=0,
+        weather_rate_limit_per_second=0.01,
+        weather_rate_limit_burst=2,
+        upstream_rate_limit_max_wait=0,
+        local_extractor_enabled=False,
+    )
+    service = WeatherService(settings, OpenAIService(settings))
+    stub_api.script = [(0, 500, {"message": "down"})] * 3
+    try:
+        with pytest.raises(UpstreamTransientError):
+            await service.get_current_weather("Osaka,jp")
+        # Two tokens, two provider calls; the third attempt found the bucket empty
+        assert stub_api.requests == 2
+        assert service.rate_limiter.stats()["denied"] == 1
+        assert service.weather_breaker.stats()["failures"] == 1
+    finally:
+        await service.http_client.close()
+
+@pytest.mark.asyncio
+async def test_open_circuit_does_not_spend_rate_limit_tokens(stub_api):
+    settings = Settings(
+        openai_api_key="test_openai_api_key",
+        weather_api_key="test_weather_api_key",
+        weather_api_url=str(stub_api.server.make_url("/weather")),
+        weather_rate_limit_per_second=1,
+        weather_rate_limit_burst=1,
+        openai_rate_limit_per_second=1,
+        openai_rate_limit_burst=1,
+        upstream_rate_limit_max_wait=0,
+        local_extractor_enabled=False,
+    )
+    llm = OpenAIService(settings)
+    service = WeatherService(settings, llm)
+    try:
+        for breaker in (service.weather_breaker, llm.breaker):
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+
+        for _ in range(3):
+            with pytest.raises(CircuitOpenError):
+                await service.get_current_weather("Osaka,jp")
+            with pytest.raises(CircuitOpenError):
+                await llm.generate_human_readable_response("Osaka", {"temperature": 20})
+
+        assert stub_api.requests == 0
+        for limiter in (service.rate_limiter, llm.rate_limiter):
+            assert limiter.stats()["granted"] == 0
+            assert limiter.stats()["denied"] == 0
+            assert limiter.try_acquire()
+    finally:
+        await service.http_client.close()
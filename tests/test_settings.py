@@ -0,0 +1,66 @@
+import pytest
+from app.config import settings as settings_module
+from app.config.settings import DEFAULT_SETTINGS_PATH, PROJECT_ROOT, Settings, get_settings, load_settings
+
+REQUIRED = {
+    "WEATHER_API_OPENAI_API_KEY": "env-openai",
+    "WEATHER_API_WEATHER_API_KEY": "env-weather",
+    "WEATHER_API_WEATHER_API_URL": "https://fakeurl.com",
+}
+
+def test_default_file_is_found_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = load_settings(environ={})
+    assert DEFAULT_SETTINGS_PATH.is_file()
+    assert settings.server_port == 8000
+
+def test_environment_overrides_file(tmp_path):
+    config = tmp_path / "settings.yaml"
+    config.write_text("openai_api_key: file\nweather_api_key: file\nweather_api_url: https://file\nserver_workers: 2\n")
+    settings = load_settings(environ={
+        "WEATHER_API_SETTINGS": str(config),
+        "WEATHER_API_SERVER_WORKERS": "4",
+        "WEATHER_API_PREFETCH_ENABLED": "false",
+        "WEATHER_API_OPENAI_API_KEY": "12345",
+        "WEATHER_API_LLM_PROVIDERS": '[{"name": "local", "base_url": "http://127.0.0.1:9100/v1"}]',
+    })
+    assert settings.server_workers == 4
+    assert settings.prefetch_enabled is False
+    assert settings.openai_api_key == "12345"
+    assert settings.weather_api_key == "file"
+    assert settings.llm_providers[0].name == "local"
+
+def test_environment_only_without_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings_module, "DEFAULT_SETTINGS_PATH", tmp_path / "missing.yaml")
+    settings = load_settings(environ=REQUIRED)
+    assert settings.openai_api_key == "env-openai"
+
+def test_file_and_environment_only_defaults_agree(tmp_path, monkeypatch):
+    from_file = load_settings(environ=REQUIRED)
+    monkeypatch.setattr(settings_module, "DEFAULT_SETTINGS_PATH", tmp_path / "missing.yaml")
+    from_environment = load_settings(environ=REQUIRED)
+    for name in ("weather_disk_cache_enabled", "llm_cache_disk_enabled", "disk_cache_path"):
+        assert getattr(from_file, name) == getattr(from_environment, name)
+
+def test_disk_cache_path_is_relative_to_project_root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = load_settings(environ={**REQUIRED, "WEATHER_API_DISK_CACHE_PATH": "cache/other.sqlite3"})
+    assert settings.disk_cache_path == str(PROJECT_ROOT / "cache" / "other.sqlite3")
+    absolute = str(tmp_path / "cache.sqlite3")
+    assert load_settings(environ={**REQUIRED, "WEATHER_API_DISK_CACHE_PATH": absolute}).disk_cache_path == absolute
+
+def test_explicit_missing_file_fails(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_settings(environ={"WEATHER_API_SETTINGS": str(tmp_path / "missing.yaml"), **REQUIRED})
+
+def test_lazy_module_attribute(monkeypatch):
+    get_settings.cache_clear()
+    monkeypatch.setenv("WEATHER_API_SERVER_PORT", "8123")
+    try:
+        assert settings_module.settings.server_port == 8123
+        assert settings_module.settings is get_settings()
+        assert isinstance(get_settings(), Settings)
+    finally:
+        get_settings.cache_clear()
+    with pytest.raises(AttributeError):
+        settings_module.missing
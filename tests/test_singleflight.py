@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from app.services.singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "sunny"
+
+    results = await asyncio.gather(*(flight.do("osaka,jp", fetch) for _ in range(50)))
+
+    assert results == ["sunny"] * 50
+    assert calls == 1
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("city not found")
+
+    results = await asyncio.gather(*(flight.do("nowhere", fetch) for _ in range(5)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return 27.0
+
+    cancelled = asyncio.create_task(flight.do("osaka,jp", fetch))
+    waiter = asyncio.create_task(flight.do("osaka,jp", fetch))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    release.set()
+    assert await waiter == 27.0
+
+@pytest.mark.asyncio
+async def test_new_call_after_completion():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await flight.do("a", fetch) == 1
+    assert await flight.do("a", fetch) == 2
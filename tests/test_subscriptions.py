@@ -0,0 +1,189 @@
+import asyncio
+import orjson
+import pytest
+from app.config.settings import Settings
+from app.models.weather import WeatherResponse
+from app.services.errors import CircuitOpenError
+from app.services.subscriptions import SlowConsumerError, SubscriptionHub
+
+def make_settings(**overrides):
+    return Settings(
+        openai_api_key="stub",
+        weather_api_key="stub",
+        weather_api_url="https://fakeurl.com",
+        **{"ws_refresh_interval": 0.01, **overrides},
+    )
+
+class FakeWeatherService:
+    def __init__(self):
+        self.calls = {}
+        self.temperature = 20.0
+        self.unavailable = False
+
+    async def get_current_weather(self, location):
+        self.calls[location] = self.calls.get(location, 0) + 1
+        if location == "Atlantis":
+            raise ValueError("Weather data error: city not found")
+        if self.unavailable:
+            raise CircuitOpenError("Weather provider unavailable (circuit open)", retry_after=5)
+        return WeatherResponse(location=location, temperature=self.temperature, observed_at=1700000000)
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append(orjson.loads(message))
+
+async def run_until(predicate, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+@pytest.mark.asyncio
+async def test_one_refresh_loop_per_location_fans_out():
+    service = FakeWeatherService()
+    hub = SubscriptionHub(service, make_settings(ws_refresh_interval=60))
+    recorders = [Recorder() for _ in range(200)]
+    subscribers = [hub.connect(recorder.send) for recorder in recorders]
+    senders = [asyncio.create_task(subscriber.run(1.0)) for subscriber in subscribers]
+    for subscriber in subscribers:
+        hub.subscribe(subscriber, ["Osaka,jp", " osaka,JP "])
+
+    await run_until(lambda: all(recorder.messages for recorder in recorders))
+
+    assert service.calls == {"Osaka,jp": 1}
+    assert recorders[-1].messages == [{
+        "type": "weather", "location": "osaka,jp",
+        "weather": {"location": "Osaka,jp", "temperature": 20.0}, "observed_at": 1700000000,
+    }]
+    stats = hub.stats()
+    assert stats["locations"] == 1
+    assert stats["subscriptions"] == 200
+    assert stats["published"] == 1
+    assert stats["deliveries"] == 200
+
+    # A late subscriber gets the last value without another upstream read
+    late = Recorder()
+    late_subscriber = hub.connect(late.send)
+    hub.subscribe(late_subscriber, ["Osaka,jp"])
+    assert late_subscriber.pending() == 1
+    assert service.calls == {"Osaka,jp": 1}
+
+    for task in senders:
+        task.cancel()
+    await asyncio.gather(*senders, return_exceptions=True)
+    await hub.close()
+
+@pytest.mark.asyncio
+async def test_publishes_only_changes():
+    service = FakeWeatherService()
+    hub = SubscriptionHub(service, make_settings())
+    recorder = Recorder()
+    subscriber = hub.connect(recorder.send)
+    sender = asyncio.create_task(subscriber.run(1.0))
+    hub.subscribe(subscriber, ["Osaka,jp"])
+
+    await run_until(lambda: service.calls.get("Osaka,jp", 0) >= 3)
+    assert len(recorder.messages) == 1
+    service.temperature = 21.5
+    await run_until(lambda: len(recorder.messages) == 2)
+    assert recorder.messages[1]["weather"]["temperature"] == 21.5
+
+    sender.cancel()
+    await hub.close()
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_latest_value_only():
+    hub = SubscriptionHub(FakeWeatherService(), make_settings())
+    recorder = Recorder()
+    subscriber = hub.connect(recorder.send)
+    for temperature in (20.0, 21.0, 22.0):
+        subscriber.offer("osaka,jp", str(temperature))
+    subscriber.notify('"ack"')
+
+    sender = asyncio.create_task(subscriber.run(1.0))
+    await run_until(lambda: len(recorder.messages) == 2)
+    assert recorder.messages == ["ack", 22.0]
+    assert subscriber.coalesced == 2
+    sender.cancel()
+
+@pytest.mark.asyncio
+async def test_blocked_send_raises_slow_consumer():
+    hub = SubscriptionHub(FakeWeatherService(), make_settings())
+
+    async def blocked(message):
+        await asyncio.sleep(10)
+
+    subscriber = hub.connect(blocked)
+    subscriber.offer("osaka,jp", "{}")
+    with pytest.raises(SlowConsumerError):
+        await subscriber.run(0.01)
+
+@pytest.mark.asyncio
+async def test_cancel_during_send_stops_runner():
+    hub = SubscriptionHub(FakeWeatherService(), make_settings())
+    sending = asyncio.Event()
+
+    async def hanging(message):
+        sending.set()
+        await asyncio.sleep(10)
+
+    subscriber = hub.connect(hanging)
+    subscriber.offer("osaka,jp", "{}")
+    runner = asyncio.create_task(subscriber.run(5.0))
+    await sending.wait()
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    assert runner.cancelled()
+
+@pytest.mark.asyncio
+async def test_last_unsubscribe_stops_refresh():
+    service = FakeWeatherService()
+    hub = SubscriptionHub(service, make_settings())
+    first, second = hub.connect(Recorder().send), hub.connect(Recorder().send)
+    hub.subscribe(first, ["Osaka,jp"])
+    hub.subscribe(second, ["Osaka,jp"])
+    task = hub.topics["osaka,jp"].task
+
+    assert hub.unsubscribe(first, ["OSAKA,jp"]) == ["osaka,jp"]
+    assert "osaka,jp" in hub.topics
+    hub.disconnect(second)
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert task.cancelled()
+    assert hub.topics == {}
+    assert hub.stats()["connections"] == 1
+
+@pytest.mark.asyncio
+async def test_unknown_location_and_outages_are_reported():
+    service = FakeWeatherService()
+    hub = SubscriptionHub(service, make_settings())
+    recorder = Recorder()
+    subscriber = hub.connect(recorder.send)
+    sender = asyncio.create_task(subscriber.run(1.0))
+
+    hub.subscribe(subscriber, ["Atlantis"])
+    await run_until(lambda: recorder.messages)
+    assert recorder.messages[0] == {"type": "error", "location": "atlantis", "detail": "Weather data error: city not found"}
+    assert hub.topics == {}
+    assert subscriber.locations == set()
+
+    service.unavailable = True
+    hub.subscribe(subscriber, ["Osaka,jp"])
+    await run_until(lambda: len(recorder.messages) == 2)
+    assert recorder.messages[1]["type"] == "error"
+    assert "osaka,jp" in hub.topics
+
+    sender.cancel()
+    await hub.close()
+
+@pytest.mark.asyncio
+async def test_location_cap_per_connection():
+    hub = SubscriptionHub(FakeWeatherService(), make_settings(ws_max_locations=2))
+    subscriber = hub.connect(Recorder().send)
+    with pytest.raises(ValueError):
+        hub.subscribe(subscriber, ["Osaka,jp", "Tokyo,jp", "Hanoi,vn"])
+    assert subscriber.locations == {"osaka,jp", "tokyo,jp"}
+    await hub.close()
@@ -1,22 +1,66 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+import orjson
 import pytest
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocketDisconnect
 from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
 from app.api.v1.weather import weather_router
+from app.config.settings import Settings
+from app.models.weather import WeatherResponse
+from app.services.errors import CircuitOpenError, OverloadedError
+from app.services.openai_service import OpenAIService
+from app.services.subscriptions import SubscriptionHub
 from app.services.weather_service import WeatherService
 
 # Mock WeatherService for testing
 class MockWeatherService:
+    def __init__(self):
+        settings = Settings(openai_api_key="stub", weather_api_key="stub", weather_api_url="https://fakeurl.com", ws_max_connections=1)
+        self.subscriptions = SubscriptionHub(self, settings)
+
     async def get_current_weather(self, location: str):
         if location == "invalid":
             raise ValueError("Invalid location")
-        return {"location": location, "temperature": 20.0}
-    
-    async def chat_weather(self, messages):
+        if location == "unavailable":
+            raise CircuitOpenError("Weather provider unavailable (circuit open)", retry_after=12.5)
+        return WeatherResponse(location=location, temperature=20.0, observed_at=1700000000)
+
+    def cache_max_age(self, location: str):
+        return 120
+
+    async def get_current_weather_batch(self, locations):
+        if len(locations) > 3:
+            raise ValueError("Too many locations")
+        results = []
+        for location in dict.fromkeys(locations):
+            if location == "invalid":
+                results.append({"location": location, "weather": None, "error": "Invalid location"})
+            else:
+                results.append({"location": location, "weather": {"location": location, "temperature": 20.0}, "error": None})
+        return results
+
+    async def chat_weather(self, messages, response_mode=None, use_cache=True):
         if not messages:
             raise ValueError("Invalid request")
+        if messages[0]["content"] == "busy":
+            raise OverloadedError("Server busy, queue full", retry_after=2.5)
+        if response_mode == "template":
+            return "The current temperature is 20.0°C."
         return "The weather is sunny"
 
+    async def chat_weather_stream(self, messages, response_mode=None, use_cache=True):
+        if not messages:
+            raise ValueError("Invalid request")
+
+        async def tokens():
+            yield "The weather "
+            yield "is sunny"
+        return tokens()
+
+    def stats(self):
+        return {"weather_cache": {"hits": 1, "misses": 2}}
+
 @pytest.fixture
 def app() -> FastAPI:
     app = FastAPI()
@@ -50,11 +94,76 @@ def test_read_weather(client: TestClient):
     assert response.status_code == 200
     assert response.json() == {"location": "Tokyo", "temperature": 20.0}
 
+def test_read_weather_validators(client: TestClient):
+    response = client.get("/api/v1/weather?location=Tokyo")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "public, max-age=120"
+    assert response.headers["last-modified"] == "Tue, 14 Nov 2023 22:13:20 GMT"
+
+    revalidated = client.get("/api/v1/weather?location=Tokyo", headers={"If-None-Match": f'W/{etag}, "other"'})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.headers["cache-control"] == "public, max-age=120"
+
+    changed = client.get("/api/v1/weather?location=Osaka", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+def test_read_weather_if_modified_since(client: TestClient):
+    unchanged = client.get("/api/v1/weather?location=Tokyo", headers={"If-Modified-Since": "Tue, 14 Nov 2023 22:13:20 GMT"})
+    assert unchanged.status_code == 304
+    older = client.get("/api/v1/weather?location=Tokyo", headers={"If-Modified-Since": "Tue, 14 Nov 2023 22:00:00 GMT"})
+    assert older.status_code == 200
+    assert older.json() == {"location": "Tokyo", "temperature": 20.0}
+
+def test_weather_websocket(client: TestClient):
+    with client.websocket_connect("/api/v1/weather/ws") as websocket:
+        websocket.send_text('{"action": "subscribe", "locations": ["Tokyo", "tokyo "]}')
+        assert websocket.receive_json() == {"type": "subscribed", "locations": ["tokyo"]}
+        assert websocket.receive_json() == {
+            "type": "weather", "location": "tokyo",
+            "weather": {"location": "Tokyo", "temperature": 20.0}, "observed_at": 1700000000,
+        }
+
+        websocket.send_text('{"action": "watch"}')
+        assert websocket.receive_json()["type"] == "error"
+
+        # The hub allows one connection in this fixture
+        with client.websocket_connect("/api/v1/weather/ws") as second:
+            with pytest.raises(WebSocketDisconnect) as excinfo:
+                second.receive_json()
+            assert excinfo.value.code == 1013
+
+        websocket.send_text('{"action": "unsubscribe", "locations": ["TOKYO"]}')
+        assert websocket.receive_json() == {"type": "unsubscribed", "locations": ["tokyo"]}
+
 def test_read_weather_invalid_location(client: TestClient):
     response = client.get("/api/v1/weather?location=invalid")
     assert response.status_code == 400
     assert response.json() == {"detail": "Invalid location"}
 
+def test_read_weather_circuit_open(client: TestClient):
+    response = client.get("/api/v1/weather?location=unavailable")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+    assert response.json() == {"detail": "Weather provider unavailable (circuit open)"}
+
+def test_read_weather_batch(client: TestClient):
+    response = client.post("/api/v1/weather/batch", json={"locations": ["Tokyo", "invalid", "Tokyo"]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "results": [
+            {"location": "Tokyo", "weather": {"location": "Tokyo", "temperature": 20.0}, "error": None},
+            {"location": "invalid", "weather": None, "error": "Invalid location"},
+        ]
+    }
+
+def test_read_weather_batch_too_many(client: TestClient):
+    response = client.post("/api/v1/weather/batch", json={"locations": ["a", "b", "c", "d"]})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Too many locations"}
+
 @pytest.mark.asyncio
 async def test_chat_weather(async_client):
     response = await async_client.post("/api/v1/chat_weather", json={
@@ -65,6 +174,34 @@ async def test_chat_weather(async_client):
     assert response.status_code == 200
     assert response.json() == "The weather is sunny"
 
+@pytest.mark.asyncio
+async def test_chat_weather_shed_under_load(async_client):
+    response = await async_client.post("/api/v1/chat_weather", json={"messages": [{"role": "user", "content": "busy"}]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json() == {"detail": "Server busy, queue full"}
+
+@pytest.mark.asyncio
+async def test_chat_weather_template_mode(async_client):
+    response = await async_client.post("/api/v1/chat_weather", json={
+        "messages": [
+            {"role": "user", "content": "What's the weather like?"}
+        ],
+        "response_mode": "template",
+    })
+    assert response.status_code == 200
+    assert response.json() == "The current temperature is 20.0°C."
+
+@pytest.mark.asyncio
+async def test_chat_weather_unknown_mode(async_client):
+    response = await async_client.post("/api/v1/chat_weather", json={
+        "messages": [
+            {"role": "user", "content": "What's the weather like?"}
+        ],
+        "response_mode": "poetry",
+    })
+    assert response.status_code == 422
+
 @pytest.mark.asyncio
 async def test_chat_weather_invalid(async_client):
     response = await async_client.post("/api/v1/chat_weather", json={
@@ -72,3 +209,102 @@ async def test_chat_weather_invalid(async_client):
     })
     assert response.status_code == 400
     assert "Invalid request" in response.json()["detail"]
+
+def test_read_stats(client: TestClient):
+    response = client.get("/api/v1/stats")
+    assert response.status_code == 200
+    assert response.json() == {"weather_cache": {"hits": 1, "misses": 2}}
+
+@pytest.mark.asyncio
+async def test_chat_weather_stream(async_client):
+    response = await async_client.post("/api/v1/chat_weather", json={
+        "messages": [
+            {"role": "user", "content": "What's the weather like?"}
+        ],
+        "stream": True,
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == 'data: "The weather "\n\ndata: "is sunny"\n\ndata: [DONE]\n\n'
+
+@pytest.mark.asyncio
+async def test_chat_weather_stream_invalid(async_client):
+    response = await async_client.post("/api/v1/chat_weather", json={
+        "messages": [],
+        "stream": True,
+    })
+    assert response.status_code == 400
+    assert "Invalid request" in response.json()["detail"]
+
+def test_http_exception_handler_uses_orjson():
+    from fastapi.responses import ORJSONResponse
+    from starlette.exceptions import HTTPException as StarletteHTTPException
+    from app.api.responses import http_exception_handler
+
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_exception_handler(StarletteHTTPException, http_exception_handler)
+    app.include_router(weather_router(MockWeatherService()), prefix="/api/v1")
+    client = TestClient(app)
+
+    response = client.get("/api/v1/weather?location=unavailable")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+    assert response.content == b'{"detail":"Weather provider unavailable (circuit open)"}'
+
+    response = client.get("/api/v1/missing")
+    assert response.status_code == 404
+    assert response.content == b'{"detail":"Not Found"}'
+
+def test_create_app_builds_services_in_lifespan():
+    from main import create_app
+    settings = Settings(openai_api_key="stub", weather_api_key="stub", weather_api_url="https://fakeurl.com",
+                        prefetch_enabled=False, local_extractor_enabled=False)
+    app = create_app(settings)
+    assert not hasattr(app.state, "weather_service")
+
+    with TestClient(app) as client:
+        assert isinstance(app.state.weather_service, WeatherService)
+        assert app.state.weather_service.settings is settings
+        response = client.get("/api/v1/stats")
+        assert response.status_code == 200
+        assert response.json()["weather_cache"]["hits"] == 0
+
+@pytest.mark.asyncio
+async def test_chat_stream_released_when_client_leaves_before_first_chunk():
+    settings = Settings(openai_api_key="stub", weather_api_key="stub", weather_api_url="https://fakeurl.com",
+                        local_extractor_enabled=False, prefetch_enabled=False, chat_max_concurrency=2, chat_max_queue=0)
+    service = WeatherService(settings, OpenAIService(settings))
+    app = FastAPI()
+    app.include_router(weather_router(service), prefix="/api/v1")
+    body = orjson.dumps({"messages": [{"role": "user", "content": "Weather in Osaka?"}], "stream": True, "response_mode": "template"})
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": "/api/v1/chat_weather", "raw_path": b"/api/v1/chat_weather", "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json")], "client": ("test", 1), "server": ("test", 80)}
+
+    async def disconnect_before_first_chunk():
+        started = asyncio.Event()
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            # Stuck on flow control until the client goes away
+            started.set()
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(app(scope, receive, send))
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    with patch.object(service.llm_service, "get_weather_info", AsyncMock(return_value={"location": "Osaka,jp"})):
+        with patch.object(service, "get_current_weather", AsyncMock(return_value=WeatherResponse(location="Osaka,jp", temperature=20.0))):
+            for _ in range(3):
+                await disconnect_before_first_chunk()
+            assert service.stats()["chat_admission"]["active"] == 0
+            assert service.active_chats == 0
+            assert await service.chat_weather([{"role": "user", "content": "Weather in Osaka?"}], response_mode="template")
+    await service.close()
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import aiohttp
 from unittest.mock import AsyncMock, patch
@@ -11,7 +12,8 @@ def settings():
     return Settings(
         openai_api_key="test_openai_api_key",
         weather_api_key="test_weather_api_key",
-        weather_api_url="http://api.openweathermap.org/data/2.5/weather"
+        weather_api_url="http://api.openweathermap.org/data/2.5/weather",
+        local_extractor_enabled=False,
     )
 
 @pytest.fixture
@@ -19,8 +21,10 @@ def openai_service(settings):
     return OpenAIService(settings)
 
 @pytest.fixture
-def weather_service(settings, openai_service):
-    return WeatherService(settings, openai_service)
+async def weather_service(settings, openai_service):
+    service = WeatherService(settings, openai_service)
+    yield service
+    await service.http_client.close()
 
 @pytest.mark.asyncio
 async def test_get_current_weather(weather_service, settings):
@@ -38,6 +42,19 @@ async def test_get_current_weather(weather_service, settings):
         assert response.location == location
         assert response.temperature == 27.0
 
+@pytest.mark.asyncio
+async def test_observation_time_and_max_age(weather_service, settings):
+    with patch("aiohttp.ClientSession.get") as mock_get:
+        mock_get.return_value.__aenter__.return_value.json = AsyncMock(return_value={"main": {"temp": 300.15}, "dt": 1700000000})
+        mock_get.return_value.__aenter__.return_value.status = 200
+
+        assert weather_service.cache_max_age("Osaka,jp") == 0
+        response = await weather_service.get_current_weather("Osaka,jp")
+
+    assert response.observed_at == 1700000000
+    assert "observed_at" not in response.model_dump()
+    assert 0 < weather_service.cache_max_age("osaka,JP") <= settings.weather_cache_ttl
+
 @pytest.mark.asyncio
 async def test_get_current_weather_http_error(weather_service):
     location = "InvalidCity"
@@ -86,7 +103,7 @@ async def test_chat_weather(weather_service):
                             "required": ["location"],
                         }
                     }
-                }])
+                }], use_cache=True)
                 mock_get_current_weather.assert_called_once_with(location)
                 mock_generate_human_readable_response.assert_called_once_with(location, weather_data.model_dump())
 
@@ -98,3 +115,314 @@ async def test_chat_weather_llm_error(weather_service):
         with pytest.raises(ValueError) as excinfo:
             await weather_service.chat_weather(messages)
         assert "LLM or weather service error: LLM Error" in str(excinfo.value)
+
+@pytest.mark.asyncio
+async def test_get_current_weather_cached_by_normalized_location(weather_service):
+    with patch("aiohttp.ClientSession.get") as mock_get:
+        mock_get.return_value.__aenter__.return_value.json = AsyncMock(return_value={"main": {"temp": 300.15}})
+        mock_get.return_value.__aenter__.return_value.status = 200
+
+        first = await weather_service.get_current_weather("Osaka,jp")
+        second = await weather_service.get_current_weather("  osaka , JP")
+
+        assert mock_get.call_count == 1
+        assert second.temperature == first.temperature
+        assert first.location == "Osaka,jp"
+        assert second.location == "  osaka , JP"
+        stats = weather_service.stats()["weather_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_get_current_weather_stale_while_revalidate(weather_service):
+    location = "Osaka,jp"
+    stale = WeatherResponse(location=location, temperature=20.0)
+    fresh = WeatherResponse(location=location, temperature=27.0)
+    weather_service.cache.set("osaka,jp", stale, ttl=-1)
+
+    with patch.object(weather_service, "_fetch_current_weather", AsyncMock(return_value=fresh)) as mock_fetch:
+        response = await weather_service.get_current_weather(location)
+        assert response == stale
+
+        await asyncio.gather(*weather_service._refresh_tasks.values())
+        mock_fetch.assert_called_once_with(location)
+        assert weather_service.cache.get("osaka,jp") == fresh
+
+@pytest.mark.asyncio
+async def test_get_current_weather_coalesces_concurrent_requests(weather_service):
+    upstream_calls = 0
+
+    async def slow_upstream(location):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.05)
+        return WeatherResponse(location=location, temperature=27.0)
+
+    with patch.object(weather_service, "_fetch_current_weather", side_effect=slow_upstream):
+        responses = await asyncio.gather(*(weather_service.get_current_weather("Osaka,jp") for _ in range(100)))
+
+    assert upstream_calls == 1
+    assert all(response.temperature == 27.0 for response in responses)
+
+@pytest.mark.asyncio
+async def test_get_current_weather_coalesced_error_reaches_all_callers(weather_service):
+    upstream_calls = 0
+
+    async def failing_upstream(location):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("Weather data error: city not found")
+
+    with patch.object(weather_service, "_fetch_current_weather", side_effect=failing_upstream):
+        results = await asyncio.gather(*(weather_service.get_current_weather("Nowhere") for _ in range(10)), return_exceptions=True)
+
+    assert upstream_calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.asyncio
+async def test_get_current_weather_batch_deduplicates_and_isolates_errors(weather_service):
+    fetched = []
+
+    async def upstream(location):
+        fetched.append(location)
+        if location == "Atlantis":
+            raise ValueError("Weather data error: city not found")
+        return WeatherResponse(location=location, temperature=27.0)
+
+    with patch.object(weather_service, "_fetch_current_weather", side_effect=upstream):
+        results = await weather_service.get_current_weather_batch(["Osaka,jp", "osaka, JP", "Atlantis", "Tokyo,jp"])
+
+    assert sorted(fetched) == ["Atlantis", "Osaka,jp", "Tokyo,jp"]
+    assert [result.location for result in results] == ["Osaka,jp", "Atlantis", "Tokyo,jp"]
+    assert results[0].weather.temperature == 27.0
+    assert results[1].weather is None
+    assert "city not found" in results[1].error
+
+@pytest.mark.asyncio
+async def test_get_current_weather_batch_bounded_concurrency(settings, openai_service):
+    settings.weather_batch_concurrency = 3
+    weather_service = WeatherService(settings, openai_service)
+    active = 0
+    peak = 0
+
+    async def upstream(location):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return WeatherResponse(location=location, temperature=20.0)
+
+    with patch.object(weather_service, "_fetch_current_weather", side_effect=upstream):
+        results = await weather_service.get_current_weather_batch([f"City{i}" for i in range(20)])
+
+    assert len(results) == 20
+    assert peak == 3
+
+@pytest.mark.asyncio
+async def test_get_current_weather_batch_too_many_locations(settings, openai_service):
+    settings.weather_batch_max_locations = 2
+    weather_service = WeatherService(settings, openai_service)
+    with pytest.raises(ValueError) as excinfo:
+        await weather_service.get_current_weather_batch(["a", "b", "c"])
+    assert "Too many locations" in str(excinfo.value)
+
+@pytest.mark.asyncio
+async def test_chat_weather_stream(weather_service):
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    location = "Osaka,jp"
+    weather_data = WeatherResponse(location=location, temperature=27.0)
+
+    async def tokens(location, weather_data):
+        yield "It is "
+        yield "27°C."
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": location}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            with patch.object(weather_service.llm_service, 'stream_human_readable_response', side_effect=tokens) as mock_stream:
+                stream = await weather_service.chat_weather_stream(messages)
+                assert [token async for token in stream] == ["It is ", "27°C."]
+                mock_stream.assert_called_once_with(location, weather_data.model_dump())
+
+@pytest.mark.asyncio
+async def test_chat_weather_stream_error_before_streaming(weather_service):
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', side_effect=ValueError("LLM Error")):
+        with pytest.raises(ValueError) as excinfo:
+            await weather_service.chat_weather_stream(messages)
+        assert "LLM or weather service error: LLM Error" in str(excinfo.value)
+
+@pytest.mark.asyncio
+async def test_chat_weather_template_mode_skips_phrasing_llm(weather_service):
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    location = "Osaka,jp"
+    weather_data = WeatherResponse(location=location, temperature=27.0)
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": location}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            with patch.object(weather_service.llm_service, 'generate_human_readable_response') as mock_generate:
+                response = await weather_service.chat_weather(messages, response_mode="template")
+
+                assert response == "The current temperature in Osaka,jp is 27.0°C."
+                mock_generate.assert_not_called()
+
+    stats = weather_service.stats()["chat_modes"]
+    assert stats["template"]["requests"] == 1
+    assert stats["llm"]["requests"] == 0
+
+@pytest.mark.asyncio
+async def test_chat_weather_default_mode_from_settings(settings, openai_service):
+    settings.chat_response_mode = "template"
+    weather_service = WeatherService(settings, openai_service)
+    weather_data = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": "Osaka,jp"}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            response = await weather_service.chat_weather([{"role": "user", "content": "Osaka?"}])
+            assert response == "The current temperature in Osaka,jp is 27.0°C."
+
+            stream = await weather_service.chat_weather_stream([{"role": "user", "content": "Osaka?"}])
+            assert [token async for token in stream] == ["The current temperature in Osaka,jp is 27.0°C."]
+
+@pytest.mark.asyncio
+async def test_chat_weather_stream_records_mode_stats(weather_service):
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    weather_data = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    async def failing(location, weather_data):
+        yield "It is "
+        raise ValueError("phrasing failed")
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": "Osaka,jp"}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            stream = await weather_service.chat_weather_stream(messages, response_mode="template")
+            assert [token async for token in stream]
+            # Closed by the client before the end: served, not failed
+            abandoned = await weather_service.chat_weather_stream(messages, response_mode="template")
+            await abandoned.aclose()
+            with patch.object(weather_service.llm_service, 'stream_human_readable_response', side_effect=failing):
+                stream = await weather_service.chat_weather_stream(messages, response_mode="llm")
+                with pytest.raises(ValueError):
+                    [token async for token in stream]
+
+    stats = weather_service.stats()["chat_modes"]
+    assert stats["template"]["requests"] == 2
+    assert stats["template"]["errors"] == 0
+    assert stats["llm"]["requests"] == 0
+    assert stats["llm"]["errors"] == 1
+
+@pytest.mark.asyncio
+async def test_chat_mode_stats_estimate_token_savings(weather_service):
+    weather_service.llm_service.token_usage = {"phrasing": {"calls": 2, "prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160}}
+    weather_service.chat_stats.record("llm", 1.0, True)
+    weather_service.chat_stats.record("llm", 2.0, True)
+    weather_service.chat_stats.record("template", 0.1, True)
+    weather_service.chat_stats.record("template", 0.0, False)
+
+    stats = weather_service.stats()["chat_modes"]
+    assert stats["llm"]["avg_latency_seconds"] == pytest.approx(1.5)
+    assert stats["llm"]["phrasing_tokens_per_request"] == 80
+    assert stats["template"]["estimated_tokens_saved"] == 80
+    assert stats["template"]["errors"] == 1
+
+@pytest.mark.asyncio
+async def test_chat_weather_local_extraction_skips_llm(settings, openai_service):
+    settings.local_extractor_enabled = True
+    weather_service = WeatherService(settings, openai_service)
+    weather_data = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    with patch.object(weather_service.llm_service, 'get_weather_info') as mock_get_weather_info:
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data) as mock_get_current_weather:
+            response = await weather_service.chat_weather([{"role": "user", "content": "What's the weather in Osaka?"}], response_mode="template")
+
+    assert response == "The current temperature in Osaka,jp is 27.0°C."
+    mock_get_weather_info.assert_not_called()
+    mock_get_current_weather.assert_called_once_with("Osaka,jp")
+    assert weather_service.stats()["location_extraction"] == {"local": 1, "llm": 0}
+
+@pytest.mark.asyncio
+async def test_chat_weather_low_confidence_falls_back_to_llm(settings, openai_service):
+    settings.local_extractor_enabled = True
+    weather_service = WeatherService(settings, openai_service)
+    weather_data = WeatherResponse(location="Tokyo,jp", temperature=20.0)
+    messages = [{"role": "user", "content": "Is the weather warmer in Tokyo or Osaka?"}]
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": "Tokyo,jp"}) as mock_get_weather_info:
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            await weather_service.chat_weather(messages, response_mode="template")
+
+    mock_get_weather_info.assert_called_once()
+    assert weather_service.stats()["location_extraction"] == {"local": 0, "llm": 1}
+
+@pytest.mark.asyncio
+async def test_shared_cache_serves_other_workers(settings, openai_service):
+    from app.services.cache import MemoryCacheBackend
+    shared = MemoryCacheBackend(max_size=10, ttl=60)
+    # Two services sharing one backend stand in for two worker processes sharing Redis
+    worker_a = WeatherService(settings, openai_service, shared_cache=shared)
+    worker_b = WeatherService(settings, openai_service, shared_cache=shared)
+    fresh = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    with patch.object(WeatherService, "_fetch_current_weather", AsyncMock(return_value=fresh)) as mock_fetch:
+        assert await worker_a.get_current_weather("Osaka,jp") == fresh
+        assert await worker_b.get_current_weather("osaka,jp") == fresh.model_copy(update={"location": "osaka,jp"})
+
+    assert mock_fetch.call_count == 1
+    assert worker_b.stats()["weather_shared_cache"]["hits"] == 1
+    assert worker_b.cache.get("osaka,jp") == fresh
+
+@pytest.mark.asyncio
+async def test_disk_cache_survives_restart(settings, openai_service, tmp_path):
+    settings = settings.model_copy(update={"weather_disk_cache_enabled": True, "disk_cache_path": str(tmp_path / "cache.sqlite3")})
+    fresh = WeatherResponse(location="Osaka,jp", temperature=27.0, observed_at=1700000000)
+
+    with patch.object(WeatherService, "_fetch_current_weather", AsyncMock(return_value=fresh)) as mock_fetch:
+        before = WeatherService(settings, openai_service)
+        await before.get_current_weather("Osaka,jp")
+        await before.close()
+
+        # A new process: empty memory tier, same file
+        after = WeatherService(settings, openai_service)
+        weather = await after.get_current_weather("osaka,jp")
+        await after.close()
+
+    assert mock_fetch.call_count == 1
+    assert weather.temperature == 27.0
+    assert weather.observed_at == 1700000000
+    assert after.stats()["weather_shared_cache"]["backend"] == "sqlite"
+    assert after.stats()["weather_shared_cache"]["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_open_stream_counts_as_active_chat(weather_service):
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    weather_data = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": "Osaka,jp"}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            stream = await weather_service.chat_weather_stream(messages, response_mode="template")
+            assert weather_service.active_chats == 1
+            assert [token async for token in stream] == ["The current temperature in Osaka,jp is 27.0°C."]
+            assert weather_service.active_chats == 0
+
+@pytest.mark.asyncio
+async def test_chat_admission_sheds_when_full(settings, openai_service):
+    from app.services.errors import OverloadedError
+    settings.chat_max_concurrency = 1
+    settings.chat_max_queue = 0
+    weather_service = WeatherService(settings, openai_service)
+    messages = [{"role": "user", "content": "What's the weather in Osaka?"}]
+    weather_data = WeatherResponse(location="Osaka,jp", temperature=27.0)
+
+    with patch.object(weather_service.llm_service, 'get_weather_info', return_value={"location": "Osaka,jp"}):
+        with patch.object(weather_service, 'get_current_weather', return_value=weather_data):
+            stream = await weather_service.chat_weather_stream(messages, response_mode="template")
+            with pytest.raises(OverloadedError):
+                await weather_service.chat_weather(messages, response_mode="template")
+            assert [token async for token in stream]
+            assert await weather_service.chat_weather(messages, response_mode="template")
+
+    stats = weather_service.stats()["chat_admission"]
+    assert stats["shed_queue_full"] == 1
+    assert stats["active"] == 0